@@ -0,0 +1,561 @@
+"""
+Offline benchmarks for the transformer, the mining pipeline stages, the
+Met-aromatic pair search and the loaders of the analysis scripts. Nothing is fetched or parsed: the mining
+stages run over structure cache entries stored as fixtures. To record the
+fixtures for the codes in tests/test_100_random_pdb_codes.csv, warm a structure
+cache with these codes using the mining script's --warm-cache option, then:
+
+    $ python3 run_benchmarks.py record --cache-dir ../data/structure_cache
+
+If no fixtures are recorded, fixtures in the same format are synthesized from
+the bridges in data/n_3_bridge_transformations.json. Then run the suite and
+compare the results against a baseline, which exits non-zero on regressions:
+
+    $ python3 run_benchmarks.py run --output baseline.json
+    $ python3 run_benchmarks.py run --output results.json
+    $ python3 run_benchmarks.py compare baseline.json results.json
+"""
+
+import sys
+import logging
+import platform
+from argparse import ArgumentParser
+from datetime import datetime
+from importlib import util
+from json import dump, load
+from os import path, makedirs
+from shutil import copyfile
+from statistics import mean, median, stdev
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+import numpy
+from numpy import array
+from numpy.random import default_rng
+from scipy.spatial.transform import Rotation
+
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data'))
+from columnar import METADATA_KEYS, split_residue  # pylint: disable=C0413
+from pair_kernel import get_pairs  # pylint: disable=C0413
+from pdb_parser import ATOM_DTYPE  # pylint: disable=C0413
+from reader import iter_documents  # pylint: disable=C0413
+from structure_cache import StructureCache, TRANSPORT_KEYS  # pylint: disable=C0413
+from transformer import Transformer, CHECK_SAMPLED  # pylint: disable=C0413
+
+ROOT = path.dirname(path.abspath(__file__))
+PROJECT_ROOT = path.dirname(ROOT)
+DEFAULT_FIXTURES_DIR = path.join(ROOT, 'fixtures')
+DEFAULT_CODES_CSV = path.join(PROJECT_ROOT, 'tests', 'test_100_random_pdb_codes.csv')
+DEFAULT_RESULTS = path.join(ROOT, 'results.json')
+TRANSFORMATIONS_JSON = path.join(PROJECT_ROOT, 'data', 'n_3_bridge_transformations.json')
+ANALYSIS_SCRIPTS = {
+    'convex': path.join(PROJECT_ROOT, 'convex_hulls', 'get_convex_hulls.py'),
+    'groupby': path.join(PROJECT_ROOT, 'convex_hulls_groupby', 'get_convex_hulls_groupby.py'),
+    'distribution': path.join(PROJECT_ROOT, 'distributions', 'get_3_bridge_distribution.py')
+}
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_SEED = 0
+EXIT_FAILURE = 1
+RESULTS_VERSION = 1
+FIXTURES_RECORDED = 'recorded'
+FIXTURES_SYNTHESIZED = 'synthesized'
+MINING_STAGES = (
+    'load_structure', 'graph_extraction', 'index_coordinate_data', 'cluster_bridge_data',
+    'isolate_relevant_coordinates', 'isolate_tetrahedrons', 'transform_tetrahedrons'
+)
+
+# Atoms of each residue in the order MetAromatic exposes them. Only a few are relevant to the mapping
+RESIDUE_ATOMS = {
+    'MET': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'SD', 'CE'),
+    'PHE': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'CE1', 'CE2', 'CZ'),
+    'TYR': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'CE1', 'CE2', 'CZ', 'OH'),
+    'TRP': ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'NE1', 'CE2', 'CE3', 'CZ2', 'CZ3', 'CH2')
+}
+RING_ATOMS = {'PHE': ('CG', 'CZ'), 'TYR': ('CG', 'CZ'), 'TRP': ('CD2', 'CH2')}
+MET_ATOMS = ('CG', 'SD', 'CE')
+RING_HALF_WIDTH = 1.4
+
+# A large synthetic structure for the pair search, with residues spread through a box of this width
+PAIR_KERNEL_METHIONINES = 200
+PAIR_KERNEL_AROMATICS = 600
+PAIR_KERNEL_BOX_WIDTH = 80.0
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s:%(name)s %(message)s'
+)
+
+
+def read_codes(filepath: str) -> List[str]:
+    with open(filepath) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def import_script(name: str, filepath: str):
+    """ Import an analysis script by path since the script directories are not packages """
+
+    spec = util.spec_from_file_location(name, filepath)
+    module = util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_summary(timings: List[float], items: int) -> dict:
+    return {
+        'min': min(timings),
+        'median': median(timings),
+        'mean': mean(timings),
+        'stdev': stdev(timings) if len(timings) > 1 else 0.0,
+        'repeat': len(timings),
+        'items': items
+    }
+
+
+def time_case(function: Callable, repeat: int, setup: Optional[Callable] = None) -> List[float]:
+    """ Time repeat calls of function. The return value of setup, if any, is passed to function untimed """
+
+    timings = []
+
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = perf_counter()
+        function(argument)
+        timings.append(perf_counter() - start)
+
+    return timings
+
+
+def get_rows(residue: str, position: str, chain: str, atoms: Dict[str, array], serial: int) -> List[list]:
+    """ Format rows like the MetAromatic transport rows, i.e. ATOM 1 CG MET A 95 x y z 1.00 0.00 C """
+
+    rows = []
+
+    for u, atom in enumerate(RESIDUE_ATOMS[residue]):
+        x, y, z = atoms[atom]
+        rows.append([
+            'ATOM', str(serial + u), atom, residue, chain, position,
+            '{:.3f}'.format(x), '{:.3f}'.format(y), '{:.3f}'.format(z), '1.00', '0.00', atom[0]
+        ])
+
+    return rows
+
+
+def synthesize_entry(documents: List[dict], chain: str, rng) -> dict:
+    """
+    Rebuild a structure cache entry from the mapped bridges of one code. Every
+    bridge is moved back out of the methionine frame by a random rigid motion and
+    padded with the remaining atoms of its residues, so the mining stages see
+    inputs of the same shape and size as the parsed structure
+    """
+
+    rotation = Rotation.random(random_state=rng.integers(2 ** 32))
+    translation = rng.uniform(-50.0, 50.0, size=3)
+    transport = {key: [] for key in TRANSPORT_KEYS}
+    results = []
+    seen = set()
+
+    for document in documents:
+        residues = {key: value for key, value in document.items() if key not in METADATA_KEYS}
+        methionines = [key for key in residues if key.startswith('MET')]
+
+        for residue, coordinates in residues.items():
+            if residue in seen:
+                continue
+
+            seen.add(residue)
+            name, position, _ = split_residue(residue)
+            coordinates = array(coordinates, dtype=float)
+
+            if name == 'MET':
+                atoms = dict(zip(MET_ATOMS, coordinates))
+                center = coordinates[0]
+            else:
+                offset = rng.normal(size=3)
+                offset *= RING_HALF_WIDTH / numpy.linalg.norm(offset)
+                atoms = dict(zip(RING_ATOMS[name], (coordinates - offset, coordinates + offset)))
+                center = coordinates
+
+            for atom in RESIDUE_ATOMS[name]:
+                if atom not in atoms:
+                    atoms[atom] = center + rng.normal(scale=1.5, size=3)
+
+            atoms = {atom: rotation.apply(xyz) + translation for atom, xyz in atoms.items()}
+            key = '{}_coordinates'.format(name.lower())
+            transport[key].extend(get_rows(name, str(position), chain, atoms, sum(map(len, transport.values())) + 1))
+
+        for residue, coordinates in residues.items():
+            name, position, _ = split_residue(residue)
+
+            if name == 'MET':
+                continue
+
+            for methionine in methionines:
+                _, met_position, _ = split_residue(methionine)
+                results.append({
+                    'aromatic_residue': name,
+                    'aromatic_position': int(position),
+                    'methionine_position': int(met_position),
+                    'norm': float(numpy.linalg.norm(coordinates)),
+                    'met_theta_angle': float(rng.uniform(0.0, 180.0)),
+                    'met_phi_angle': float(rng.uniform(0.0, 180.0))
+                })
+
+    return {'exit_code': 0, 'results': results, 'transport': transport}
+
+
+def synthesize_atoms(num_methionines: int, num_aromatics: int, width: float, rng) -> array:
+    """ Parsed records of residues placed at random, with their atoms scattered around each residue center """
+
+    residues = ['MET'] * num_methionines + [('PHE', 'TYR', 'TRP')[i % 3] for i in range(num_aromatics)]
+    rows = []
+
+    for position, residue in enumerate(residues, 1):
+        center = rng.uniform(0.0, width, size=3)
+
+        for serial, atom in enumerate(RESIDUE_ATOMS[residue], len(rows) + 1):
+            rows.append((
+                str(serial).encode(), atom.encode(), b'', residue.encode(), b'A', position, b'',
+                center + rng.normal(0.0, RING_HALF_WIDTH, size=3), 1.0, 0.0, atom[0].encode()
+            ))
+
+    return array(rows, dtype=ATOM_DTYPE)
+
+
+def synthesize_fixtures(cache: StructureCache, num_codes: int, chain: str, model: str,
+                        cutoff_distance: float, cutoff_angle: float,
+                        json_filepath: str = TRANSFORMATIONS_JSON, seed: int = DEFAULT_SEED) -> List[str]:
+    """ Write structure cache entries for the first num_codes codes of an export. Returns the codes """
+
+    documents = {}
+
+    for document in iter_documents(json_filepath):
+        if document.get('topology', 'normal') == 'normal':
+            documents.setdefault(document['code'], []).append(document)
+
+    codes = sorted(documents)[:num_codes]
+    rng = default_rng(seed)
+
+    for code in codes:
+        entry = synthesize_entry(documents[code], chain, rng)
+        cache.put(code, chain, model, cutoff_distance, cutoff_angle, entry['exit_code'], entry['results'], entry['transport'])
+
+    return codes
+
+
+def record_fixtures(cache_dir: str, fixtures_dir: str, codes: List[str], chain: str, model: str) -> List[str]:
+    """ Copy the structure cache entries of codes into the fixtures directory. Returns the codes copied """
+
+    source, target = StructureCache(cache_dir), StructureCache(fixtures_dir)
+    recorded = []
+
+    for code in codes:
+        filepath = source.get_filepath(code, chain, model)
+
+        if path.exists(filepath):
+            copyfile(filepath, target.get_filepath(code, chain, model))
+            recorded.append(code)
+
+    return recorded
+
+
+def run_mining_stages(mining, cache: StructureCache, codes: List[str]) -> Dict[str, float]:
+    """ Run every ThreeBridges stage over codes, summing the time spent in each stage """
+
+    totals = dict.fromkeys(MINING_STAGES, 0.0)
+
+    def timed(stage: str, function: Callable, *args):
+        start = perf_counter()
+        value = function(*args)
+        totals[stage] += perf_counter() - start
+        return value
+
+    for code in codes:
+        getter = mining.CustomThreeBridgeGetter(code, cache)
+
+        if not timed('load_structure', getter.run_met_aromatic):
+            continue
+
+        timed('graph_extraction', getter.get_joined_pairs)
+
+        if not timed('graph_extraction', getter.get_bridges):
+            continue
+
+        structure = mining.ThreeBridges(code)
+        structure.raw_coordinate_data = getter.raw_coordinate_data
+        timed('index_coordinate_data', structure.index_coordinate_data)
+
+        for chain, raw_bridges in getter.bridges.items():
+            bridges = mining.ThreeBridges(code, chain=chain)
+            bridges.raw_bridges = raw_bridges
+            bridges.coordinate_index = structure.coordinate_index
+            bridges.remove_inverse_bridges()
+
+            for stage in MINING_STAGES[3:]:
+                timed(stage, getattr(bridges, stage))
+
+    return totals
+
+
+class BenchmarkSuite:
+
+    def __init__(self, repeat: int, fixtures_dir: str, codes: List[str], seed: int = DEFAULT_SEED) -> None:
+        self.repeat = repeat
+        self.fixtures_dir = fixtures_dir
+        self.codes = codes
+        self.seed = seed
+        self.results = {}
+        self.fixtures = None
+
+    def add_result(self, name: str, timings: List[float], items: int) -> None:
+        self.results[name] = get_summary(timings, items)
+        logging.info('{:<40} {:>10.4f} s {:>10}'.format(name, self.results[name]['median'], items))
+
+    def get_frames(self) -> List[array]:
+        """ (MET frame, satellites) pairs of the tracked export, moved out of the methionine frame """
+
+        rng = default_rng(self.seed)
+        frames = []
+
+        for document in iter_documents(TRANSFORMATIONS_JSON):
+            residues = {key: value for key, value in document.items() if key not in METADATA_KEYS}
+            base = [array(value) for key, value in residues.items() if key.startswith('MET')][0]
+            satellites = array([value for key, value in residues.items() if not key.startswith('MET')])
+
+            rotation = Rotation.random(random_state=rng.integers(2 ** 32))
+            translation = rng.uniform(-50.0, 50.0, size=3)
+            frames.append((rotation.apply(base) + translation, rotation.apply(satellites) + translation))
+
+        return frames
+
+    def bench_transformer(self) -> None:
+        frames = self.get_frames()
+
+        def construct(_):
+            for base, _ in frames:
+                Transformer(*base, check=CHECK_SAMPLED)
+
+        self.add_result('transformer_init', time_case(construct, self.repeat), len(frames))
+
+        transformers = [(Transformer(*base, check=CHECK_SAMPLED), satellites) for base, satellites in frames]
+        num_satellites = sum(len(satellites) for _, satellites in transformers)
+
+        def rotate(_):
+            for transformer, satellites in transformers:
+                for satellite in satellites:
+                    transformer.rotate_satellite(satellite)
+
+        self.add_result('transformer_rotate_satellite', time_case(rotate, self.repeat), num_satellites)
+
+    def bench_mining(self) -> None:
+        try:
+            mining = import_script('mining', path.join(PROJECT_ROOT, 'data', 'get_n_3_bridge_transformations_json.py'))
+        except ImportError as exception:
+            logging.warning('Skipping mining stage benchmarks. Could not import the mining script: %s', exception)
+            return
+
+        with TemporaryDirectory() as tmp_dir:
+            codes = []
+
+            if path.isdir(self.fixtures_dir):
+                cache = StructureCache(self.fixtures_dir)
+                codes = [code for code in self.codes if path.exists(cache.get_filepath(code, mining.CHAIN, mining.MODEL))]
+                self.fixtures = FIXTURES_RECORDED
+
+            if not codes:
+                logging.info('No recorded fixtures in %s. Synthesizing fixtures from %s', self.fixtures_dir, TRANSFORMATIONS_JSON)
+                cache = StructureCache(tmp_dir)
+                codes = synthesize_fixtures(
+                    cache, len(self.codes), mining.CHAIN, mining.MODEL, mining.CUTOFF_DISTANCE, mining.CUTOFF_ANGLE, seed=self.seed
+                )
+                self.fixtures = FIXTURES_SYNTHESIZED
+
+            timings = {stage: [] for stage in MINING_STAGES}
+
+            for _ in range(self.repeat):
+                for stage, seconds in run_mining_stages(mining, cache, codes).items():
+                    timings[stage].append(seconds)
+
+        for stage in MINING_STAGES:
+            self.add_result('mining_{}'.format(stage), timings[stage], len(codes))
+
+    def bench_pair_kernel(self) -> None:
+        atoms = synthesize_atoms(PAIR_KERNEL_METHIONINES, PAIR_KERNEL_AROMATICS, PAIR_KERNEL_BOX_WIDTH, default_rng(self.seed))
+
+        def search(_):
+            get_pairs(atoms)
+
+        self.add_result('pair_kernel_get_pairs', time_case(search, self.repeat), PAIR_KERNEL_METHIONINES + PAIR_KERNEL_AROMATICS)
+
+    def bench_loaders(self) -> None:
+        scripts = {name: import_script(name, filepath) for name, filepath in ANALYSIS_SCRIPTS.items()}
+
+        def load_convex(_):
+            data = scripts['convex'].FilterData()
+            data.get_phe_data()
+            data.get_tyr_data()
+            data.get_trp_data()
+
+        def load_groupby(_):
+            pipeline = scripts['groupby'].GroupPipeline()
+            pipeline.group_data()
+            pipeline.remove_outliers()
+
+        def load_distribution(_):
+            scripts['distribution'].ComputeDistribution(None).get_bridge_counts()
+
+        timings = {}
+
+        # The loaders log every step, which would otherwise flood the benchmark output
+        logging.disable(logging.WARNING)
+
+        try:
+            for name, function in (('convex', load_convex), ('groupby', load_groupby), ('distribution', load_distribution)):
+                timings[name] = time_case(function, self.repeat)
+        except SystemExit:
+            logging.disable(logging.NOTSET)
+            logging.warning('Skipping loader benchmarks. Could not open store! Try running: make columns')
+            return
+
+        logging.disable(logging.NOTSET)
+
+        for name, loader_timings in timings.items():
+            self.add_result('loader_{}'.format(name), loader_timings, 1)
+
+    def executor_main(self) -> dict:
+        logging.info('{:<40} {:>12} {:>10}'.format('Benchmark', 'Median', 'Items'))
+
+        self.bench_transformer()
+        self.bench_mining()
+        self.bench_pair_kernel()
+        self.bench_loaders()
+
+        return {
+            'version': RESULTS_VERSION,
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'numpy': numpy.__version__,
+                'platform': platform.platform(),
+                'repeat': self.repeat,
+                'fixtures': self.fixtures
+            },
+            'benchmarks': self.results
+        }
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """
+    Compare the fastest runs of benchmarks found in both results, which are less
+    affected by noise from other processes than the medians. A ratio above
+    1 + threshold is a regression
+    """
+
+    rows = []
+
+    for name, summary in current['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+
+        before, after = baseline['benchmarks'][name]['min'], summary['min']
+        ratio = after / before if before > 0 else float('inf')
+
+        rows.append({
+            'name': name,
+            'baseline': before,
+            'current': after,
+            'ratio': ratio,
+            'regression': ratio > 1 + threshold
+        })
+
+    return rows
+
+
+def run(cli_args) -> None:
+    suite = BenchmarkSuite(cli_args.repeat, cli_args.fixtures, read_codes(cli_args.codes), cli_args.seed)
+    results = suite.executor_main()
+
+    makedirs(path.dirname(path.abspath(cli_args.output)), exist_ok=True)
+    logging.info('Exporting %s', cli_args.output)
+
+    with open(cli_args.output, 'w') as f:
+        dump(results, f, indent=4)
+
+
+def compare(cli_args) -> None:
+    with open(cli_args.baseline) as f:
+        baseline = load(f)
+
+    with open(cli_args.results) as f:
+        current = load(f)
+
+    if baseline['meta'].get('fixtures') != current['meta'].get('fixtures'):
+        logging.warning('Baseline and results were run over different fixtures')
+
+    missing = sorted(set(baseline['benchmarks']) - set(current['benchmarks']))
+    if missing:
+        logging.warning('Missing from results: %s', ', '.join(missing))
+
+    rows = compare_results(baseline, current, cli_args.threshold)
+
+    logging.info('{:<40} {:>12} {:>12} {:>8}'.format('Benchmark', 'Baseline', 'Current', 'Ratio'))
+    for row in rows:
+        logging.info('{:<40} {:>10.4f} s {:>10.4f} s {:>8.2f} {}'.format(
+            row['name'], row['baseline'], row['current'], row['ratio'], 'REGRESSION' if row['regression'] else ''
+        ))
+
+    regressions = [row['name'] for row in rows if row['regression']]
+
+    if regressions:
+        logging.error('%i benchmark(s) regressed by more than %.0f%%', len(regressions), cli_args.threshold * 100)
+        sys.exit(EXIT_FAILURE)
+
+    logging.info('No regressions')
+
+
+def record(cli_args) -> None:
+    makedirs(cli_args.fixtures, exist_ok=True)
+    codes = read_codes(cli_args.codes)
+
+    # The chain and model are fixed by the mining script
+    mining = import_script('mining', path.join(PROJECT_ROOT, 'data', 'get_n_3_bridge_transformations_json.py'))
+    recorded = record_fixtures(cli_args.cache_dir, cli_args.fixtures, codes, mining.CHAIN, mining.MODEL)
+
+    logging.info('Recorded %i of %i codes into %s', len(recorded), len(codes), cli_args.fixtures)
+
+
+def get_command_line_arguments():
+    parser = ArgumentParser(description='Offline benchmarks for the transformer, mining stages and analysis loaders')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_run = subparsers.add_parser('run', help='Run the benchmarks and export the results as JSON')
+    parser_run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Number of timed runs of each benchmark')
+    parser_run.add_argument('--fixtures', default=DEFAULT_FIXTURES_DIR, help='Directory of recorded structure cache entries')
+    parser_run.add_argument('--codes', default=DEFAULT_CODES_CSV, help='Codes to run the mining stages over')
+    parser_run.add_argument('--output', default=DEFAULT_RESULTS, help='Path to export the results to')
+    parser_run.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Seed for synthesized inputs')
+    parser_run.set_defaults(function=run)
+
+    parser_compare = subparsers.add_parser('compare', help='Flag benchmarks which regressed against a baseline')
+    parser_compare.add_argument('baseline')
+    parser_compare.add_argument('results')
+    parser_compare.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD, help='Flag benchmarks slower than the baseline by this fraction'
+    )
+    parser_compare.set_defaults(function=compare)
+
+    parser_record = subparsers.add_parser('record', help='Copy structure cache entries into the fixtures directory')
+    parser_record.add_argument('--cache-dir', required=True, help='A structure cache warmed with the codes')
+    parser_record.add_argument('--fixtures', default=DEFAULT_FIXTURES_DIR, help='Directory to copy the entries into')
+    parser_record.add_argument('--codes', default=DEFAULT_CODES_CSV, help='Codes to record')
+    parser_record.set_defaults(function=record)
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    cli_args = get_command_line_arguments()
+    cli_args.function(cli_args)
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,33 @@
 """
-Convex hull plots for mapped bridges.
+Convex hull plots for mapped bridges. Computes the convex hull of the mapped
+centroids of each aromatic type, draws the hull mesh and reports its volume and
+surface area.
 """
 
 import sys
 import logging
+from argparse import ArgumentParser
 from os import path, makedirs
-from json import load
-from matplotlib import pyplot
+from json import dump
+from typing import List, Optional, Tuple
+from numpy import array
+import matplotlib
+matplotlib.use('Agg')  # Render off screen
+from matplotlib import pyplot  # pylint: disable=C0413
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection  # pylint: disable=C0413
+
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data'))
+from dataset import BridgeDataset, parse_threshold  # pylint: disable=C0413
+from hulls import HullCache, get_hull  # pylint: disable=C0413
 
-INPUT_FILENAME = 'n_3_bridge_transformations.json'
 OUTPUT_FILE_PHE = 'phe_bridges_3d.png'
 OUTPUT_FILE_TYR = 'tyr_bridges_3d.png'
 OUTPUT_FILE_TRP = 'trp_bridges_3d.png'
+OUTPUT_FILE_REPORT = 'hulls.json'
 DIM_XYZ_NEG = -7
 DIM_XYZ_POS =  7
 PLOT_DOTS_PER_INCH = 100
 FIGSIZE_WIDTH_HEIGHT_INCHES = (5, 5)
-EXIT_FAILURE = 1
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,49 +37,63 @@ logging.basicConfig(
 
 class FilterData:
 
-    def __init__(self) -> None:
-        path_to_json = path.join(path.dirname(path.dirname(__file__)), 'data', INPUT_FILENAME)
-        logging.info('Reading data from file %s', path_to_json)
+    def __init__(self, dataset: Optional[BridgeDataset] = None, threshold: Optional[Tuple[float, float]] = None) -> None:
+        self.dataset = dataset if dataset is not None else BridgeDataset.open(threshold=threshold)
 
-        try:
-            with open(path_to_json) as f:
-                self.raw_data = load(f)
-        except FileNotFoundError:
-            logging.exception('Could not open file!')
-            sys.exit(EXIT_FAILURE)
+        logging.info('Reading data from store %s', self.dataset.dirpath)
 
-    def get_phe_data(self) -> list:
+    def get_phe_data(self) -> List[array]:
         logging.info('Isolating phenylalanine data from original dataset')
-        phe_coordinates = []
+        return self.dataset.get_residue_coordinate_slices('PHE')
 
-        for document in self.raw_data:
-            for entry in document:
-                if 'PHE' in entry:
-                    phe_coordinates.append(document[entry])
+    def get_tyr_data(self) -> List[array]:
+        logging.info('Isolating tyrosine data from original dataset')
+        return self.dataset.get_residue_coordinate_slices('TYR')
 
-        return list(zip(*phe_coordinates))
+    def get_trp_data(self) -> List[array]:
+        logging.info('Isolating tryptophan data from original dataset')
+        return self.dataset.get_residue_coordinate_slices('TRP')
 
-    def get_tyr_data(self) -> list:
-        logging.info('Isolating tyrosine data from original dataset')
-        tyr_coordinates = []
 
-        for document in self.raw_data:
-            for entry in document:
-                if 'TYR' in entry:
-                    tyr_coordinates.append(document[entry])
+def get_hulls(data: dict) -> dict:
+    """ Compute or load a cached hull for each aromatic type """
 
-        return list(zip(*tyr_coordinates))
+    cache = HullCache()
+    hulls = {}
 
-    def get_trp_data(self) -> list:
-        logging.info('Isolating tryptophan data from original dataset')
-        trp_coordinates = []
+    logging.info('{:>8} {:>10} {:>10} {:>10} {:>12} {:>12}'.format('Residue', 'Points', 'Vertices', 'Facets', 'Volume', 'Area'))
 
-        for document in self.raw_data:
-            for entry in document:
-                if 'TRP' in entry:
-                    trp_coordinates.append(document[entry])
+    for residue, slices in data.items():
+        hull = get_hull(slices, cache)
+        hulls[residue] = hull
 
-        return list(zip(*trp_coordinates))
+        logging.info('{:>8} {:>10} {:>10} {:>10} {:>12.3f} {:>12.3f}'.format(
+            residue, hull['num_points'], len(hull['vertices']), len(hull['facets']), hull['volume'], hull['area']
+        ))
+
+    return hulls
+
+
+def export_report(hulls: dict, filepath: str) -> None:
+    logging.info('Exporting %s', filepath)
+
+    report = {
+        residue: {
+            'num_points': hull['num_points'],
+            'num_vertices': len(hull['vertices']),
+            'num_facets': len(hull['facets']),
+            'volume': hull['volume'],
+            'area': hull['area']
+        }
+        for residue, hull in hulls.items()
+    }
+
+    with open(filepath, 'w') as f:
+        dump(report, f, indent=4)
+
+
+def get_mesh(hull: dict) -> Poly3DCollection:
+    return Poly3DCollection(hull['vertices'][hull['facets']], facecolor='r', edgecolor='k', linewidths=0.1, alpha=0.3)
 
 
 class RenderConvexHulls:
@@ -96,56 +121,72 @@ class RenderConvexHulls:
         ]
         return list(zip(*approximate_all))
 
-    def render_phe_convex_hull(self, data: list, filepath: str) -> None:
+    def render_phe_convex_hull(self, hull: dict, filepath: str) -> None:
         figure = pyplot.figure(figsize=FIGSIZE_WIDTH_HEIGHT_INCHES)
         ax_phe = figure.add_subplot(111, projection='3d')
         pyplot.setp(ax_phe, **self.limits)
-        ax_phe.scatter(*data, c='r', marker='o', s=1)
+        ax_phe.add_collection3d(get_mesh(hull))
         ax_phe.plot(*self.ce_sd_cg_frame, c='k', lw=2)
         ax_phe.set_title('PHE bridges')
         logging.info('Exporting %s', filepath)
-        pyplot.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        figure.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        pyplot.close(figure)
 
-    def render_tyr_convex_hull(self, data: list, filepath: str) -> None:
+    def render_tyr_convex_hull(self, hull: dict, filepath: str) -> None:
         figure = pyplot.figure(figsize=FIGSIZE_WIDTH_HEIGHT_INCHES)
         ax_tyr = figure.add_subplot(111, projection='3d')
         pyplot.setp(ax_tyr, **self.limits)
-        ax_tyr.scatter(*data, c='r', marker='o', s=1)
+        ax_tyr.add_collection3d(get_mesh(hull))
         ax_tyr.plot(*self.ce_sd_cg_frame, c='k', lw=2)
         ax_tyr.set_title('TYR bridges')
         logging.info('Exporting %s', filepath)
-        pyplot.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        figure.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        pyplot.close(figure)
 
-    def render_trp_convex_hull(self, data: list, filepath: str) -> None:
+    def render_trp_convex_hull(self, hull: dict, filepath: str) -> None:
         figure = pyplot.figure(figsize=FIGSIZE_WIDTH_HEIGHT_INCHES)
         ax_trp = figure.add_subplot(111, projection='3d')
         pyplot.setp(ax_trp, **self.limits)
-        ax_trp.scatter(*data, c='r', marker='o', s=1)
+        ax_trp.add_collection3d(get_mesh(hull))
         ax_trp.plot(*self.ce_sd_cg_frame, c='k', lw=2)
         ax_trp.set_title('TRP bridges')
         logging.info('Exporting %s', filepath)
-        pyplot.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        figure.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        pyplot.close(figure)
 
 
-def main() -> None:
-    filter_handle = FilterData()
-    data_phe = filter_handle.get_phe_data()
-    data_tyr = filter_handle.get_tyr_data()
-    data_trp = filter_handle.get_trp_data()
+def run(dataset: Optional[BridgeDataset] = None, threshold: Optional[Tuple[float, float]] = None) -> None:
+    filter_handle = FilterData(dataset, threshold)
+    hulls = get_hulls({
+        'PHE': filter_handle.get_phe_data(),
+        'TYR': filter_handle.get_tyr_data(),
+        'TRP': filter_handle.get_trp_data()
+    })
 
     rootdir = path.join(path.dirname(__file__), 'plots')
     makedirs(rootdir, exist_ok=True)
+    export_report(hulls, path.join(rootdir, OUTPUT_FILE_REPORT))
 
     png_convex_hull_phe = path.join(rootdir, OUTPUT_FILE_PHE)
     png_convex_hull_tyr = path.join(rootdir, OUTPUT_FILE_TYR)
     png_convex_hull_trp = path.join(rootdir, OUTPUT_FILE_TRP)
 
     plotter = RenderConvexHulls()
-    plotter.render_phe_convex_hull(data_phe, png_convex_hull_phe)
-    plotter.render_tyr_convex_hull(data_tyr, png_convex_hull_tyr)
-    plotter.render_trp_convex_hull(data_trp, png_convex_hull_trp)
+    plotter.render_phe_convex_hull(hulls['PHE'], png_convex_hull_phe)
+    plotter.render_tyr_convex_hull(hulls['TYR'], png_convex_hull_tyr)
+    plotter.render_trp_convex_hull(hulls['TRP'], png_convex_hull_trp)
 
     logging.info('Done!')
 
+
+def get_command_line_arguments(argv: Optional[List[str]] = None):
+    parser = ArgumentParser(description='Render the convex hull of the mapped centroids of each aromatic type')
+    parser.add_argument('--threshold', type=parse_threshold, metavar='DISTANCE[:ANGLE]', help='Select the bridges mined at this threshold of a --sweep store')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    run(threshold=get_command_line_arguments(argv).threshold)
+
 if __name__ == '__main__':
     main()
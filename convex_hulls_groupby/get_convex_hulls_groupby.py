@@ -1,32 +1,43 @@
 """
-Groupby convex hull plots for mapped bridges.
+Groupby convex hull plots for mapped bridges. Computes the convex hull of the
+mapped centroids of each permutation group, draws the hull mesh and reports its
+volume and surface area. Every (group, view angle) plot is rendered as its own
+task, optionally across a pool of worker processes.
 """
 
 import sys
 import logging
+from argparse import ArgumentParser
+from multiprocessing import Pool, cpu_count
 from os import path, makedirs
-from json import load, dump
-from itertools import groupby
-from re import (
-    findall,
-    compile,
-    match
-)
-from matplotlib import pyplot
+from json import dump
+from typing import Callable, Iterator, List, Optional, Tuple
+from numpy import array
+import matplotlib
+matplotlib.use('Agg')  # Render off screen so that figures can be drawn from worker processes
+from matplotlib import pyplot  # pylint: disable=C0413
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection  # pylint: disable=C0413
+
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data'))
+from dataset import BridgeDataset, parse_threshold  # pylint: disable=C0413
+from hulls import DEFAULT_CACHE_DIR, HullCache, get_hull  # pylint: disable=C0413
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(levelname)s:%(name)s %(message)s'
 )
 
-ROOT = path.dirname(__file__)
-INPUT_FILENAME = 'n_3_bridge_transformations.json'
-PATTERN_AROMATICS = compile('(PHE|TYR|TRP)')
-EXIT_FAILURE = 1
+ROOT = path.dirname(path.abspath(__file__))
 DIM_XYZ_NEG = -7
 DIM_XYZ_POS =  7
 PLOT_DOTS_PER_INCH = 100
 FIGSIZE_WIDTH_HEIGHT_INCHES = (5, 5)
+OUTPUT_FILE_REPORT = 'hulls.json'
+DEFAULT_VIEW = (30.0, -60.0)  # The matplotlib default elevation and azimuth
+DEFAULT_WORKERS = cpu_count()
+
+# Per process state for rendering tasks. Set by the initializer of each worker
+WORKER_STATE = {}
 
 def render_ce_sd_cg_frame() -> list:
     approximate_coords_cg = [-0.25, 1.80, 0.00]
@@ -42,42 +53,33 @@ def render_ce_sd_cg_frame() -> list:
 
 class GroupPipeline:
 
-    def __init__(self) -> None:
+    def __init__(self, groups: Optional[List[str]] = None, dataset: Optional[BridgeDataset] = None,
+                 threshold: Optional[Tuple[float, float]] = None) -> None:
 
-        path_to_json = path.join(path.dirname(ROOT), 'data', INPUT_FILENAME)
-        logging.info('Reading data from file %s', path_to_json)
+        # Only dump these groups, i.e. those touched by merging newly mined codes
+        self.groups = groups
 
-        try:
-            with open(path_to_json) as f:
-                self.raw_data = load(f)
-        except FileNotFoundError:
-            logging.exception('Could not open file!')
-            sys.exit(EXIT_FAILURE)
+        self.dataset = dataset if dataset is not None else BridgeDataset.open(threshold=threshold)
 
-        logging.info('Found %i entries in file', len(self.raw_data))
+        logging.info('Reading data from store %s', self.dataset.dirpath)
+        logging.info('Found %i entries in store', len(self.dataset))
         self.grouped_data = {}
 
-    def insert_sort_key(self) -> None:
-        logging.info('Inserting a sort key into each entry')
-
-        for row in self.raw_data:
-            """
-            1. Keys inside row          -> MET95TYR68PHE99TYR90code
-            2. MET95TYR68PHE99TYR90code -> ['TYR', 'PHE', 'TYR']
-            3. ['TYR', 'PHE', 'TYR']    -> ['PHE', 'TYR', 'TYR']
-            4. ['PHE', 'TYR', 'TYR']    -> PHETYRTYR
-            """
-            row['key'] = ''.join(sorted(findall(PATTERN_AROMATICS, ''.join(row.keys()))))
-
-    def sort_raw_data(self) -> None:
-        logging.info('Sorting raw data')
-        self.raw_data.sort(key=lambda k: k['key'])
-
     def group_data(self) -> None:
+        """
+        The store is sorted by the key formed from the sorted aromatics of each bridge:
+        1. Keys inside row          -> MET95TYR68PHE99TYR90code
+        2. MET95TYR68PHE99TYR90code -> ['TYR', 'PHE', 'TYR']
+        3. ['TYR', 'PHE', 'TYR']    -> ['PHE', 'TYR', 'TYR']
+        4. ['PHE', 'TYR', 'TYR']    -> PHETYRTYR
+        So every group is a contiguous range which is looked up from the index
+        """
+
         logging.info('Grouping data')
+        self.grouped_data = {group: self.dataset.get_group_size(group) for group in self.dataset.get_groups()}
 
-        for group, data in groupby(self.raw_data, lambda k: k['key']):
-            self.grouped_data[group] = list(data)
+    def get_group_size(self, group: str) -> int:
+        return self.grouped_data[group]
 
     def collect_statistics(self) -> None:
         logging.info('Analyzing data:')
@@ -86,7 +88,7 @@ class GroupPipeline:
         logging.info('{:>5} {:>15} {:>15} {:>15}'.format('Row', 'Group', 'Count', 'Cumulative Sum'))
 
         for u, group in enumerate(self.grouped_data, 1):
-            group_size = len(self.grouped_data[group])
+            group_size = self.get_group_size(group)
             count += group_size
             logging.info('{:>5} {:>15} {:>15} {:>15}'.format(u, group, group_size, count))
 
@@ -99,7 +101,7 @@ class GroupPipeline:
         for group in self.grouped_data:
             if len(group) != 9:
                 logging.warning('The following group will be removed from the dataset: %s', group)
-                logging.warning('The size of the dataset will change by -%s', len(self.grouped_data[group]))
+                logging.warning('The size of the dataset will change by -%s', self.get_group_size(group))
                 bad_groups.append(group)
 
         for group in bad_groups:
@@ -110,15 +112,64 @@ class GroupPipeline:
         makedirs(path_to_dump, exist_ok=True)
 
         for group in self.grouped_data:
+            if self.groups is not None and group not in self.groups:
+                continue
+
             filepath = path.join(path_to_dump, '{}.json'.format(group.lower()))
             logging.info('Dumping %s sorted data to %s', group, filepath)
 
+            documents = self.dataset.get_group_documents(group)
+            for document in documents:
+                document['key'] = group
+
             with open(filepath, 'w') as f:
-                dump(self.grouped_data[group], f, indent=4)
+                dump(documents, f, indent=4)
+
+    def get_coordinates(self, group: str) -> array:
+        """ A zero copy view over the memory mapped satellite coordinates of a group """
+        return self.dataset.get_group_coordinates(group)
+
+    def get_hulls(self, cache: HullCache) -> dict:
+        """ Compute or load a cached hull for each group """
+
+        hulls = {}
+
+        logging.info('{:>15} {:>10} {:>10} {:>10} {:>12} {:>12}'.format('Group', 'Points', 'Vertices', 'Facets', 'Volume', 'Area'))
+
+        for group in self.grouped_data:
+            hull = get_hull([self.get_coordinates(group)], cache)
+            hulls[group] = hull
+
+            logging.info('{:>15} {:>10} {:>10} {:>10} {:>12.3f} {:>12.3f}'.format(
+                group, hull['num_points'], len(hull['vertices']), len(hull['facets']), hull['volume'], hull['area']
+            ))
+
+        logging.info('')
+        return hulls
+
+    @staticmethod
+    def export_report(hulls: dict) -> None:
+        path_to_plots = path.join(ROOT, 'plots')
+        makedirs(path_to_plots, exist_ok=True)
+
+        filepath = path.join(path_to_plots, OUTPUT_FILE_REPORT)
+        logging.info('Exporting %s', filepath)
+
+        report = {
+            group: {
+                'num_points': hull['num_points'],
+                'num_vertices': len(hull['vertices']),
+                'num_facets': len(hull['facets']),
+                'volume': hull['volume'],
+                'area': hull['area']
+            }
+            for group, hull in hulls.items()
+        }
+
+        with open(filepath, 'w') as f:
+            dump(report, f, indent=4)
 
     def executor_main(self) -> dict:
-        self.insert_sort_key()
-        self.sort_raw_data()
         self.group_data()
         self.collect_statistics()
         self.remove_outliers()
@@ -129,30 +180,40 @@ class GroupPipeline:
 
 class RenderConvexHulls:
 
-    def __init__(self, group: str, grouped_data: list) -> None:
-        logging.info('Processing group %s', group)
+    def __init__(self, group: str, hull: dict, view: Tuple[float, float] = DEFAULT_VIEW) -> None:
+        logging.info('Processing group %s at view %s', group, view)
 
-        self.grouped_data = grouped_data
         self.group = group
-        self.coordinates = []
+        self.hull = hull
+        self.view = view
 
         self.path_to_plots = path.join(ROOT, 'plots')
         makedirs(self.path_to_plots, exist_ok=True)
 
-    def isolate_aromatic_coordinates(self) -> None:
-        logging.info('Isolating aromatic coordinates from grouped data')
-
-        for entry in self.grouped_data:
-            for key in entry:
-                if match(PATTERN_AROMATICS, key):
-                    self.coordinates.append(entry[key])
+    def get_filepath(self) -> str:
+        if self.view == DEFAULT_VIEW:
+            filename = '{}_bridges_3d.png'.format(self.group.lower())
+        else:
+            filename = '{}_bridges_3d_{:g}_{:g}.png'.format(self.group.lower(), *self.view)
 
-        self.coordinates = list(zip(*self.coordinates))
+        return path.join(self.path_to_plots, filename)
 
-    def render_convex_hull(self) -> None:
+    def render_convex_hull(self) -> str:
         logging.info('Rendering convex hull for %s bridges', self.group)
 
         figure = pyplot.figure(figsize=FIGSIZE_WIDTH_HEIGHT_INCHES)
+
+        try:
+            self.draw_convex_hull(figure)
+            filepath = self.get_filepath()
+            logging.info('Exporting %s', filepath)
+            figure.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        finally:
+            pyplot.close(figure)  # Release the figure so memory stays flat across tasks
+
+        return filepath
+
+    def draw_convex_hull(self, figure: pyplot.Figure) -> None:
         ax = figure.add_subplot(111, projection='3d')
 
         limits = {
@@ -165,28 +226,109 @@ class RenderConvexHulls:
         }
 
         pyplot.setp(ax, **limits)
-        ax.scatter(*self.coordinates, c='r', marker='o', s=1)
+        ax.add_collection3d(Poly3DCollection(
+            self.hull['vertices'][self.hull['facets']], facecolor='r', edgecolor='k', linewidths=0.1, alpha=0.3
+        ))
         ax.plot(*render_ce_sd_cg_frame(), c='k', lw=2)
+        ax.view_init(*self.view)
         ax.set_title('{} bridges'.format(self.group))
 
-        filepath = path.join(self.path_to_plots, '{}_bridges_3d.png'.format(self.group.lower()))
-        logging.info('Exporting %s', filepath)
-        pyplot.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+    def executor_main(self) -> str:
+        return self.render_convex_hull()
+
+
+def init_worker(dirpath: str, threshold: Optional[Tuple[float, float]], cache_dir: str) -> None:
+    """
+    Open the store and the hull cache of the parent within a worker. Passed explicitly
+    rather than inherited so that workers also see them under the spawn start method
+    """
+
+    WORKER_STATE.update({'dataset': BridgeDataset(dirpath, threshold), 'cache': HullCache(cache_dir), 'hulls': {}})
+
+
+def get_worker_hull(group: str) -> dict:
+    """
+    Resolve the hull of a group within a worker. Workers memory map the same store
+    so they share its pages rather than holding copies of the coordinates, and load
+    the hulls the parent computed from the cache
+    """
+
+    hulls = WORKER_STATE['hulls']
+
+    if group not in hulls:
+        hulls[group] = get_hull([WORKER_STATE['dataset'].get_group_coordinates(group)], WORKER_STATE['cache'])
+
+    return hulls[group]
+
+
+def render_task(task: Tuple[str, Tuple[float, float]]) -> str:
+    """ Worker entry point: render a single group at a single view angle """
+
+    group, view = task
+    return RenderConvexHulls(group, get_worker_hull(group), view).executor_main()
+
 
-    def executor_main(self) -> None:
-        self.isolate_aromatic_coordinates()
-        self.render_convex_hull()
+def run_workers(worker: Callable, tasks: List[tuple], workers: int, initializer: Callable, initargs: tuple) -> Iterator[str]:
+    """ Yield worker results in input order, either serially or from a process pool """
 
+    if workers == 1:
+        initializer(*initargs)
+        yield from map(worker, tasks)
+        return
 
-def main() -> None:
-    pipeline = GroupPipeline()
+    with Pool(processes=workers, initializer=initializer, initargs=initargs) as pool:
+        yield from pool.imap(worker, tasks)
+
+
+def parse_view(view: str) -> Tuple[float, float]:
+    """ Parse ELEVATION:AZIMUTH, i.e. 30:-60 """
+
+    elevation, azimuth = view.split(':')
+    return float(elevation), float(azimuth)
+
+
+def get_command_line_arguments(argv: Optional[List[str]] = None):
+    parser = ArgumentParser(description='Render the convex hull of every 3-bridge permutation group')
+    parser.add_argument(
+        '--workers', type=int, default=DEFAULT_WORKERS,
+        help='Number of worker processes to render plots with (default: number of cores)'
+    )
+    parser.add_argument(
+        '--views', type=parse_view, nargs='+', default=[DEFAULT_VIEW], metavar='ELEVATION:AZIMUTH',
+        help='Render every group from each of these view angles'
+    )
+    parser.add_argument(
+        '--groups', nargs='+', metavar='GROUP',
+        help='Only dump and render these groups, i.e. the groups printed by data/delta.py merge'
+    )
+    parser.add_argument('--threshold', type=parse_threshold, metavar='DISTANCE[:ANGLE]', help='Select the bridges mined at this threshold of a --sweep store')
+    return parser.parse_args(argv)
+
+
+def run(cli_args, dataset: Optional[BridgeDataset] = None) -> None:
+    pipeline = GroupPipeline(cli_args.groups, dataset, cli_args.threshold)
     processed = pipeline.executor_main()
 
-    for group in processed:
-        plotter = RenderConvexHulls(group, processed[group])
-        plotter.executor_main()
+    cache = HullCache(DEFAULT_CACHE_DIR)
+    hulls = pipeline.get_hulls(cache)
+    pipeline.export_report(hulls)
+
+    if cli_args.groups is not None:
+        processed = [group for group in processed if group in cli_args.groups]
+
+    tasks = [(group, view) for group in processed for view in cli_args.views]
+    logging.info('Rendering %i plots using %i workers', len(tasks), cli_args.workers)
+
+    initargs = (pipeline.dataset.dirpath, pipeline.dataset.threshold, cache.cache_dir)
+
+    for _ in run_workers(render_task, tasks, cli_args.workers, init_worker, initargs):
+        pass
 
     logging.info('Done!')
 
+
+def main(argv: Optional[List[str]] = None) -> None:
+    run(get_command_line_arguments(argv))
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,499 @@
+"""
+Compact columnar store for mapped bridges. A store is a directory holding one
+raw binary file per column alongside a meta.json file:
+
+    bridge_code.bin           S4        PDB code of the bridge
+    bridge_chain.bin          S4        Chain of the bridge, empty unless every chain was mined
+    bridge_met_position.bin   int32     Position of the bridging methionine
+    bridge_met_insertion.bin  S1        Insertion code of the bridging methionine, empty if none
+    bridge_base.bin           (3, 3)    Mapped CG, SD, CE methionine base
+    bridge_cutoff_distance.bin float32  Sweep threshold of the bridge, NaN outside of sweeps
+    bridge_cutoff_angle.bin   float32   Sweep threshold of the bridge, NaN outside of sweeps
+    bridge_order.bin          int16     n for an n-bridge
+    bridge_inverse.bin        bool      True for MET - ARO - MET topologies
+    satellite_bridge.bin      int32     Row in the bridge columns owning the satellite
+    satellite_residue.bin     S3        PHE, TYR or TRP
+    satellite_position.bin    int32     Position of the aromatic residue
+    satellite_insertion.bin   S1        Insertion code of the aromatic residue, empty if none
+    satellite_xyz.bin         (3,)      Mapped aromatic centroid
+
+Every column is appended to as bridges arrive and can be memory mapped back
+without parsing. The row counts in meta.json are only advanced once a batch
+has been fully written so a crashed run never exposes a partial batch.
+
+A store can then be sorted so that bridges are ordered by group (the sorted
+satellite residue names, i.e. PHETYRTYR), then chain, and satellites by group,
+then residue. An index.json file records the resulting ranges so that any
+group, any (group, residue) pair or the bridges of any (group, chain) pair can
+be sliced out of the memory mapped columns without copying, alongside the
+sweep thresholds held by the store. Sorted stores are built from the mongoexported JSON or NDJSON file
+using:
+
+    $ python3 columnar.py convert n_3_bridge_transformations.json n_3_bridge_transformations.columns
+"""
+
+import sys
+from argparse import ArgumentParser
+from json import dump, load
+from os import path, makedirs, remove, replace
+from re import match
+from typing import Dict, List, Optional, Set, Tuple
+from numpy import (
+    array, dtype, memmap, fromfile, full, zeros, nan, empty, arange, lexsort, unique, searchsorted, stack, isnan
+)
+from reader import iter_batches
+
+META_FILENAME = 'meta.json'
+INDEX_FILENAME = 'index.json'
+INVERSE_SUFFIX = '-INVERSE'
+FORMAT_VERSION = 5
+FLOAT_DTYPE = '<f8'
+BRIDGE_COLUMNS = (
+    'bridge_code', 'bridge_chain', 'bridge_met_position', 'bridge_met_insertion', 'bridge_base', 'bridge_cutoff_distance', 'bridge_cutoff_angle',
+    'bridge_order', 'bridge_inverse'
+)
+METADATA_KEYS = ('code', 'chain', '_id', 'cutoff_distance', 'cutoff_angle', 'order', 'topology')
+TOPOLOGY_INVERSE = 'inverse'
+SATELLITE_COLUMNS = ('satellite_bridge', 'satellite_residue', 'satellite_position', 'satellite_insertion', 'satellite_xyz')
+
+
+def get_schema(float_dtype: str = FLOAT_DTYPE) -> Dict[str, dtype]:
+    return {
+        'bridge_code': dtype('S4'),
+        'bridge_chain': dtype('S4'),
+        'bridge_met_position': dtype('<i4'),
+        'bridge_met_insertion': dtype('S1'),
+        'bridge_base': dtype((float_dtype, (3, 3))),
+        'bridge_cutoff_distance': dtype('<f4'),
+        'bridge_cutoff_angle': dtype('<f4'),
+        'bridge_order': dtype('<i2'),
+        'bridge_inverse': dtype('?'),
+        'satellite_bridge': dtype('<i4'),
+        'satellite_residue': dtype('S3'),
+        'satellite_position': dtype('<i4'),
+        'satellite_insertion': dtype('S1'),
+        'satellite_xyz': dtype((float_dtype, (3,)))
+    }
+
+
+def split_residue(residue: str) -> tuple:
+    """ Split a key such as TYR68 into ('TYR', 68, '') or, with an insertion code, TYR68A into ('TYR', 68, 'A') """
+
+    retval = match(r'([A-Z]+)(-?\d+)([A-Za-z]?)$', residue)
+
+    if not retval:
+        raise ValueError('Cannot parse residue: {}'.format(residue))
+
+    return retval.group(1), int(retval.group(2)), retval.group(3)
+
+
+def read_meta(dirpath: str) -> dict:
+    with open(path.join(dirpath, META_FILENAME)) as f:
+        meta = load(f)
+
+    if meta['version'] != FORMAT_VERSION:
+        raise ValueError('Store {} has format version {}, expected {}'.format(dirpath, meta['version'], FORMAT_VERSION))
+
+    return meta
+
+
+def write_json(dirpath: str, filename: str, contents: dict) -> None:
+    """ Atomically replace a JSON file so that readers never see a partial file """
+
+    filepath = path.join(dirpath, filename)
+
+    with open(filepath + '.tmp', 'w') as f:
+        dump(contents, f, indent=4)
+
+    replace(filepath + '.tmp', filepath)
+
+
+def write_meta(dirpath: str, meta: dict) -> None:
+    write_json(dirpath, META_FILENAME, meta)
+
+
+def get_group_key(residues: List[str], inverse: bool = False) -> str:
+    """ i.e. ['TYR', 'PHE', 'TYR'] -> PHETYRTYR """
+
+    key = ''.join(sorted(residues))
+
+    if inverse:
+        return key + INVERSE_SUFFIX
+
+    return key
+
+
+def get_document_id(document: dict) -> str:
+    """ Key a bridge by code and methionine so that replaying a code cannot duplicate documents """
+
+    methionine = [residue for residue in document if residue.startswith('MET')]
+    document_id = '{}_{}'.format(document['code'], '_'.join(sorted(methionine)))
+
+    if 'chain' in document:  # Positions repeat across the chains of a structure
+        document_id = '{}_{}_{}'.format(document['code'], document['chain'], '_'.join(sorted(methionine)))
+
+    if 'cutoff_distance' in document:  # The same bridge can be found at several sweep thresholds
+        document_id = '{}_{}_{}'.format(document_id, document['cutoff_distance'], document['cutoff_angle'])
+
+    return document_id
+
+
+def unpack_cutoff(value) -> float:
+    """ The shortest representation of a float32 cutoff, i.e. 4.9 rather than 4.900000095367432 """
+    return float(str(value))
+
+
+def read_index(dirpath: str) -> Optional[dict]:
+    """ Return the group ranges of a sorted store or None if the store is not sorted """
+
+    filepath = path.join(dirpath, INDEX_FILENAME)
+
+    if not path.exists(filepath):
+        return None
+
+    with open(filepath) as f:
+        return load(f)
+
+
+class ColumnarWriter:
+
+    def __init__(self, dirpath: str, float_dtype: str = FLOAT_DTYPE) -> None:
+        self.dirpath = dirpath
+        makedirs(self.dirpath, exist_ok=True)
+
+        if path.exists(path.join(self.dirpath, META_FILENAME)):
+            self.meta = read_meta(self.dirpath)
+        else:
+            self.meta = {
+                'version': FORMAT_VERSION,
+                'float_dtype': float_dtype,
+                'num_bridges': 0,
+                'num_satellites': 0
+            }
+
+        self.schema = get_schema(self.meta['float_dtype'])
+        self.truncate_to_committed()
+
+        self.bridges: List[dict] = []
+
+    def truncate_to_committed(self) -> None:
+        """ Drop any bytes written after the last committed batch """
+
+        for column in BRIDGE_COLUMNS + SATELLITE_COLUMNS:
+            if column in BRIDGE_COLUMNS:
+                num_rows = self.meta['num_bridges']
+            else:
+                num_rows = self.meta['num_satellites']
+
+            with open(path.join(self.dirpath, column + '.bin'), 'ab') as f:
+                f.truncate(num_rows * self.schema[column].itemsize)
+
+    def get_codes(self) -> Set[str]:
+        """ Return the codes with committed rows in the store """
+
+        if self.meta['num_bridges'] == 0:
+            return set()
+
+        codes = fromfile(path.join(self.dirpath, 'bridge_code.bin'), dtype=self.schema['bridge_code'], count=self.meta['num_bridges'])
+        return {code.decode() for code in unique(codes).tolist()}
+
+    def write(self, document: dict) -> None:
+        """ Buffer a bridge. Each bridge is one row of the bridge columns so it must hold exactly one methionine """
+
+        methionines = [residue for residue in document if residue not in METADATA_KEYS and split_residue(residue)[0] == 'MET']
+
+        if len(methionines) != 1:
+            raise ValueError('Bridge of {} must hold exactly one methionine, found {}'.format(
+                document.get('code'), ', '.join(methionines) or 'none'
+            ))
+
+        self.bridges.append(document)
+
+    def flush(self) -> None:
+        """ Append all buffered bridges to the column files then commit the new row counts """
+
+        if not self.bridges:
+            return
+
+        columns = {column: [] for column in BRIDGE_COLUMNS + SATELLITE_COLUMNS}
+        bridge_index = self.meta['num_bridges']
+
+        for document in self.bridges:
+            num_satellites = 0
+
+            for residue, coordinates in document.items():
+                if residue in METADATA_KEYS:
+                    continue
+
+                name, position, insertion = split_residue(residue)
+
+                if name == 'MET':
+                    columns['bridge_code'].append(document['code'])
+                    columns['bridge_chain'].append(document.get('chain', ''))
+                    columns['bridge_met_position'].append(position)
+                    columns['bridge_met_insertion'].append(insertion)
+                    columns['bridge_base'].append(coordinates)
+                    columns['bridge_cutoff_distance'].append(document.get('cutoff_distance', nan))
+                    columns['bridge_cutoff_angle'].append(document.get('cutoff_angle', nan))
+                else:
+                    columns['satellite_bridge'].append(bridge_index)
+                    columns['satellite_residue'].append(name)
+                    columns['satellite_position'].append(position)
+                    columns['satellite_insertion'].append(insertion)
+                    columns['satellite_xyz'].append(coordinates)
+                    num_satellites += 1
+
+            # Documents mined before n-bridge support carry no order or topology
+            columns['bridge_order'].append(document.get('order', num_satellites))
+            columns['bridge_inverse'].append(document.get('topology') == TOPOLOGY_INVERSE)
+            bridge_index += 1
+
+        self.write_columns(columns)
+        self.bridges = []
+
+    def write_columns(self, columns: Dict[str, array]) -> None:
+        """ Append whole columns, whose satellite_bridge rows already account for this store, then commit """
+
+        for column in BRIDGE_COLUMNS + SATELLITE_COLUMNS:
+            with open(path.join(self.dirpath, column + '.bin'), 'ab') as f:
+                array(columns[column], dtype=self.schema[column].base).tofile(f)
+
+        # Appending invalidates the sort order of the store
+        if path.exists(path.join(self.dirpath, INDEX_FILENAME)):
+            remove(path.join(self.dirpath, INDEX_FILENAME))
+
+        self.meta['num_bridges'] += len(columns['bridge_code'])
+        self.meta['num_satellites'] += len(columns['satellite_bridge'])
+        write_meta(self.dirpath, self.meta)
+
+    def close(self) -> None:
+        self.flush()
+
+
+def load_columns(dirpath: str, mmap: bool = True) -> Dict[str, array]:
+    """ Load every column of a store, memory mapped by default """
+
+    meta = read_meta(dirpath)
+    schema = get_schema(meta['float_dtype'])
+    columns = {}
+
+    for column, column_dtype in schema.items():
+        if column in BRIDGE_COLUMNS:
+            num_rows = meta['num_bridges']
+        else:
+            num_rows = meta['num_satellites']
+
+        filepath = path.join(dirpath, column + '.bin')
+
+        if num_rows == 0:
+            columns[column] = zeros(0, dtype=column_dtype)
+        elif mmap:
+            columns[column] = memmap(filepath, dtype=column_dtype, mode='r', shape=(num_rows,))
+        else:
+            columns[column] = fromfile(filepath, dtype=column_dtype, count=num_rows)
+
+    return columns
+
+
+def get_bridge_keys(columns: Dict[str, array]) -> array:
+    """ Return the group key of every bridge in a set of columns """
+
+    residues = [[] for _ in range(len(columns['bridge_code']))]
+    for bridge, residue in zip(columns['satellite_bridge'].tolist(), columns['satellite_residue'].tolist()):
+        residues[bridge].append(residue.decode())
+
+    return array([
+        get_group_key(bridge_residues, inverse) for bridge_residues, inverse in zip(residues, columns['bridge_inverse'].tolist())
+    ], dtype=str)
+
+
+def select_bridges(columns: Dict[str, array], bridges: array) -> Dict[str, array]:
+    """ Return the rows of a sorted array of bridges and of their satellites, renumbering satellite_bridge """
+
+    new_bridge_index = full(len(columns['bridge_code']), -1, dtype='<i4')
+    new_bridge_index[bridges] = arange(len(bridges))
+
+    satellite_bridge = new_bridge_index[columns['satellite_bridge']]
+    satellites = satellite_bridge >= 0
+
+    selected = {column: columns[column][bridges] for column in BRIDGE_COLUMNS}
+    for column in SATELLITE_COLUMNS[1:]:
+        selected[column] = columns[column][satellites]
+
+    selected['satellite_bridge'] = satellite_bridge[satellites]
+    return selected
+
+
+def append_columns(dirpath: str, columns: Dict[str, array]) -> None:
+    """ Append every row of a set of columns, i.e. those of a store mined from new codes, to a store """
+
+    writer = ColumnarWriter(dirpath)
+
+    columns = dict(columns)
+    columns['satellite_bridge'] = columns['satellite_bridge'] + writer.meta['num_bridges']
+    writer.write_columns(columns)
+
+
+def get_thresholds(columns: Dict[str, array]) -> List[List[float]]:
+    """ Return the distinct (distance, angle) sweep thresholds of a set of columns. Bridges mined outside of sweeps have none """
+
+    cutoffs = stack([columns['bridge_cutoff_distance'], columns['bridge_cutoff_angle']], axis=1)
+    cutoffs = cutoffs[~isnan(cutoffs).any(axis=1)]
+
+    return [[unpack_cutoff(distance), unpack_cutoff(angle)] for distance, angle in unique(cutoffs, axis=0)]
+
+
+def sort_arrays(columns: Dict[str, array]) -> Tuple[Dict[str, array], dict]:
+    """
+    Order bridges by group then chain and satellites by group then residue.
+    Returns the sorted columns and the index of group ranges
+    """
+
+    num_bridges = len(columns['bridge_code'])
+    bridge_keys = get_bridge_keys(columns)
+    bridge_order = lexsort((arange(num_bridges), columns['bridge_chain'], bridge_keys))
+    new_bridge_index = empty(num_bridges, dtype='<i4')
+    new_bridge_index[bridge_order] = arange(num_bridges)
+
+    satellite_bridge = new_bridge_index[columns['satellite_bridge']]
+    satellite_keys = bridge_keys[columns['satellite_bridge']]
+    satellite_order = lexsort((satellite_bridge, columns['satellite_residue'], satellite_keys))
+
+    sorted_columns = {'satellite_bridge': satellite_bridge[satellite_order]}
+    for column in BRIDGE_COLUMNS:
+        sorted_columns[column] = columns[column][bridge_order]
+    for column in SATELLITE_COLUMNS[1:]:
+        sorted_columns[column] = columns[column][satellite_order]
+
+    bridge_keys = bridge_keys[bridge_order]
+    satellite_keys = satellite_keys[satellite_order]
+    satellite_residues = sorted_columns['satellite_residue']
+
+    index = {'groups': {}, 'thresholds': get_thresholds(sorted_columns)}
+    for key in unique(bridge_keys).tolist():
+        bridge_start = int(searchsorted(bridge_keys, key, side='left'))
+        bridge_end = int(searchsorted(bridge_keys, key, side='right'))
+        group_chains = sorted_columns['bridge_chain'][bridge_start:bridge_end]
+        satellite_start = int(searchsorted(satellite_keys, key, side='left'))
+        satellite_end = int(searchsorted(satellite_keys, key, side='right'))
+        group_residues = satellite_residues[satellite_start:satellite_end]
+
+        index['groups'][key] = {
+            'bridges': [bridge_start, bridge_end],
+            'chains': {
+                chain.decode(): [
+                    bridge_start + int(searchsorted(group_chains, chain, side='left')),
+                    bridge_start + int(searchsorted(group_chains, chain, side='right'))
+                ]
+                for chain in unique(group_chains).tolist()
+            },
+            'satellites': [satellite_start, satellite_end],
+            'residues': {
+                residue.decode(): [
+                    satellite_start + int(searchsorted(group_residues, residue, side='left')),
+                    satellite_start + int(searchsorted(group_residues, residue, side='right'))
+                ]
+                for residue in unique(group_residues).tolist()
+            }
+        }
+
+    return sorted_columns, index
+
+
+def sort_columns(dirpath: str) -> dict:
+    """ Rewrite a store in sorted order, then write out and return the index of group ranges """
+
+    schema = get_schema(read_meta(dirpath)['float_dtype'])
+    sorted_columns, index = sort_arrays(load_columns(dirpath, mmap=False))
+
+    for column, values in sorted_columns.items():
+        filepath = path.join(dirpath, column + '.bin')
+        values.astype(schema[column].base).tofile(filepath + '.tmp')
+        replace(filepath + '.tmp', filepath)
+
+    write_json(dirpath, INDEX_FILENAME, index)
+    return index
+
+
+def get_documents(columns: Dict[str, array], ranges: dict) -> List[dict]:
+    """
+    Rebuild the documents of a single group of a sorted store. The bridge range
+    may be narrowed to the bridges of one chain of the group
+    """
+
+    bridge_start, bridge_end = ranges['bridges']
+    satellite_start, satellite_end = ranges['satellites']
+    documents = []
+
+    for bridge in range(bridge_start, bridge_end):
+        position = '{}{}'.format(columns['bridge_met_position'][bridge], columns['bridge_met_insertion'][bridge].decode())
+        documents.append({'MET{}'.format(position): columns['bridge_base'][bridge].tolist()})
+
+    for satellite in range(satellite_start, satellite_end):
+        if not bridge_start <= columns['satellite_bridge'][satellite] < bridge_end:
+            continue
+
+        residue = '{}{}{}'.format(
+            columns['satellite_residue'][satellite].decode(), columns['satellite_position'][satellite],
+            columns['satellite_insertion'][satellite].decode()
+        )
+        documents[columns['satellite_bridge'][satellite] - bridge_start][residue] = columns['satellite_xyz'][satellite].tolist()
+
+    for bridge, document in zip(range(bridge_start, bridge_end), documents):
+        document['code'] = columns['bridge_code'][bridge].decode()
+
+        if columns['bridge_chain'][bridge]:
+            document['chain'] = columns['bridge_chain'][bridge].decode()
+
+        if columns['bridge_cutoff_distance'][bridge] == columns['bridge_cutoff_distance'][bridge]:  # Not NaN
+            document['cutoff_distance'] = unpack_cutoff(columns['bridge_cutoff_distance'][bridge])
+            document['cutoff_angle'] = unpack_cutoff(columns['bridge_cutoff_angle'][bridge])
+
+        document['_id'] = get_document_id(document)
+
+    return documents
+
+
+def convert_json(json_filepath: str, dirpath: str, float_dtype: str = FLOAT_DTYPE) -> dict:
+    """ Build a sorted store from a mongoexported JSON array or NDJSON file of transformations """
+
+    if path.exists(path.join(dirpath, META_FILENAME)):
+        raise FileExistsError('A store already exists at {}'.format(dirpath))
+
+    writer = ColumnarWriter(dirpath, float_dtype)
+
+    # Stream the export so that only one batch of documents is ever held in memory
+    for documents in iter_batches(json_filepath):
+        for document in documents:
+            writer.write(document)
+
+        writer.flush()
+
+    writer.close()
+    return sort_columns(dirpath)
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Build or sort a columnar store of mapped bridges')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_convert = subparsers.add_parser('convert', help='Convert a mongoexported JSON or NDJSON file into a sorted store')
+    parser_convert.add_argument('json_filepath')
+    parser_convert.add_argument('dirpath')
+    parser_convert.add_argument('--float32', action='store_true', help='Store coordinates as float32')
+
+    parser_sort = subparsers.add_parser('sort', help='Sort and index a store written by the mining script')
+    parser_sort.add_argument('dirpath')
+
+    cli_args = parser.parse_args()
+
+    if cli_args.command == 'convert':
+        index = convert_json(cli_args.json_filepath, cli_args.dirpath, '<f4' if cli_args.float32 else FLOAT_DTYPE)
+    else:
+        index = sort_columns(cli_args.dirpath)
+
+    for key, ranges in index['groups'].items():
+        sys.stdout.write('{:>20} {:>10}\n'.format(key, ranges['bridges'][1] - ranges['bridges'][0]))
+
+if __name__ == '__main__':
+    main()
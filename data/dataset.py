@@ -0,0 +1,179 @@
+"""
+Shared loader for the analysis scripts. Memory maps a sorted columnar store of
+mapped bridges once and exposes lookups by:
+    -- aromatic type:   PHE, TYR or TRP
+    -- permutation key: the sorted aromatics of a bridge, i.e. PHETYRTYR
+    -- PDB code
+Lookups by aromatic type and permutation key are slices over the sorted
+columns. The bridges of a permutation key and chain are also a slice, so that
+the chains of a store mined with --all-chains can be told apart. The PDB code
+index is built on first use.
+
+A store mined with --sweep holds the bridges of several thresholds, which must
+not be pooled. One threshold is then selected when opening the store, in which
+case its rows are copied out and sorted in memory. Opening such a store without
+selecting a threshold raises a ValueError.
+"""
+
+import sys
+import logging
+from os import path
+from typing import Dict, List, Optional, Tuple
+from numpy import array, argsort, concatenate, flatnonzero, unique, zeros
+from columnar import load_columns, read_index, get_documents, select_bridges, sort_arrays, INVERSE_SUFFIX
+
+DEFAULT_DIRPATH = path.join(path.dirname(path.abspath(__file__)), 'n_3_bridge_transformations.columns')
+AROMATICS = ('PHE', 'TYR', 'TRP')
+RESIDUE_NAME_LENGTH = 3
+EXIT_FAILURE = 1
+DEFAULT_THRESHOLD_ANGLE = 360.0  # As for --sweep when mining
+
+
+def parse_threshold(argument: str) -> Tuple[float, float]:
+    """ Parse a sweep threshold of form DISTANCE or DISTANCE:ANGLE """
+
+    distance, _, angle = argument.partition(':')
+    return float(distance), float(angle) if angle else DEFAULT_THRESHOLD_ANGLE
+
+
+def format_threshold(threshold: Tuple[float, float]) -> str:
+    return '{:g}:{:g}'.format(*threshold)
+
+
+class BridgeDataset:
+
+    def __init__(self, dirpath: str = DEFAULT_DIRPATH, threshold: Optional[Tuple[float, float]] = None) -> None:
+        self.dirpath = dirpath
+        self.index = read_index(self.dirpath)
+
+        if self.index is None:
+            raise FileNotFoundError('No sorted store found at {}'.format(self.dirpath))
+
+        self.columns = load_columns(self.dirpath)
+        self.thresholds = [tuple(cutoffs) for cutoffs in self.index['thresholds']]
+        self.threshold = threshold
+
+        if threshold is not None:
+            self._select_threshold(threshold)
+        elif len(self.thresholds) > 1:
+            raise ValueError('Store {} holds bridges mined at several thresholds: {}'.format(
+                self.dirpath, ', '.join(format_threshold(cutoffs) for cutoffs in self.thresholds)
+            ))
+
+        self.groups = self.index['groups']
+        self.residue_slices = self._index_residues()
+        self.code_index: Optional[Dict[str, array]] = None
+
+    @classmethod
+    def open(cls, dirpath: str = DEFAULT_DIRPATH, threshold: Optional[Tuple[float, float]] = None) -> 'BridgeDataset':
+        """ Open a store from a script, exiting with a hint if it has not been built yet or a threshold is needed """
+
+        try:
+            return cls(dirpath, threshold)
+        except FileNotFoundError:
+            logging.exception('Could not open store! Try running: make columns')
+            sys.exit(EXIT_FAILURE)
+        except ValueError as error:
+            logging.error('%s. Select one with --threshold DISTANCE[:ANGLE]', error)
+            sys.exit(EXIT_FAILURE)
+
+    def _select_threshold(self, threshold: Tuple[float, float]) -> None:
+        """ Keep only the bridges mined at a sweep threshold, copying them out if the store holds others """
+
+        distances, angles = self.columns['bridge_cutoff_distance'], self.columns['bridge_cutoff_angle']
+        selected = flatnonzero((distances == distances.dtype.type(threshold[0])) & (angles == angles.dtype.type(threshold[1])))
+
+        if len(selected) == 0:
+            raise ValueError('Store {} holds no bridges mined at threshold {}. Thresholds: {}'.format(
+                self.dirpath, format_threshold(threshold), ', '.join(format_threshold(cutoffs) for cutoffs in self.thresholds) or 'none'
+            ))
+
+        if len(selected) < len(distances):
+            self.columns, self.index = sort_arrays(select_bridges(self.columns, selected))
+
+    def _index_residues(self) -> Dict[str, List[Tuple[int, int]]]:
+        """ Collect the (group, residue) slices of every aromatic type, ignoring inverse bridges """
+
+        residue_slices = {residue: [] for residue in AROMATICS}
+
+        for group, ranges in self.groups.items():
+            if group.endswith(INVERSE_SUFFIX):
+                continue
+
+            for residue, (start, end) in ranges['residues'].items():
+                residue_slices.setdefault(residue, []).append((start, end))
+
+        return residue_slices
+
+    def __len__(self) -> int:
+        return len(self.columns['bridge_code'])
+
+    def get_groups(self, num_aromatics: Optional[int] = None) -> List[str]:
+        """ Return permutation keys of normal bridges, optionally only those with num_aromatics aromatics """
+
+        groups = []
+
+        for group in self.groups:
+            if group.endswith(INVERSE_SUFFIX):
+                continue
+
+            if num_aromatics is not None and len(group) != num_aromatics * RESIDUE_NAME_LENGTH:
+                continue
+
+            groups.append(group)
+
+        return groups
+
+    def get_group_size(self, group: str) -> int:
+        start, end = self.groups[group]['bridges']
+        return end - start
+
+    def get_group_coordinates(self, group: str) -> array:
+        """ A zero copy (n, 3) view of every satellite in a permutation group """
+
+        start, end = self.groups[group]['satellites']
+        return self.columns['satellite_xyz'][start:end]
+
+    def get_group_chains(self, group: str) -> List[str]:
+        """ Chains with bridges in a permutation group. A single empty chain unless every chain was mined """
+        return sorted(self.groups[group]['chains'])
+
+    def get_group_documents(self, group: str, chain: Optional[str] = None) -> List[dict]:
+        ranges = self.groups[group]
+
+        if chain is not None:
+            ranges = dict(ranges, bridges=ranges['chains'].get(chain, [0, 0]))
+
+        return get_documents(self.columns, ranges)
+
+    def get_residue_coordinate_slices(self, residue: str) -> List[array]:
+        """ Zero copy (n, 3) views which together hold every satellite of an aromatic type """
+        return [self.columns['satellite_xyz'][start:end] for start, end in self.residue_slices.get(residue, [])]
+
+    def get_residue_coordinates(self, residue: str) -> array:
+        slices = self.get_residue_coordinate_slices(residue)
+
+        if not slices:
+            return zeros((0, 3))
+
+        return concatenate(slices)
+
+    def get_code_bridges(self, code: str, chain: Optional[str] = None) -> array:
+        """ Return the bridge rows found in a PDB code, optionally only those of one chain """
+
+        if self.code_index is None:
+            codes = self.columns['bridge_code']
+            order = argsort(codes, kind='stable')
+            unique_codes, starts = unique(codes[order], return_index=True)
+            ends = list(starts[1:]) + [len(order)]
+
+            self.code_index = {
+                unique_code.decode(): order[start:end] for unique_code, start, end in zip(unique_codes, starts, ends)
+            }
+
+        rows = self.code_index.get(code, zeros(0, dtype=int))
+
+        if chain is not None:
+            rows = rows[self.columns['bridge_chain'][rows] == chain.encode()]
+
+        return rows
@@ -0,0 +1,205 @@
+"""
+Incremental updates for when new codes are appended to the structure list.
+Rather than re-mining every code and rebuilding every artifact:
+
+1. List the codes that have not been mined yet:
+
+    $ python3 delta.py diff low_redundancy_delimiter_list.csv \\
+        --manifest n_3_bridge_transformations_manifest.jsonl > new_codes.csv
+
+2. Mine only these codes into a separate store. The run records every code in
+   the manifest, so codes without bridges are not listed again by the next diff:
+
+    $ python3 get_n_3_bridge_transformations_json.py --codes new_codes.csv --sink columnar --output delta.columns
+
+3. Merge the new store into the sorted store:
+
+    $ python3 delta.py merge delta.columns
+
+The merge skips codes already held by the store, so merging the same delta
+twice leaves the store unchanged. The new rows are appended and the store is
+re-sorted, which updates the permutation counts held in its index. Cached
+hulls of the groups and aromatic types touched by the new rows are extended
+with only the new points and stored under the hash of the merged coordinates,
+so the plotting scripts find them in the cache. Density grids saved to disk
+are updated in place. Hulls and grids pool every bridge, so these are not
+updated for stores mined at several --sweep thresholds, which must be merged
+using --no-hulls and without --grids. The touched groups are printed so that
+only their plots and dumps are redone:
+
+    $ python3 ../convex_hulls_groupby/get_convex_hulls_groupby.py --groups PHEPHETYR TRPTRPTRP
+"""
+
+import sys
+from argparse import ArgumentParser
+from os import path
+from typing import Dict, List, Optional, Set
+from numpy import array, flatnonzero, isin, unique
+from columnar import (
+    append_columns, get_bridge_keys, get_thresholds, load_columns, read_meta, select_bridges, sort_columns, INVERSE_SUFFIX
+)
+from dataset import BridgeDataset, DEFAULT_DIRPATH
+from density import DensityGrids, KIND_RESIDUES, KIND_GROUPS
+from hulls import HullCache, IncrementalHull, get_data_hash
+from manifest import RunManifest
+
+
+def get_mined_codes(dirpath: str) -> Set[str]:
+    """ Return the codes with at least one bridge in a store """
+
+    if not path.exists(dirpath):
+        return set()
+
+    return {code.decode() for code in unique(load_columns(dirpath)['bridge_code']).tolist()}
+
+
+def get_new_codes(codes: List[str], manifest_filepath: Optional[str] = None, store_dirpath: Optional[str] = None) -> List[str]:
+    """
+    Return the codes missing from both a run manifest and a store. A store alone
+    cannot tell a code without bridges from an unmined code, so stores built from
+    an export should be used alongside the manifest of the run where possible
+    """
+
+    seen = set()
+
+    if manifest_filepath is not None and path.exists(manifest_filepath):
+        with RunManifest(manifest_filepath) as manifest:
+            seen.update(code for code in codes if manifest.get_status(code) is not None)
+
+    if store_dirpath is not None:
+        seen.update(get_mined_codes(store_dirpath))
+
+    return [code for code in codes if code not in seen]
+
+
+def get_delta_points(columns: Dict[str, array]) -> Dict[str, Dict[str, array]]:
+    """ Return the new satellite coordinates of each aromatic type and each group, ignoring inverse bridges """
+
+    points = {KIND_RESIDUES: {}, KIND_GROUPS: {}}
+
+    if len(columns['bridge_code']) == 0:
+        return points
+
+    satellite_keys = get_bridge_keys(columns)[columns['satellite_bridge']]
+    normal = ~columns['bridge_inverse'][columns['satellite_bridge']]
+
+    for residue in unique(columns['satellite_residue'][normal]).tolist():
+        mask = normal & (columns['satellite_residue'] == residue)
+        points[KIND_RESIDUES][residue.decode()] = columns['satellite_xyz'][mask]
+
+    for key in unique(satellite_keys[normal]).tolist():
+        points[KIND_GROUPS][key] = columns['satellite_xyz'][normal & (satellite_keys == key)]
+
+    return points
+
+
+def get_hull_batches(dataset: BridgeDataset, kind: str, key: str) -> list:
+    """ The coordinate batches the convex hull scripts compute each hull over """
+
+    if kind == KIND_RESIDUES:
+        return dataset.get_residue_coordinate_slices(key)
+
+    if key not in dataset.groups:
+        return []
+
+    return [dataset.get_group_coordinates(key)]
+
+
+def merge_delta(dirpath: str, delta_dirpath: str, grids_filepath: Optional[str] = None,
+                cache: Optional[HullCache] = None) -> Dict[str, List[str]]:
+    """ Merge a delta store into a sorted store and update derived artifacts. Returns the touched keys """
+
+    # Codes already in the store were merged before, i.e. by an earlier merge of the same delta
+    delta = load_columns(delta_dirpath)
+    merged_codes = array(sorted(get_mined_codes(dirpath)), dtype='S4')
+    delta = select_bridges(delta, flatnonzero(~isin(delta['bridge_code'], merged_codes)))
+
+    if len(delta['bridge_code']) == 0:
+        return {KIND_RESIDUES: [], KIND_GROUPS: []}
+
+    thresholds = {tuple(cutoffs) for cutoffs in get_thresholds(load_columns(dirpath)) + get_thresholds(delta)}
+
+    if len(thresholds) > 1 and (cache is not None or grids_filepath is not None):
+        raise ValueError('Cannot extend hulls or density grids over bridges mined at several thresholds')
+
+    points = get_delta_points(delta)
+
+    # Look up the hulls of the store before the merge, which are extended below rather than recomputed
+    previous_hulls = {KIND_RESIDUES: {}, KIND_GROUPS: {}}
+
+    if cache is not None:
+        before = BridgeDataset(dirpath)
+
+        for kind, kind_points in points.items():
+            for key in kind_points:
+                batches = get_hull_batches(before, kind, key)
+                previous_hulls[kind][key] = cache.get(get_data_hash(batches)) if batches else IncrementalHull().get_summary()
+
+        del before
+
+    append_columns(dirpath, delta)
+    sort_columns(dirpath)
+
+    if cache is not None:
+        after = BridgeDataset(dirpath)
+
+        for kind, kind_points in points.items():
+            for key, new_points in kind_points.items():
+                summary = previous_hulls[kind][key]
+
+                if summary is None:  # Never computed so there is nothing to extend
+                    continue
+
+                hull = IncrementalHull.from_summary(summary)
+                hull.add_points(new_points)
+                cache.put(get_data_hash(get_hull_batches(after, kind, key)), hull.get_summary())
+                hull.close()
+
+    if grids_filepath is not None and path.exists(grids_filepath):
+        grids = DensityGrids.load(grids_filepath)
+
+        for kind, kind_points in points.items():
+            for key, new_points in kind_points.items():
+                grids.add_points(kind, key, new_points)
+
+        grids.codes.update(code.decode() for code in unique(delta['bridge_code']).tolist())
+        grids.save(grids_filepath)
+
+    return {kind: sorted(kind_points) for kind, kind_points in points.items()}
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Mine and merge only the codes added to the structure list')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_diff = subparsers.add_parser('diff', help='List codes that have not been mined yet')
+    parser_diff.add_argument('csv', help='The structure list, i.e. low_redundancy_delimiter_list.csv')
+    parser_diff.add_argument('--manifest', help='Manifest of the runs that mined the store')
+    parser_diff.add_argument('--store', default=DEFAULT_DIRPATH, help='Store holding the mined bridges')
+
+    parser_merge = subparsers.add_parser('merge', help='Merge a store mined from new codes into the sorted store')
+    parser_merge.add_argument('delta', help='Store mined from the new codes')
+    parser_merge.add_argument('--store', default=DEFAULT_DIRPATH, help='Sorted store to merge into')
+    parser_merge.add_argument('--grids', help='Density grids file to update, i.e. n_3_bridge_density.npz')
+    parser_merge.add_argument('--no-hulls', action='store_true', help='Do not extend cached hulls')
+
+    cli_args = parser.parse_args()
+
+    if cli_args.command == 'diff':
+        with open(cli_args.csv) as f:
+            codes = [line.strip() for line in f if line.strip()]
+
+        for code in get_new_codes(codes, cli_args.manifest, cli_args.store):
+            sys.stdout.write(code + '\n')
+
+        return
+
+    num_bridges = read_meta(cli_args.store)['num_bridges']
+    touched = merge_delta(cli_args.store, cli_args.delta, cli_args.grids, None if cli_args.no_hulls else HullCache())
+
+    sys.stdout.write('Merged {} bridges\n'.format(read_meta(cli_args.store)['num_bridges'] - num_bridges))
+    sys.stdout.write('Residues: {}\n'.format(' '.join(touched[KIND_RESIDUES])))
+    sys.stdout.write('Groups: {}\n'.format(' '.join(key for key in touched[KIND_GROUPS] if not key.endswith(INVERSE_SUFFIX))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Voxel density grids of mapped aromatic centroids. Satellite coordinates in the
+methionine frame are binned into a cubic grid centered on SD:
+
+    edges = -limit, -limit + voxel_size, ..., limit
+
+Grids are kept per aromatic type (PHE, TYR, TRP) and per permutation group
+(i.e. PHETYRTYR). They hold raw integer counts so that grids built from
+different shards, i.e. separate mining runs, can be merged by summation.
+Shards which hold the same code cannot be merged as it would be counted twice.
+Smoothing is only applied when a grid is read out. A set of grids is saved to
+a single .npz file and shards can be merged using:
+
+    $ python3 density.py merge merged.npz shard_1.npz shard_2.npz ...
+"""
+
+import sys
+from argparse import ArgumentParser
+from os import replace
+from typing import Dict, Iterable, List, Optional, Set
+from numpy import (
+    array, ascontiguousarray, bincount, cumsum, floor, linspace, load, ravel_multi_index, savez_compressed, searchsorted,
+    sort, zeros
+)
+from columnar import get_group_key, split_residue, METADATA_KEYS, TOPOLOGY_INVERSE
+
+DEFAULT_LIMIT = 7.0
+DEFAULT_VOXEL_SIZE = 0.25
+KIND_RESIDUES = 'residues'
+KIND_GROUPS = 'groups'
+
+
+class DensityGrid:
+
+    def __init__(self, limit: float = DEFAULT_LIMIT, voxel_size: float = DEFAULT_VOXEL_SIZE) -> None:
+        self.limit = limit
+        self.voxel_size = voxel_size
+        self.num_bins = int(round(2 * limit / voxel_size))
+        self.counts = zeros((self.num_bins,) * 3, dtype='<i8')
+        self.num_outside = 0
+
+    @property
+    def num_points(self) -> int:
+        return int(self.counts.sum()) + self.num_outside
+
+    def get_edges(self) -> array:
+        return linspace(-self.limit, self.limit, self.num_bins + 1)
+
+    def get_centers(self) -> array:
+        edges = self.get_edges()
+        return (edges[:-1] + edges[1:]) / 2
+
+    def add_points(self, points: array) -> None:
+        """ Bin a batch of (n, 3) points. Points outside of the grid are only counted """
+
+        points = ascontiguousarray(points, dtype='<f8').reshape(-1, 3)
+        indices = floor((points + self.limit) / self.voxel_size).astype('<i8')
+        inside = ((indices >= 0) & (indices < self.num_bins)).all(axis=1)
+
+        flat_indices = ravel_multi_index(indices[inside].T, self.counts.shape)
+        self.counts += bincount(flat_indices, minlength=self.counts.size).reshape(self.counts.shape)
+        self.num_outside += int(len(points) - inside.sum())
+
+    def is_compatible(self, other: 'DensityGrid') -> bool:
+        return self.limit == other.limit and self.voxel_size == other.voxel_size
+
+    def merge(self, other: 'DensityGrid') -> None:
+        if not self.is_compatible(other):
+            raise ValueError('Cannot merge grids with different limits or voxel sizes')
+
+        self.counts += other.counts
+        self.num_outside += other.num_outside
+
+    def get_density(self, sigma: Optional[float] = None) -> array:
+        """
+        Return the fraction of points per cubic angstrom in each voxel, optionally
+        smoothed by a Gaussian with a standard deviation of sigma angstroms
+        """
+
+        density = self.counts.astype('<f8')
+
+        if sigma:
+            from scipy.ndimage import gaussian_filter  # Only needed for smoothing, not by the mining sink
+
+            density = gaussian_filter(density, sigma / self.voxel_size, mode='constant')
+
+        num_points = self.num_points
+
+        if num_points == 0:
+            return density
+
+        return density / (num_points * self.voxel_size ** 3)
+
+
+class DensityGrids:
+
+    def __init__(self, limit: float = DEFAULT_LIMIT, voxel_size: float = DEFAULT_VOXEL_SIZE) -> None:
+        self.limit = limit
+        self.voxel_size = voxel_size
+        self.grids: Dict[str, Dict[str, DensityGrid]] = {KIND_RESIDUES: {}, KIND_GROUPS: {}}
+        self.codes: Set[str] = set()  # Codes whose documents have been accumulated, so that a resumed run can skip them
+
+    def get_grid(self, kind: str, key: str) -> DensityGrid:
+        if key not in self.grids[kind]:
+            self.grids[kind][key] = DensityGrid(self.limit, self.voxel_size)
+
+        return self.grids[kind][key]
+
+    def add_points(self, kind: str, key: str, points: array) -> None:
+        self.get_grid(kind, key).add_points(points)
+
+    def add_documents(self, documents: Iterable[dict]) -> None:
+        """ Accumulate mined transformations, i.e. from within a sink, ignoring inverse bridges """
+
+        residues = {KIND_RESIDUES: {}, KIND_GROUPS: {}}
+
+        for document in documents:
+            if 'code' in document:
+                self.codes.add(document['code'])
+
+            if document.get('topology') == TOPOLOGY_INVERSE:
+                continue
+
+            satellites = []
+
+            for residue, coordinates in document.items():
+                if residue in METADATA_KEYS:
+                    continue
+
+                name, _, _ = split_residue(residue)
+
+                if name != 'MET':
+                    satellites.append((name, coordinates))
+
+            group = get_group_key([name for name, _ in satellites])
+
+            for name, coordinates in satellites:
+                residues[KIND_RESIDUES].setdefault(name, []).append(coordinates)
+                residues[KIND_GROUPS].setdefault(group, []).append(coordinates)
+
+        for kind, points in residues.items():
+            for key, coordinates in points.items():
+                self.add_points(kind, key, array(coordinates))
+
+    def merge(self, other: 'DensityGrids') -> None:
+        """ Sum the counts of another shard. Shards must not share codes, i.e. a code mined again by a re-run """
+
+        overlap = self.codes & other.codes
+
+        if overlap:
+            raise ValueError('Cannot merge shards which both hold codes {}'.format(', '.join(sorted(overlap))))
+
+        for kind, grids in other.grids.items():
+            for key, grid in grids.items():
+                self.get_grid(kind, key).merge(grid)
+
+        self.codes.update(other.codes)
+
+    def save(self, filepath: str) -> None:
+        arrays = {'limit': array(self.limit), 'voxel_size': array(self.voxel_size), 'codes': array(sorted(self.codes), dtype=str)}
+
+        for kind, grids in self.grids.items():
+            for key, grid in grids.items():
+                arrays['{}__{}__counts'.format(kind, key)] = grid.counts
+                arrays['{}__{}__num_outside'.format(kind, key)] = array(grid.num_outside)
+
+        # Write to a temporary file first so that an interrupted save never leaves a partial file
+        with open(filepath + '.tmp', 'wb') as f:
+            savez_compressed(f, **arrays)
+
+        replace(filepath + '.tmp', filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'DensityGrids':
+        with load(filepath) as archive:
+            grids = cls(float(archive['limit']), float(archive['voxel_size']))
+
+            if 'codes' in archive.files:  # Grids saved before codes were recorded
+                grids.codes = set(archive['codes'].tolist())
+
+            for name in archive.files:
+                if not name.endswith('__counts'):
+                    continue
+
+                kind, key, _ = name.split('__')
+                grid = grids.get_grid(kind, key)
+                grid.counts = archive[name].astype('<i8')
+                grid.num_outside = int(archive['{}__{}__num_outside'.format(kind, key)])
+
+        return grids
+
+
+def get_enclosing_level(density: array, fraction: float) -> float:
+    """ Return the density level above which the densest voxels together hold fraction of all points """
+
+    values = density.ravel()
+    values = values[values > 0]
+
+    if len(values) == 0:
+        return 0.0
+
+    values = -sort(-values)
+    cumulative = cumsum(values)
+    return float(values[min(searchsorted(cumulative, fraction * cumulative[-1]), len(values) - 1)])
+
+
+def build_grids(dataset, limit: float = DEFAULT_LIMIT, voxel_size: float = DEFAULT_VOXEL_SIZE) -> DensityGrids:
+    """ Accumulate grids from a BridgeDataset one memory mapped slice at a time """
+
+    grids = DensityGrids(limit, voxel_size)
+
+    for residue in dataset.residue_slices:
+        for coordinates in dataset.get_residue_coordinate_slices(residue):
+            grids.add_points(KIND_RESIDUES, residue, coordinates)
+
+    for group in dataset.get_groups():
+        grids.add_points(KIND_GROUPS, group, dataset.get_group_coordinates(group))
+
+    return grids
+
+
+def merge_grid_files(filepaths: List[str]) -> DensityGrids:
+    merged = DensityGrids.load(filepaths[0])
+
+    for filepath in filepaths[1:]:
+        merged.merge(DensityGrids.load(filepath))
+
+    return merged
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Merge voxel density grids built from separate shards')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_merge = subparsers.add_parser('merge', help='Sum shards of density grids into a single file')
+    parser_merge.add_argument('output')
+    parser_merge.add_argument('shards', nargs='+')
+
+    cli_args = parser.parse_args()
+
+    merged = merge_grid_files(cli_args.shards)
+    merged.save(cli_args.output)
+
+    for kind, grids in merged.grids.items():
+        for key, grid in grids.items():
+            sys.stdout.write('{:>10} {:>20} {:>10}\n'.format(kind, key, grid.num_points))
+
+if __name__ == '__main__':
+    main()
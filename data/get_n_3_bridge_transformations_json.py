@@ -1,262 +1,733 @@
-#!/usr/bin/env python3
-
-"""
-This script is a hack for getting 3-bridges from the following .csv:
-    -- low_redundancy_delimiter_list.csv
-The script was used to generate the following MongoDB database.collection:
-    -- ma.n_3_bridge_transformations
-And this database.collection pair was then mongoexported to the json file:
-    -- n_3_bridge_transformations.json
-"""
-
-import logging
-from itertools import groupby
-from typing import Union
-from re import findall, search
-from MetAromatic.core.pair import MetAromatic
-from numpy import array
-from pymongo import MongoClient
-from networkx import Graph, connected_components
-from transformer import Transformer
-
-LOW_REDUNDANCY_STRUCTURES_CSV = 'low_redundancy_delimiter_list.csv'
-MONGO_DATABASE = 'ma'
-MONGO_COLLECTION = 'n_3_bridge_transformations'
-MONGO_TCP_PORT = 27017
-MONGO_HOST = 'localhost'
-CUTOFF_ANGLE = 360.00
-CUTOFF_DISTANCE = 6.00
-CHAIN = 'A'
-MODEL = 'cp'
-VERTICES = 4
-EXIT_FAILURE = 1
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(levelname)s:%(name)s %(asctime)s %(message)s'
-)
-
-
-class CustomThreeBridgeGetter:
-
-    def __init__(self, code: str) -> None:
-
-        self.code = code
-        self.raw_coordinate_data = []
-        self.pairs = []
-        self.joined_pairs = set()
-        self.bridges = []
-
-    def run_met_aromatic(self) -> bool:
-
-        arguments = {
-            'cutoff_distance': CUTOFF_DISTANCE,
-            'cutoff_angle': CUTOFF_ANGLE,
-            'chain': CHAIN,
-            'model': MODEL
-        }
-
-        ma = MetAromatic(**arguments)
-        self.pairs = ma.get_met_aromatic_interactions(self.code)
-
-        if self.pairs['exit_code'] == EXIT_FAILURE:
-            return False
-
-        self.raw_coordinate_data.extend(ma.transport['met_coordinates'])
-        self.raw_coordinate_data.extend(ma.transport['phe_coordinates'])
-        self.raw_coordinate_data.extend(ma.transport['tyr_coordinates'])
-        self.raw_coordinate_data.extend(ma.transport['trp_coordinates'])
-
-        return True
-
-    def get_joined_pairs(self) -> bool:
-        for result in self.pairs['results']:
-            pair = (
-                '{}{}'.format(result['aromatic_residue'], result['aromatic_position']),
-                'MET{}'.format(result['methionine_position'])
-            )
-            self.joined_pairs.add(pair)
-
-    def get_bridges(self) -> bool:
-        graph = Graph()
-        graph.add_edges_from(self.joined_pairs)
-
-        components = list(connected_components(graph))
-
-        if not components:
-            return False
-
-        for bridge in components:
-            if len(bridge) == VERTICES:
-                self.bridges.append(bridge)
-
-        if not self.bridges:
-            return False
-
-        return True
-
-    def get_bridging_interactions(self) -> Union[bool, list]:
-
-        if not self.run_met_aromatic():
-            return False
-
-        self.get_joined_pairs()
-
-        if not self.get_bridges():
-            return False
-
-        return self.bridges
-
-
-class ThreeBridges:
-
-    def __init__(self, code: str) -> None:
-        self.code = code
-        self.raw_bridges = []
-        self.bridges_without_inverts = []
-        self.raw_coordinate_data = []
-        self.raw_coordinate_data_bridges = []
-        self.isolated_coordinates = []
-        self.tetrahedrons = []
-        self.transformations = []
-
-    def remove_inverse_bridges(self) -> None:
-        """ Remove bridges of form MET - ARO - MET - ARO """
-
-        for bridge in self.raw_bridges:
-            string = ''.join(bridge)
-            if len(findall('MET', string)) == 1:
-                self.bridges_without_inverts.append(bridge)
-
-    def cluster_bridge_data(self) -> None:
-        """ Get raw data corresponding only to bridges """
-
-        for bridge in self.bridges_without_inverts:
-            dict_bridge = {}
-
-            for residue in bridge:
-                position = search(r'\d+', residue).group(0)
-                dict_bridge[residue] = [row for row in self.raw_coordinate_data if row[5] == position]
-
-            self.raw_coordinate_data_bridges.append(dict_bridge)
-
-    def isolate_relevant_coordinates(self) -> None:
-        """ Get only the relevant coordinates needed for quaternion change of base """
-
-        for bridge in self.raw_coordinate_data_bridges:
-            list_bridge = []
-
-            for amino_acid in bridge:
-                for row in bridge.get(amino_acid):
-                    if row[3] == 'MET' and row[2] == 'SD':
-                        list_bridge.append(row)
-                    elif row[3] == 'MET' and row[2] == 'CG':
-                        list_bridge.append(row)
-                    elif row[3] == 'MET' and row[2] == 'CE':
-                        list_bridge.append(row)
-                    elif row[3] == 'PHE' and row[2] == 'CG':
-                        list_bridge.append(row)
-                    elif row[3] == 'PHE' and row[2] == 'CZ':
-                        list_bridge.append(row)
-                    elif row[3] == 'TYR' and row[2] == 'CG':
-                        list_bridge.append(row)
-                    elif row[3] == 'TYR' and row[2] == 'CZ':
-                        list_bridge.append(row)
-                    elif row[3] == 'TRP' and row[2] == 'CD2':
-                        list_bridge.append(row)
-                    elif row[3] == 'TRP' and row[2] == 'CH2':
-                        list_bridge.append(row)
-
-            self.isolated_coordinates.append(list_bridge)
-
-    def isolate_tetrahedrons(self) -> None:
-        """ Compute methionine / aromatic centroid tetrahedrons """
-
-        for bridge in self.isolated_coordinates:
-            tetrahedron = []
-
-            for key, residues in groupby(bridge, key=lambda x: x[5]):
-                list_residues = list(residues)
-
-                if list_residues[0][3] == 'MET':
-                    tetrahedron.append((
-                        'MET', key,
-                        array(list_residues[0][6:9]).astype(float),
-                        array(list_residues[1][6:9]).astype(float),
-                        array(list_residues[2][6:9]).astype(float)
-                    ))
-                else:
-                    aromatic = list_residues[0][3]
-                    coord_1 = array(list_residues[0][6:9]).astype(float)
-                    coord_2 = array(list_residues[1][6:9]).astype(float)
-                    tetrahedron.append((
-                        aromatic, key, 0.5 * (coord_1 + coord_2)
-                    ))
-
-            self.tetrahedrons.append(tetrahedron)
-
-    def transform_tetrahedrons(self) -> None:
-        """ Map the methionine / aromatic centroid tetrahedrons to origin """
-
-        for tetrahedron in self.tetrahedrons:
-            transformed = {}
-
-            for residue in tetrahedron:  # Transform the CG-SD-CE frame
-                if residue[0] == 'MET':
-                    transform = Transformer(*residue[2:5])
-                    methionine_base = [arr.tolist() for arr in transform.get_base()]
-                    transformed[''.join(residue[0:2])] = methionine_base
-
-            for residue in tetrahedron:  # Transform the satellite coordinates
-                if residue[0] != 'MET':
-                    transformed[''.join(residue[0:2])] = transform.rotate_satellite(residue[2]).tolist()
-
-            self.transformations.append(transformed)
-
-    def executor_main(self) -> Union[bool, list]:
-        bridge_getter = CustomThreeBridgeGetter(self.code)
-
-        self.raw_bridges = bridge_getter.get_bridging_interactions()
-        if not self.raw_bridges:
-            return False
-
-        self.remove_inverse_bridges()
-        if not self.bridges_without_inverts:
-            return False
-
-        self.raw_coordinate_data = bridge_getter.raw_coordinate_data
-        self.cluster_bridge_data()
-        self.isolate_relevant_coordinates()
-        self.isolate_tetrahedrons()
-        self.transform_tetrahedrons()
-
-        return self.transformations
-
-
-def main() -> None:
-    client = MongoClient(port=MONGO_TCP_PORT, host=MONGO_HOST)
-    logging.info('Will load data into MongoDB database: "%s" and collection: "%s"', MONGO_DATABASE, MONGO_COLLECTION)
-
-    with open(LOW_REDUNDANCY_STRUCTURES_CSV) as f:
-        codes = [line.strip('\n') for line in f]
-
-    for count, code in enumerate(codes, 1):
-        try:
-            getter = ThreeBridges(code)
-            transformations = getter.executor_main()
-
-            if not transformations:
-                logging.info('%i %s - No bridges', count, code)
-                continue
-
-            logging.info('%i %s - Found bridges', count, code)
-
-            for transformation in transformations:
-                transformation['code'] = code
-                client[MONGO_DATABASE][MONGO_COLLECTION].insert_one(transformation)
-
-        except Exception:
-            logging.exception('An exception has occurred:')
-
-if __name__ == '__main__':
-    main()
+#!/usr/bin/env python3
+
+"""
+This script is a hack for getting 3-bridges from the following .csv:
+    -- low_redundancy_delimiter_list.csv
+The script was used to generate the following MongoDB database.collection:
+    -- ma.n_3_bridge_transformations
+And this database.collection pair was then mongoexported to the json file:
+    -- n_3_bridge_transformations.json
+The --sink option can instead write NDJSON or compact binary columns directly
+to disk, skipping the mongoexport step, or only accumulate voxel density grids.
+"""
+
+import sys
+import logging
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from itertools import groupby
+from multiprocessing import Pool
+from traceback import format_exc
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from re import findall
+from numpy import array
+from networkx import Graph, connected_components
+from transformer import Transformer, CHECK_SAMPLED
+from manifest import RunManifest, STATUS_DONE, STATUS_NO_BRIDGES, STATUS_FAILED
+from sinks import Sink, MongoSink, NDJSONSink, ColumnarSink, DensitySink, DEFAULT_BATCH_SIZE
+from structure_cache import (
+    StructureCache, filter_results, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, TRANSPORT_KEYS, BACKEND_MET_AROMATIC, BACKEND_PAIR_KERNEL
+)
+from metrics import MetricsLog, run_stage, STAGE_TOTAL
+from columnar import get_document_id
+from dataset import parse_threshold
+from delta import get_mined_codes
+from pdb_parser import find_structure, get_transport, parse_structure
+from pair_kernel import get_pairs
+from prefetch import Prefetcher, iter_prefetched_codes, DEFAULT_URL, DEFAULT_MIRROR_DIR
+
+LOW_REDUNDANCY_STRUCTURES_CSV = 'low_redundancy_delimiter_list.csv'
+MANIFEST_FILENAME = 'n_3_bridge_transformations_manifest.jsonl'
+NDJSON_FILENAME = 'n_3_bridge_transformations.ndjson'
+COLUMNAR_DIRNAME = 'n_3_bridge_transformations.columns'
+DENSITY_FILENAME = 'n_3_bridge_density.npz'
+SINK_MONGO = 'mongo'
+SINK_NDJSON = 'ndjson'
+SINK_COLUMNAR = 'columnar'
+SINK_DENSITY = 'density'
+MONGO_DATABASE = 'ma'
+MONGO_COLLECTION = 'n_3_bridge_transformations'
+MONGO_TCP_PORT = 27017
+MONGO_HOST = 'localhost'
+CUTOFF_ANGLE = 360.00
+CUTOFF_DISTANCE = 6.00
+CHAIN = 'A'
+CHAIN_ALL = 'all'  # Keys structure cache entries holding every chain
+MODEL = 'cp'
+VERTICES = 4
+BRIDGE_ORDERS = [VERTICES - 1]
+TOPOLOGY_NORMAL = 'normal'
+TOPOLOGY_INVERSE = 'inverse'
+TRANSFORMER_CHECK = CHECK_SAMPLED
+EXIT_FAILURE = 1
+RELEVANT_ATOMS = {
+    'MET': ('CG', 'SD', 'CE'),
+    'PHE': ('CG', 'CZ'),
+    'TYR': ('CG', 'CZ'),
+    'TRP': ('CD2', 'CH2')
+}
+DEFAULT_WORKERS = 1
+DEFAULT_CHUNKSIZE = 16
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s:%(name)s %(asctime)s %(message)s'
+)
+
+
+class CustomThreeBridgeGetter:
+
+    def __init__(self, code: str, cache: Optional[StructureCache] = None,
+                 cutoff_distance: float = CUTOFF_DISTANCE, cutoff_angle: float = CUTOFF_ANGLE,
+                 orders: Optional[List[int]] = BRIDGE_ORDERS, timings: Optional[dict] = None,
+                 mirror_dir: Optional[str] = None, chain: Optional[str] = CHAIN) -> None:
+
+        self.code = code
+        self.cache = cache
+        self.mirror_dir = mirror_dir  # Structures found in this local mirror are not passed to MetAromatic
+        self.chain = chain  # Every chain of the first model is mined from a single parse if None, which requires the local mirror
+        self.cutoff_distance = cutoff_distance
+        self.cutoff_angle = cutoff_angle
+        self.orders = orders  # An n-bridge has n + 1 vertices. Keep every order if None
+        self.timings = timings  # Seconds spent in each stage. Nothing is timed if None
+        self.raw_coordinate_data = []
+        self.pairs = []
+        self.joined_pairs = set()
+        self.bridges = {}  # Chain -> bridges
+
+    def get_cache_chain(self) -> str:
+        return CHAIN_ALL if self.chain is None else self.chain
+
+    def get_parse_cutoffs(self) -> Tuple[float, float]:
+        """ Pairs are found and cached at the loosest cutoffs so that the cache also serves tighter runs """
+        return max(self.cutoff_distance, CUTOFF_DISTANCE), max(self.cutoff_angle, CUTOFF_ANGLE)
+
+    def parse_structure(self) -> dict:
+        from MetAromatic.core.pair import MetAromatic  # Only needed for structures missing from the mirror
+
+        cutoff_distance, cutoff_angle = self.get_parse_cutoffs()
+
+        arguments = {
+            'cutoff_distance': cutoff_distance,
+            'cutoff_angle': cutoff_angle,
+            'chain': self.chain,
+            'model': MODEL
+        }
+
+        ma = MetAromatic(**arguments)
+        pairs = ma.get_met_aromatic_interactions(self.code)
+
+        if pairs['exit_code'] == EXIT_FAILURE:
+            return pairs
+
+        pairs['transport'] = {key: ma.transport[key] for key in TRANSPORT_KEYS}
+
+        if self.cache is not None:  # Failures are not cached since they are often transient fetch errors
+            self.cache_pairs(pairs, BACKEND_MET_AROMATIC)
+
+        return dict(pairs, results=filter_results(pairs['results'], self.cutoff_distance, self.cutoff_angle))
+
+    def parse_local_structure(self, filepath: str) -> dict:
+        """ Parse a structure from the local mirror and find its pairs without MetAromatic """
+
+        atoms = parse_structure(filepath, self.chain)
+
+        pairs = {
+            'exit_code': 0,
+            'results': get_pairs(atoms, *self.get_parse_cutoffs()),
+            'transport': get_transport(atoms)
+        }
+
+        if self.cache is not None:
+            self.cache_pairs(pairs, BACKEND_PAIR_KERNEL)
+
+        return dict(pairs, results=filter_results(pairs['results'], self.cutoff_distance, self.cutoff_angle))
+
+    def cache_pairs(self, pairs: dict, backend: str) -> None:
+        self.cache.put(
+            self.code, self.get_cache_chain(), MODEL, *self.get_parse_cutoffs(),
+            pairs['exit_code'], pairs['results'], pairs['transport'], backend
+        )
+
+    def run_met_aromatic(self) -> bool:
+
+        self.pairs = None
+
+        # Structures in the mirror are always read through the pair kernel, so only its cache entries are used for them
+        filepath = None
+        if self.mirror_dir is not None:
+            filepath = find_structure(self.mirror_dir, self.code.strip())
+
+        if self.cache is not None:
+            self.pairs = run_stage(
+                self.timings, 'cache_lookup', self.cache.get,
+                self.code, self.get_cache_chain(), MODEL, self.cutoff_distance, self.cutoff_angle,
+                BACKEND_MET_AROMATIC if filepath is None else BACKEND_PAIR_KERNEL
+            )
+
+        if self.pairs is None and filepath is not None:
+            self.pairs = run_stage(self.timings, 'local_pairs', self.parse_local_structure, filepath)
+        elif self.pairs is None and self.chain is None:
+            raise FileNotFoundError('{} is not in the mirror. MetAromatic can only map a single chain'.format(self.code.strip()))
+        elif self.pairs is None:  # Fetching, parsing and the pair search all happen within MetAromatic
+            self.pairs = run_stage(self.timings, 'met_aromatic', self.parse_structure)
+
+        if self.pairs['exit_code'] == EXIT_FAILURE:
+            return False
+
+        for key in TRANSPORT_KEYS:
+            self.raw_coordinate_data.extend(self.pairs['transport'][key])
+
+        return True
+
+    def get_joined_pairs(self, cutoff_distance: Optional[float] = None, cutoff_angle: Optional[float] = None) -> None:
+        """ Optionally only join pairs which also satisfy tighter cutoffs than those passed to MetAromatic """
+
+        for result in self.pairs['results']:
+            if cutoff_distance is not None and result['norm'] > cutoff_distance:
+                continue
+
+            if cutoff_angle is not None and min(result['met_theta_angle'], result['met_phi_angle']) > cutoff_angle:
+                continue
+
+            pair = (
+                result.get('chain', self.chain),  # MetAromatic only returns pairs within the chain it was given
+                '{}{}'.format(result['aromatic_residue'], result['aromatic_position']),
+                'MET{}'.format(result['methionine_position'])
+            )
+            self.joined_pairs.add(pair)
+
+    def get_bridges(self) -> bool:
+        """ Bridges are the connected components of the pair graph. Nodes are keyed by chain as positions repeat across chains """
+
+        graph = Graph()
+        graph.add_edges_from(((chain, aromatic), (chain, methionine)) for chain, aromatic, methionine in self.joined_pairs)
+
+        components = list(connected_components(graph))
+
+        if not components:
+            return False
+
+        for component in components:
+            if self.orders is None or len(component) - 1 in self.orders:
+                chain = next(iter(component))[0]
+                self.bridges.setdefault(chain, []).append({residue for _, residue in component})
+
+        if not self.bridges:
+            return False
+
+        return True
+
+    def get_bridging_interactions(self) -> Union[bool, dict]:
+
+        if not self.run_met_aromatic():
+            return False
+
+        run_stage(self.timings, 'graph', self.get_joined_pairs)
+
+        if not run_stage(self.timings, 'graph', self.get_bridges):
+            return False
+
+        return self.bridges
+
+    def get_bridging_interactions_sweep(self, cutoffs: List[Tuple[float, float]]) -> Union[bool, dict]:
+        """
+        Derive the bridges for every (distance, angle) threshold from pairs computed
+        once at the loosest cutoffs, which must be passed to the constructor
+        """
+
+        if not self.run_met_aromatic():
+            return False
+
+        swept = {}
+
+        for cutoff_distance, cutoff_angle in cutoffs:
+            self.joined_pairs = set()
+            self.bridges = {}
+            run_stage(self.timings, 'graph', self.get_joined_pairs, cutoff_distance, cutoff_angle)
+
+            if run_stage(self.timings, 'graph', self.get_bridges):
+                swept[(cutoff_distance, cutoff_angle)] = self.bridges
+
+        return swept
+
+
+class ThreeBridges:
+
+    def __init__(self, code: str, cache: Optional[StructureCache] = None,
+                 cutoffs: Optional[List[Tuple[float, float]]] = None,
+                 orders: Optional[List[int]] = BRIDGE_ORDERS, include_inverse: bool = False,
+                 timings: Optional[dict] = None, mirror_dir: Optional[str] = None,
+                 chain: Optional[str] = CHAIN) -> None:
+        self.code = code
+        self.cache = cache
+        self.mirror_dir = mirror_dir
+        self.chain = chain  # Map the bridges of every chain, tagging each transformation with its chain, if None
+        self.cutoffs = cutoffs
+        self.orders = orders
+        self.include_inverse = include_inverse
+        self.timings = timings  # Seconds spent in each stage. Nothing is timed if None
+        self.raw_bridges = []
+        self.bridges_without_inverts = []
+        self.inverse_bridges = []
+        self.raw_coordinate_data = []
+        self.coordinate_index = {}
+        self.raw_coordinate_data_bridges = []
+        self.isolated_coordinates = []
+        self.tetrahedrons = []
+        self.transformations = []
+
+    def remove_inverse_bridges(self) -> None:
+        """ Separate out bridges of form MET - ARO - MET - ARO. These are only kept if include_inverse is set """
+
+        for bridge in self.raw_bridges:
+            string = ''.join(bridge)
+            if len(findall('MET', string)) == 1:
+                self.bridges_without_inverts.append(bridge)
+            elif self.include_inverse:
+                self.inverse_bridges.append(bridge)
+
+    def get_selected_bridges(self) -> list:
+        return self.bridges_without_inverts + self.inverse_bridges
+
+    def index_coordinate_data(self) -> None:
+        """ Map (chain, residue name, position) -> {atom name: row} once per structure """
+
+        for row in self.raw_coordinate_data:
+            self.coordinate_index.setdefault((row[4], row[3], row[5]), {}).setdefault(row[2], row)
+
+    def cluster_bridge_data(self) -> None:
+        """ Get raw data corresponding only to bridges """
+
+        for bridge in self.get_selected_bridges():
+            dict_bridge = {}
+
+            for residue in bridge:  # i.e. TYR68 -> ('TYR', '68')
+                dict_bridge[residue] = self.coordinate_index.get((self.chain, residue[:3], residue[3:]), {})
+
+            self.raw_coordinate_data_bridges.append(dict_bridge)
+
+    def isolate_relevant_coordinates(self) -> None:
+        """ Get only the relevant coordinates needed for quaternion change of base """
+
+        for bridge in self.raw_coordinate_data_bridges:
+            list_bridge = []
+
+            for amino_acid, atoms in bridge.items():
+                for atom in RELEVANT_ATOMS.get(amino_acid[:3], ()):
+                    if atom in atoms:
+                        list_bridge.append(atoms[atom])
+
+            self.isolated_coordinates.append(list_bridge)
+
+    def isolate_tetrahedrons(self) -> None:
+        """ Compute methionine / aromatic centroid tetrahedrons """
+
+        for bridge in self.isolated_coordinates:
+            tetrahedron = []
+
+            for key, residues in groupby(bridge, key=lambda x: x[5]):
+                list_residues = list(residues)
+
+                if list_residues[0][3] == 'MET':
+                    tetrahedron.append((
+                        'MET', key,
+                        array(list_residues[0][6:9]).astype(float),
+                        array(list_residues[1][6:9]).astype(float),
+                        array(list_residues[2][6:9]).astype(float)
+                    ))
+                else:
+                    aromatic = list_residues[0][3]
+                    coord_1 = array(list_residues[0][6:9]).astype(float)
+                    coord_2 = array(list_residues[1][6:9]).astype(float)
+                    tetrahedron.append((
+                        aromatic, key, 0.5 * (coord_1 + coord_2)
+                    ))
+
+            self.tetrahedrons.append(tetrahedron)
+
+    def transform_tetrahedrons(self) -> None:
+        """
+        Map the methionine / aromatic centroid tetrahedrons to origin. Inverse bridges
+        are mapped once into the frame of each of their methionines
+        """
+
+        for bridge, tetrahedron in zip(self.get_selected_bridges(), self.tetrahedrons):
+            satellites = [residue for residue in tetrahedron if residue[0] != 'MET']
+            topology = TOPOLOGY_INVERSE if len(findall('MET', ''.join(bridge))) > 1 else TOPOLOGY_NORMAL
+
+            for residue in tetrahedron:  # Transform the CG-SD-CE frame
+                if residue[0] != 'MET':
+                    continue
+
+                transformed = {}
+                transform = Transformer(*residue[2:5], check=TRANSFORMER_CHECK)
+                methionine_base = [arr.tolist() for arr in transform.get_base()]
+                transformed[''.join(residue[0:2])] = methionine_base
+
+                satellites_rotated = transform.rotate_satellites([satellite[2] for satellite in satellites])
+
+                for satellite, rotated in zip(satellites, satellites_rotated):  # Transform the satellite coordinates
+                    transformed[''.join(satellite[0:2])] = rotated.tolist()
+
+                transformed['order'] = len(bridge) - 1
+                transformed['topology'] = topology
+                self.transformations.append(transformed)
+
+    def transform_bridges(self) -> Union[bool, list]:
+        self.remove_inverse_bridges()
+        if not self.get_selected_bridges():
+            return False
+
+        run_stage(self.timings, 'cluster_bridge_data', self.cluster_bridge_data)
+        run_stage(self.timings, 'isolate_relevant_coordinates', self.isolate_relevant_coordinates)
+        run_stage(self.timings, 'isolate_tetrahedrons', self.isolate_tetrahedrons)
+        run_stage(self.timings, 'transform_tetrahedrons', self.transform_tetrahedrons)
+
+        return self.transformations
+
+    def transform_chains(self, chain_bridges: dict) -> Union[bool, list]:
+        """ Map the bridges of each chain. Every chain shares the coordinate index of the single parse """
+
+        if not self.coordinate_index:
+            run_stage(self.timings, 'index_coordinate_data', self.index_coordinate_data)
+
+        for chain, raw_bridges in sorted(chain_bridges.items()):
+            chain_bridge = ThreeBridges(
+                self.code, orders=self.orders, include_inverse=self.include_inverse, timings=self.timings, chain=chain
+            )
+            chain_bridge.raw_bridges = raw_bridges
+            chain_bridge.coordinate_index = self.coordinate_index
+
+            if not chain_bridge.transform_bridges():
+                continue
+
+            for transformation in chain_bridge.transformations:
+                if self.chain is None:
+                    transformation['chain'] = chain
+
+                self.transformations.append(transformation)
+
+        if not self.transformations:
+            return False
+
+        return self.transformations
+
+    def executor_sweep(self) -> Union[bool, list]:
+        """ Map bridges for every threshold in self.cutoffs from a single parse """
+
+        bridge_getter = CustomThreeBridgeGetter(
+            self.code, self.cache,
+            cutoff_distance=max(cutoff[0] for cutoff in self.cutoffs),
+            cutoff_angle=max(cutoff[1] for cutoff in self.cutoffs),
+            orders=self.orders,
+            timings=self.timings,
+            mirror_dir=self.mirror_dir,
+            chain=self.chain
+        )
+
+        swept = bridge_getter.get_bridging_interactions_sweep(self.cutoffs)
+        if not swept:
+            return False
+
+        # Every threshold shares the same structure so only index it once
+        self.raw_coordinate_data = bridge_getter.raw_coordinate_data
+        run_stage(self.timings, 'index_coordinate_data', self.index_coordinate_data)
+
+        for (cutoff_distance, cutoff_angle), chain_bridges in swept.items():
+            threshold = ThreeBridges(
+                self.code, orders=self.orders, include_inverse=self.include_inverse, timings=self.timings, chain=self.chain
+            )
+            threshold.coordinate_index = self.coordinate_index
+
+            if not threshold.transform_chains(chain_bridges):
+                continue
+
+            for transformation in threshold.transformations:
+                transformation['cutoff_distance'] = cutoff_distance
+                transformation['cutoff_angle'] = cutoff_angle
+                self.transformations.append(transformation)
+
+        if not self.transformations:
+            return False
+
+        return self.transformations
+
+    def executor_main(self) -> Union[bool, list]:
+        if self.cutoffs:
+            return self.executor_sweep()
+
+        bridge_getter = CustomThreeBridgeGetter(
+            self.code, self.cache, orders=self.orders, timings=self.timings, mirror_dir=self.mirror_dir, chain=self.chain
+        )
+
+        chain_bridges = bridge_getter.get_bridging_interactions()
+        if not chain_bridges:
+            return False
+
+        self.raw_coordinate_data = bridge_getter.raw_coordinate_data
+        return self.transform_chains(chain_bridges)
+
+
+def mine_code(code: str, cache: Optional[StructureCache] = None,
+              cutoffs: Optional[List[Tuple[float, float]]] = None,
+              orders: Optional[List[int]] = BRIDGE_ORDERS,
+              include_inverse: bool = False,
+              collect_timings: bool = False,
+              mirror_dir: Optional[str] = None,
+              chain: Optional[str] = CHAIN) -> Tuple[str, Union[bool, list], Optional[str], Optional[dict]]:
+    """ Worker entry point: run the full ThreeBridges pipeline on a single code, optionally timing each stage """
+
+    timings = {} if collect_timings else None
+
+    try:
+        bridges = ThreeBridges(code, cache, cutoffs, orders, include_inverse, timings, mirror_dir, chain)
+        return code, run_stage(timings, STAGE_TOTAL, bridges.executor_main), None, timings
+    except Exception:
+        return code, False, format_exc(), timings
+
+
+def warm_code(code: str, cache: StructureCache, cutoff_distance: float, cutoff_angle: float,
+              mirror_dir: Optional[str] = None, chain: Optional[str] = CHAIN) -> Tuple[str, bool, Optional[str]]:
+    """ Worker entry point: only parse a single code into the structure cache """
+
+    try:
+        getter = CustomThreeBridgeGetter(code, cache, cutoff_distance, cutoff_angle, mirror_dir=mirror_dir, chain=chain)
+        return code, getter.run_met_aromatic(), None
+    except Exception:
+        return code, False, format_exc()
+
+
+def run_workers(worker: Callable, codes: Iterable[str], workers: int, chunksize: int) -> Iterator[tuple]:
+    """ Yield worker results in input order, either serially or from a process pool """
+
+    if workers == 1:
+        yield from map(worker, codes)
+        return
+
+    with Pool(processes=workers) as pool:
+        yield from pool.imap(worker, codes, chunksize=chunksize)
+
+
+def warm_cache(codes: List[str], cache: StructureCache, workers: int, chunksize: int,
+               cutoffs: Optional[List[Tuple[float, float]]] = None, mirror_dir: Optional[str] = None,
+               chain: Optional[str] = CHAIN) -> None:
+    logging.info('Warming structure cache "%s" with %i codes', cache.cache_dir, len(codes))
+
+    # A sweep parses at its loosest thresholds so the cache must be keyed on these
+    cutoff_distance, cutoff_angle = CUTOFF_DISTANCE, CUTOFF_ANGLE
+    if cutoffs:
+        cutoff_distance = max(cutoff[0] for cutoff in cutoffs)
+        cutoff_angle = max(cutoff[1] for cutoff in cutoffs)
+
+    worker = partial(
+        warm_code, cache=cache, cutoff_distance=cutoff_distance, cutoff_angle=cutoff_angle, mirror_dir=mirror_dir, chain=chain
+    )
+
+    for count, (code, parsed, error) in enumerate(run_workers(worker, codes, workers, chunksize), 1):
+        if error is not None:
+            logging.error('%i %s - An exception has occurred:\n%s', count, code, error)
+        elif not parsed:
+            logging.info('%i %s - Could not parse', count, code)
+        else:
+            logging.info('%i %s - Cached', count, code)
+
+
+def get_sink(cli_args: Namespace) -> Sink:
+
+    if cli_args.sink == SINK_NDJSON:
+        filepath = cli_args.output or NDJSON_FILENAME
+        logging.info('Will write NDJSON data to file: "%s"', filepath)
+        return NDJSONSink(filepath, batch_size=cli_args.batch_size)
+
+    if cli_args.sink == SINK_COLUMNAR:
+        dirpath = cli_args.output or COLUMNAR_DIRNAME
+        logging.info('Will write columnar data to directory: "%s"', dirpath)
+        return ColumnarSink(dirpath, batch_size=cli_args.batch_size)
+
+    if cli_args.sink == SINK_DENSITY:
+        filepath = cli_args.output or DENSITY_FILENAME
+        logging.info('Will accumulate density grids into file: "%s"', filepath)
+        return DensitySink(filepath, batch_size=cli_args.batch_size)
+
+    from pymongo import MongoClient
+
+    client = MongoClient(port=MONGO_TCP_PORT, host=MONGO_HOST)
+    logging.info('Will load data into MongoDB database: "%s" and collection: "%s"', MONGO_DATABASE, MONGO_COLLECTION)
+    return MongoSink(client[MONGO_DATABASE][MONGO_COLLECTION], batch_size=cli_args.batch_size)
+
+
+def get_command_line_arguments(argv: Optional[List[str]] = None) -> Namespace:
+    parser = ArgumentParser()
+    parser.add_argument('--codes', default=LOW_REDUNDANCY_STRUCTURES_CSV, help='File listing the codes to mine, one per line')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='Number of codes sent to a worker at a time')
+    parser.add_argument('--manifest', default=MANIFEST_FILENAME, help='Path to the run manifest used for resuming runs')
+    parser.add_argument('--retry-failed', action='store_true', help='Only rerun codes that raised an exception in a previous run')
+    parser.add_argument('--exclude-store', metavar='DIR', help='Skip codes that already have bridges in this columnar store')
+    parser.add_argument('--sink', choices=[SINK_MONGO, SINK_NDJSON, SINK_COLUMNAR, SINK_DENSITY], default=SINK_MONGO, help='Where to write transformations')
+    parser.add_argument('--output', help='Output file or directory for the ndjson, columnar and density sinks')
+    parser.add_argument('--metrics', metavar='FILE', help='Append per stage timings and throughput to this JSON lines file')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of documents written per batch')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for caching parsed structures')
+    parser.add_argument('--cache-max-bytes', type=int, default=DEFAULT_MAX_BYTES, help='Evict cached structures past this size')
+    parser.add_argument('--no-cache', action='store_true', help='Always fetch and parse structures')
+    parser.add_argument('--warm-cache', action='store_true', help='Only parse all codes into the structure cache then exit')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='N', help='Keep N structure downloads into the mirror in flight ahead of the workers')
+    parser.add_argument('--mirror', help='Parse structures found in this local mirror and find their pairs without MetAromatic')
+    parser.add_argument('--prefetch-url', default=DEFAULT_URL, help='URL template of prefetched files, formatted with the lower case {code}')
+    parser.add_argument(
+        '--all-chains', action='store_true',
+        help='Mine every chain from a single parse of each structure. Transformations are tagged with chain. Requires --mirror or --prefetch'
+    )
+    parser.add_argument(
+        '--sweep', type=parse_threshold, nargs='+', metavar='DISTANCE[:ANGLE]',
+        help='Mine every threshold from a single pass. Transformations are tagged with cutoff_distance and cutoff_angle'
+    )
+    parser.add_argument('--orders', type=int, nargs='+', default=BRIDGE_ORDERS, metavar='N', help='Bridge orders (n-bridges) to mine')
+    parser.add_argument('--all-orders', action='store_true', help='Mine bridges of every order')
+    parser.add_argument('--inverse', action='store_true', help='Also map inverse (MET - ARO - MET) bridges')
+    cli_args = parser.parse_args(argv)
+
+    if cli_args.all_chains and not (cli_args.mirror or cli_args.prefetch > 0):
+        parser.error('--all-chains requires --mirror or --prefetch since MetAromatic maps a single chain')
+
+    if cli_args.sink == SINK_DENSITY and cli_args.sweep and len(set(cli_args.sweep)) > 1:
+        parser.error('--sink density would pool the bridges of every threshold into the same grids')
+
+    return cli_args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    cli_args = get_command_line_arguments(argv)
+
+    with open(cli_args.codes) as f:
+        codes = [line.strip('\n') for line in f]
+
+    if cli_args.exclude_store:
+        mined_codes = get_mined_codes(cli_args.exclude_store)
+        codes = [code for code in codes if code not in mined_codes]
+        logging.info('Skipping %i codes found in store %s', len(mined_codes), cli_args.exclude_store)
+
+    counts = {code: count for count, code in enumerate(codes, 1)}
+
+    # Prefetched structures land in a mirror which the workers then read from
+    if cli_args.prefetch > 0 and cli_args.mirror is None:
+        cli_args.mirror = DEFAULT_MIRROR_DIR
+
+    chain = None if cli_args.all_chains else CHAIN
+
+    cache = None
+    if not cli_args.no_cache:
+        cache = StructureCache(cli_args.cache_dir, cli_args.cache_max_bytes)
+
+    if cli_args.warm_cache:
+        if cache is None:
+            logging.error('Cannot warm the structure cache when --no-cache is passed')
+            sys.exit(EXIT_FAILURE)
+
+        warm_cache(codes, cache, cli_args.workers, cli_args.chunksize, cli_args.sweep, cli_args.mirror, chain)
+        return
+
+    with RunManifest(cli_args.manifest) as manifest, get_sink(cli_args) as sink:
+        # A crash between a sink flush and the manifest leaves codes that the sink has committed but are not done
+        for code in manifest.get_pending_codes([code for code in codes if code in sink.committed_codes]):
+            manifest.record(code, STATUS_DONE)
+
+        if cli_args.retry_failed:
+            codes = manifest.get_failed_codes(codes)
+            logging.info('Retrying %i failed codes', len(codes))
+        else:
+            logging.info('Skipping %i codes finished by previous runs', len(codes) - len(manifest.get_pending_codes(codes)))
+            codes = manifest.get_pending_codes(codes)
+
+        logging.info('Mining %i codes using %i worker(s)', len(codes), cli_args.workers)
+
+        if cli_args.mirror:
+            logging.info('Reading structures found in mirror "%s"', cli_args.mirror)
+
+        # Codes are only marked as done once the sink has flushed their documents
+        unflushed_codes = []
+
+        if cli_args.sweep:
+            logging.info('Sweeping thresholds: %s', ', '.join('{}:{}'.format(*cutoff) for cutoff in cli_args.sweep))
+
+        logging.info('Mining chain: %s', 'all' if chain is None else chain)
+
+        orders = None if cli_args.all_orders else cli_args.orders
+        logging.info('Mining bridge orders: %s', 'all' if orders is None else ', '.join(map(str, orders)))
+
+        metrics = None
+        if cli_args.metrics:
+            logging.info('Will write metrics to file: "%s"', cli_args.metrics)
+            metrics = MetricsLog(cli_args.metrics, len(codes))
+            sink.metrics = metrics
+
+        worker = partial(
+            mine_code, cache=cache, cutoffs=cli_args.sweep, orders=orders, include_inverse=cli_args.inverse,
+            collect_timings=metrics is not None, mirror_dir=cli_args.mirror, chain=chain
+        )
+
+        # Codes are handed to the workers as soon as their structure file is in the mirror
+        worker_codes = codes
+        prefetcher = None
+        if cli_args.prefetch > 0:
+            logging.info('Prefetching structures into mirror "%s" using %i connection(s)', cli_args.mirror, cli_args.prefetch)
+
+            # Pool.imap takes codes as fast as they are yielded, so the window only moves as results come back. The
+            # pool only dispatches whole chunks so the window must hold at least one chunk per worker
+            prefetcher = Prefetcher(
+                codes, cli_args.mirror, cli_args.prefetch_url, cli_args.prefetch,
+                max_ahead=max(4 * cli_args.prefetch, cli_args.workers * cli_args.chunksize), manual_release=True
+            )
+            worker_codes = iter_prefetched_codes(prefetcher)
+
+        for code, transformations, error, timings in run_workers(worker, worker_codes, cli_args.workers, cli_args.chunksize):
+            count = counts[code]
+
+            if prefetcher is not None:
+                prefetcher.release()
+
+            if error is not None:
+                logging.error('%i %s - An exception has occurred:\n%s', count, code, error)
+                manifest.record(code, STATUS_FAILED, error)
+
+                if metrics is not None:
+                    metrics.record_code(code, STATUS_FAILED, timings)
+                continue
+
+            if not transformations:
+                logging.info('%i %s - No bridges', count, code)
+                manifest.record(code, STATUS_NO_BRIDGES)
+
+                if metrics is not None:
+                    metrics.record_code(code, STATUS_NO_BRIDGES, timings)
+                continue
+
+            logging.info('%i %s - Found bridges', count, code)
+
+            if metrics is not None:
+                metrics.record_code(code, STATUS_DONE, timings)
+
+            for transformation in transformations:
+                transformation['code'] = code
+                transformation['_id'] = get_document_id(transformation)
+                sink.write(transformation)
+
+            unflushed_codes.append(code)
+
+            if sink.needs_flush():
+                sink.flush()
+                for unflushed_code in unflushed_codes:
+                    manifest.record(unflushed_code, STATUS_DONE)
+                unflushed_codes = []
+
+        sink.flush()
+        for unflushed_code in unflushed_codes:
+            manifest.record(unflushed_code, STATUS_DONE)
+
+        if metrics is not None:
+            metrics.close()
+
+if __name__ == '__main__':
+    main()
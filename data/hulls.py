@@ -0,0 +1,180 @@
+"""
+Convex hulls of mapped aromatic centroids. A hull is summarized by:
+    -- vertices:   (n, 3) coordinates of the points on the hull
+    -- facets:     (m, 3) triangles indexing into the vertices
+    -- volume:     enclosed volume in cubic angstroms
+    -- area:       surface area in square angstroms
+    -- num_points: number of points the hull was computed over
+Points can be added in batches. Only the hull vertices of each batch can lie on
+the final hull so every batch is reduced to these before being merged in.
+
+Summaries are cached on disk keyed by a hash of the input coordinates:
+
+    <cache_dir>/<sha256>.npz
+"""
+
+from hashlib import sha256
+from os import path, makedirs, replace
+from typing import Iterable, Optional
+from numpy import array, arange, ascontiguousarray, concatenate, empty, full, load, savez_compressed
+from scipy.spatial import ConvexHull, QhullError
+
+DEFAULT_CACHE_DIR = path.join(path.dirname(path.abspath(__file__)), 'hull_cache')
+HULL_VERSION = 1
+MIN_HULL_POINTS = 4
+
+
+def get_extreme_points(points: array) -> array:
+    """ Reduce a batch of points to its own hull vertices, or return it whole if degenerate """
+
+    if len(points) < MIN_HULL_POINTS:
+        return points
+
+    try:
+        return points[ConvexHull(points).vertices]
+    except QhullError:  # All points are coplanar or collinear
+        return points
+
+
+class IncrementalHull:
+
+    def __init__(self) -> None:
+        self.hull: Optional[ConvexHull] = None
+        self.pending = empty((0, 3))  # Points held back until they span a volume
+        self.num_points = 0
+
+    @classmethod
+    def from_summary(cls, summary: dict) -> 'IncrementalHull':
+        """ Resume from a previously computed summary so that new points can be merged in """
+
+        hull = cls()
+        hull.add_points(summary['vertices'])
+        hull.num_points = summary['num_points']
+        return hull
+
+    def add_points(self, points: array) -> None:
+        points = ascontiguousarray(points, dtype='<f8').reshape(-1, 3)
+
+        if len(points) == 0:
+            return
+
+        self.num_points += len(points)
+        points = get_extreme_points(points)
+
+        if self.hull is not None:
+            self.hull.add_points(points)
+            return
+
+        self.pending = concatenate([self.pending, points])
+
+        if len(self.pending) < MIN_HULL_POINTS:
+            return
+
+        try:
+            self.hull = ConvexHull(self.pending, incremental=True)
+        except QhullError:
+            return
+
+        self.pending = empty((0, 3))
+
+    def get_summary(self) -> dict:
+        if self.hull is None:
+            return {
+                'vertices': self.pending.copy(),
+                'facets': empty((0, 3), dtype='<i4'),
+                'volume': 0.0,
+                'area': 0.0,
+                'num_points': self.num_points
+            }
+
+        # Facets index into every point seen so far. Remap them to index into the vertices
+        vertex_index = full(len(self.hull.points), -1, dtype='<i4')
+        vertex_index[self.hull.vertices] = arange(len(self.hull.vertices))
+
+        return {
+            'vertices': self.hull.points[self.hull.vertices],
+            'facets': vertex_index[self.hull.simplices],
+            'volume': float(self.hull.volume),
+            'area': float(self.hull.area),
+            'num_points': self.num_points
+        }
+
+    def close(self) -> None:
+        if self.hull is not None:
+            self.hull.close()
+
+
+def get_data_hash(batches: Iterable[array]) -> str:
+    """ Hash a sequence of (n, 3) coordinate arrays without concatenating them """
+
+    digest = sha256('hulls-v{}'.format(HULL_VERSION).encode())
+
+    for points in batches:
+        points = ascontiguousarray(points, dtype='<f8').reshape(-1, 3)
+        digest.update(str(len(points)).encode())
+        digest.update(points.tobytes())
+
+    return digest.hexdigest()
+
+
+class HullCache:
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR) -> None:
+        self.cache_dir = cache_dir
+        makedirs(self.cache_dir, exist_ok=True)
+
+    def get_filepath(self, key: str) -> str:
+        return path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key: str) -> Optional[dict]:
+        filepath = self.get_filepath(key)
+
+        if not path.exists(filepath):
+            return None
+
+        try:
+            with load(filepath) as archive:
+                return {
+                    'vertices': archive['vertices'],
+                    'facets': archive['facets'],
+                    'volume': float(archive['volume']),
+                    'area': float(archive['area']),
+                    'num_points': int(archive['num_points'])
+                }
+        except (OSError, ValueError, KeyError):  # Treat a corrupt or partial entry as a miss
+            return None
+
+    def put(self, key: str, summary: dict) -> None:
+        filepath = self.get_filepath(key)
+        tmp_filepath = filepath + '.tmp'
+
+        with open(tmp_filepath, 'wb') as f:
+            savez_compressed(f, **{name: array(value) for name, value in summary.items()})
+
+        replace(tmp_filepath, filepath)
+
+
+def get_hull(batches: list, cache: Optional[HullCache] = None) -> dict:
+    """ Compute the hull summary over a list of (n, 3) coordinate arrays, reusing a cached summary if any """
+
+    key = None
+
+    if cache is not None:
+        key = get_data_hash(batches)
+        summary = cache.get(key)
+
+        if summary is not None:
+            return summary
+
+    hull = IncrementalHull()
+
+    for points in batches:
+        hull.add_points(points)
+
+    summary = hull.get_summary()
+    hull.close()
+
+    if cache is not None:
+        cache.put(key, summary)
+
+    return summary
@@ -0,0 +1,77 @@
+"""
+Append-only record of per-code outcomes for a mining run. Every processed
+code is written out as a single JSON line so that a crashed or killed run can
+be resumed without re-mining finished codes:
+    {"code": "8I1B", "status": "done", "error": null}
+If a code appears more than once then the last line wins.
+"""
+
+from json import dumps, loads
+from os import path
+from typing import Dict, List, Optional
+
+STATUS_DONE = 'done'
+STATUS_NO_BRIDGES = 'no_bridges'
+STATUS_FAILED = 'failed'
+
+
+class RunManifest:
+
+    def __init__(self, filepath: str) -> None:
+        self.filepath = filepath
+        self.statuses: Dict[str, dict] = {}
+
+        if path.exists(self.filepath):
+            self.load()
+
+        self.handle = open(self.filepath, 'a')
+
+    def __enter__(self) -> 'RunManifest':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def load(self) -> None:
+        """ Read back the status of every code seen by previous runs """
+
+        with open(self.filepath) as f:
+            for line in f:
+                line = line.strip()
+
+                if not line:
+                    continue
+
+                try:
+                    record = loads(line)
+                except ValueError:  # A run killed mid-write can leave a truncated last line
+                    continue
+
+                self.statuses[record['code']] = record
+
+    def record(self, code: str, status: str, error: Optional[str] = None) -> None:
+        """ Persist the outcome for a code. Flush immediately to survive a crash """
+
+        record = {'code': code, 'status': status, 'error': error}
+        self.statuses[code] = record
+        self.handle.write(dumps(record) + '\n')
+        self.handle.flush()
+
+    def get_status(self, code: str) -> Optional[str]:
+        record = self.statuses.get(code)
+
+        if record is None:
+            return None
+
+        return record['status']
+
+    def get_pending_codes(self, codes: List[str]) -> List[str]:
+        """ Return the codes that no previous run has finished """
+        return [code for code in codes if code not in self.statuses]
+
+    def get_failed_codes(self, codes: List[str]) -> List[str]:
+        """ Return the codes that raised an exception during a previous run """
+        return [code for code in codes if self.get_status(code) == STATUS_FAILED]
+
+    def close(self) -> None:
+        self.handle.close()
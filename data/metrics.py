@@ -0,0 +1,133 @@
+"""
+Timing and throughput metrics for mining runs. Workers time each stage of the
+pipeline into a dict of per stage seconds which is sent back alongside the
+transformations of a code. The main process writes one JSON line per event:
+
+    {"event": "code", "code": "1ABC", "stages": {"met_aromatic": 0.41, ...}, "rate": 2.3, "eta": 1320.5, ...}
+    {"event": "sink", "documents": 500, "seconds": 0.08, ...}
+    {"event": "summary", "stages": {"met_aromatic": {"p50": 0.39, "p95": 0.92, "p99": 1.31, ...}, ...}, ...}
+
+Rates are rolling over the most recent codes and the ETA assumes the
+remaining codes are mined at this rate. When metrics are disabled, timings
+are None and stages are called directly, so nothing is timed or stored.
+"""
+
+import logging
+from collections import deque
+from json import dumps
+from time import perf_counter, time
+from typing import Callable, Dict, List, Optional
+from numpy import percentile
+
+DEFAULT_WINDOW = 100
+PERCENTILES = (50, 95, 99)
+STAGE_TOTAL = 'total'
+STAGE_SINK = 'sink'
+
+
+def run_stage(timings: Optional[Dict[str, float]], stage: str, function: Callable, *args):
+    """ Call function, adding its duration to timings[stage] unless timings is None """
+
+    if timings is None:
+        return function(*args)
+
+    start = perf_counter()
+
+    try:
+        return function(*args)
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + perf_counter() - start
+
+
+def get_percentiles(values: List[float]) -> dict:
+    summary = {'count': len(values), 'total': sum(values), 'mean': sum(values) / len(values) if values else 0.0}
+
+    for q, value in zip(PERCENTILES, percentile(values, PERCENTILES) if values else [0.0] * len(PERCENTILES)):
+        summary['p{}'.format(q)] = float(value)
+
+    return summary
+
+
+class MetricsLog:
+
+    def __init__(self, filepath: str, num_codes: int, window: int = DEFAULT_WINDOW) -> None:
+        self.filepath = filepath
+        self.num_codes = num_codes
+        self.num_done = 0
+        self.start = perf_counter()
+        self.finish_times = deque(maxlen=window)
+        self.stages: Dict[str, List[float]] = {}
+        self.sink_batches: List[float] = []
+        self.num_documents = 0
+        self.handle = open(filepath, 'a')
+
+    def __enter__(self) -> 'MetricsLog':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write_event(self, event: str, **fields) -> None:
+        self.handle.write(dumps({'event': event, 'time': time(), **fields}) + '\n')
+
+    def get_rate(self) -> float:
+        """ Codes per second over the rolling window, or since the start if only one code is in the window """
+
+        if len(self.finish_times) > 1 and self.finish_times[-1] > self.finish_times[0]:
+            return (len(self.finish_times) - 1) / (self.finish_times[-1] - self.finish_times[0])
+
+        elapsed = perf_counter() - self.start
+        return self.num_done / elapsed if elapsed > 0 else 0.0
+
+    def get_eta(self) -> Optional[float]:
+        rate = self.get_rate()
+        return (self.num_codes - self.num_done) / rate if rate > 0 else None
+
+    def record_code(self, code: str, status: str, timings: Optional[Dict[str, float]]) -> None:
+        self.num_done += 1
+        self.finish_times.append(perf_counter())
+
+        timings = timings or {}
+        for stage, seconds in timings.items():
+            self.stages.setdefault(stage, []).append(seconds)
+
+        self.write_event(
+            'code', code=code, status=status, done=self.num_done, total=self.num_codes,
+            stages=timings, rate=self.get_rate(), eta=self.get_eta()
+        )
+
+    def record_sink(self, num_documents: int, seconds: float) -> None:
+        self.sink_batches.append(seconds)
+        self.num_documents += num_documents
+        self.write_event('sink', documents=num_documents, seconds=seconds)
+
+    def get_summary(self) -> dict:
+        elapsed = perf_counter() - self.start
+        stages = {stage: get_percentiles(values) for stage, values in self.stages.items()}
+
+        if self.sink_batches:
+            stages[STAGE_SINK] = get_percentiles(self.sink_batches)
+
+        return {
+            'codes': self.num_done,
+            'documents': self.num_documents,
+            'elapsed': elapsed,
+            'rate': self.num_done / elapsed if elapsed > 0 else 0.0,
+            'stages': stages
+        }
+
+    def close(self) -> None:
+        if self.handle.closed:
+            return
+
+        summary = self.get_summary()
+        self.write_event('summary', **summary)
+        self.handle.close()
+
+        logging.info('Mined %i codes in %.1f s (%.2f codes/s)', summary['codes'], summary['elapsed'], summary['rate'])
+        logging.info('{:>28} {:>10} {:>10} {:>10} {:>12}'.format('Stage', 'p50', 'p95', 'p99', 'Total'))
+
+        for stage, stats in summary['stages'].items():
+            logging.info('{:>28} {:>10.4f} {:>10.4f} {:>10.4f} {:>12.2f}'.format(
+                stage, stats['p50'], stats['p95'], stats['p99'], stats['total']
+            ))
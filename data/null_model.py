@@ -0,0 +1,223 @@
+"""
+Null model for the distribution of 3-bridge aromatic permutations. Under the
+null, the three aromatics of a bridge are independent draws using the observed
+PHE, TYR and TRP frequencies, so a permutation such as PHEPHETYR is expected
+with the multinomial probability:
+
+    3! / (2! 1! 0!) * p(PHE) ** 2 * p(TYR)
+
+These probabilities are normalized over the permutations being counted, so
+that the expected counts and the simulated null share the same probabilities.
+Two sets of replicates are run as batched NumPy operations:
+    -- null:      permutation counts of N bridges drawn under the null model
+    -- bootstrap: observed permutation counts after resampling PDB codes
+Replicates are reduced to per permutation histograms of counts as they are
+drawn so that any number of replicates runs in constant memory. Results are
+cached on disk keyed by a hash of the per code counts and the settings.
+"""
+
+from hashlib import sha256
+from json import dumps, load
+from math import factorial
+from os import path, makedirs, replace
+from typing import Dict, List, Optional, Tuple
+from numpy import arange, array, bincount, concatenate, full, prod, searchsorted, unique, zeros
+from numpy.random import default_rng
+
+DEFAULT_CACHE_DIR = path.join(path.dirname(path.abspath(__file__)), 'null_model_cache')
+DEFAULT_NULL_REPLICATES = 1000000
+DEFAULT_BOOTSTRAP_REPLICATES = 10000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+BATCH_ELEMENTS = 2 ** 22  # Bounds the size of the replicate arrays held at any one time
+NULL_MODEL_VERSION = 2
+AROMATICS = ('PHE', 'TYR', 'TRP')
+RESIDUE_NAME_LENGTH = 3
+
+
+def split_group(group: str) -> List[str]:
+    """ i.e. PHETYRTYR -> ['PHE', 'TYR', 'TYR'] """
+    return [group[u:u + RESIDUE_NAME_LENGTH] for u in range(0, len(group), RESIDUE_NAME_LENGTH)]
+
+
+def get_code_group_counts(dataset, groups: List[str]) -> Tuple[List[str], array]:
+    """ Return the PDB codes of a BridgeDataset and a (codes, groups) matrix of bridge counts """
+
+    bridge_codes, bridge_groups = [], []
+
+    for column, group in enumerate(groups):
+        start, end = dataset.groups[group]['bridges']
+        bridge_codes.append(dataset.columns['bridge_code'][start:end])
+        bridge_groups.append(full(end - start, column))
+
+    if not bridge_codes:
+        return [], zeros((0, len(groups)), dtype='<i8')
+
+    codes, code_index = unique(concatenate(bridge_codes), return_inverse=True)
+    bridge_groups = concatenate(bridge_groups)
+
+    flat_counts = bincount(code_index * len(groups) + bridge_groups, minlength=len(codes) * len(groups))
+    return [code.decode() for code in codes.tolist()], flat_counts.reshape(len(codes), len(groups))
+
+
+def get_aromatic_frequencies(group_counts: array, groups: List[str]) -> array:
+    """ The fraction of all aromatics in all bridges that are PHE, TYR and TRP """
+
+    composition = array([[split_group(group).count(aromatic) for aromatic in AROMATICS] for group in groups])
+    totals = group_counts @ composition
+    return totals / totals.sum()
+
+
+def get_group_probabilities(frequencies: array, groups: List[str]) -> array:
+    probabilities = []
+
+    for group in groups:
+        residues = split_group(group)
+        multiplicities = [residues.count(aromatic) for aromatic in AROMATICS]
+
+        coefficient = factorial(len(residues))
+        for multiplicity in multiplicities:
+            coefficient //= factorial(multiplicity)
+
+        probabilities.append(coefficient * prod(frequencies ** array(multiplicities)))
+
+    return array(probabilities)
+
+
+def normalize(probabilities: array) -> array:
+    """ Condition the multinomial probabilities on the permutations being counted """
+    return probabilities / probabilities.sum()
+
+
+def simulate_null(num_bridges: int, probabilities: array, replicates: int, rng) -> array:
+    """ Return (groups, num_bridges + 1) histograms of permutation counts under the null, given normalized probabilities """
+
+    histograms = zeros((len(probabilities), num_bridges + 1), dtype='<i8')
+    batch_size = max(1, BATCH_ELEMENTS // len(probabilities))
+
+    for start in range(0, replicates, batch_size):
+        counts = rng.multinomial(num_bridges, probabilities, size=min(batch_size, replicates - start))
+        add_to_histograms(histograms, counts)
+
+    return histograms
+
+
+def bootstrap_counts(code_counts: array, replicates: int, rng) -> array:
+    """ Return (groups, max count + 1) histograms of permutation counts over codes resampled with replacement """
+
+    num_codes, num_groups = code_counts.shape
+    # A group can at most be counted num_codes times its largest count in any one code
+    histograms = zeros((num_groups, int(code_counts.max(initial=0)) * num_codes + 1), dtype='<i8')
+    batch_size = max(1, BATCH_ELEMENTS // max(num_codes, 1))
+    code_counts = code_counts.astype('<f8')  # Float products go through BLAS and are exact for these magnitudes
+
+    for start in range(0, replicates, batch_size):
+        num_replicates = min(batch_size, replicates - start)
+
+        # Row r holds how many times each code is drawn in replicate r. Much faster than rng.multinomial
+        draws = rng.integers(0, num_codes, size=(num_replicates, num_codes)) + arange(num_replicates)[:, None] * num_codes
+        weights = bincount(draws.ravel(), minlength=num_replicates * num_codes).reshape(num_replicates, num_codes)
+
+        add_to_histograms(histograms, (weights @ code_counts).round().astype('<i8'))
+
+    return trim_histograms(histograms)
+
+
+def add_to_histograms(histograms: array, counts: array) -> None:
+    """ Add a (replicates, groups) batch of counts to per group histograms """
+
+    num_groups, num_bins = histograms.shape
+    flat_indices = counts + arange(num_groups) * num_bins
+    histograms += bincount(flat_indices.ravel(), minlength=histograms.size).reshape(histograms.shape)
+
+
+def trim_histograms(histograms: array) -> array:
+    nonzero = histograms.any(axis=0).nonzero()[0]
+    return histograms[:, :nonzero[-1] + 1] if len(nonzero) else histograms[:, :1]
+
+
+def get_percentiles(histograms: array, quantile: float) -> array:
+    """ The smallest count at or below which quantile of the replicates of each group fall """
+
+    cumulative = histograms.cumsum(axis=1)
+    return array([searchsorted(row, quantile * row[-1]) for row in cumulative])
+
+
+def get_means(histograms: array) -> array:
+    return (histograms * arange(histograms.shape[1])).sum(axis=1) / histograms.sum(axis=1)
+
+
+def get_data_hash(code_counts: array, groups: List[str], settings: dict) -> str:
+    digest = sha256('null-model-v{}'.format(NULL_MODEL_VERSION).encode())
+    digest.update(dumps([groups, settings], sort_keys=True).encode())
+    digest.update(str(code_counts.shape).encode())
+    digest.update(code_counts.astype('<i8').tobytes())
+    return digest.hexdigest()
+
+
+def compute_statistics(code_counts: array, groups: List[str],
+                       null_replicates: int = DEFAULT_NULL_REPLICATES,
+                       bootstrap_replicates: int = DEFAULT_BOOTSTRAP_REPLICATES,
+                       confidence: float = DEFAULT_CONFIDENCE,
+                       seed: int = DEFAULT_SEED,
+                       cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> Dict[str, dict]:
+    """
+    Return per group observed and expected counts, the central confidence
+    interval of counts under the null and the bootstrap confidence interval
+    of the observed counts
+    """
+
+    if null_replicates < 1 or bootstrap_replicates < 1:
+        raise ValueError('At least one null and one bootstrap replicate is required')
+
+    settings = {
+        'null_replicates': null_replicates,
+        'bootstrap_replicates': bootstrap_replicates,
+        'confidence': confidence,
+        'seed': seed
+    }
+
+    filepath = None
+
+    if cache_dir is not None:
+        makedirs(cache_dir, exist_ok=True)
+        filepath = path.join(cache_dir, get_data_hash(code_counts, groups, settings) + '.json')
+
+        if path.exists(filepath):
+            with open(filepath) as f:
+                return load(f)
+
+    rng = default_rng(seed)
+    group_counts = code_counts.sum(axis=0)
+    num_bridges = int(group_counts.sum())
+
+    probabilities = normalize(get_group_probabilities(get_aromatic_frequencies(group_counts, groups), groups))
+    null_histograms = simulate_null(num_bridges, probabilities, null_replicates, rng)
+    bootstrap_histograms = bootstrap_counts(code_counts, bootstrap_replicates, rng)
+
+    tail = (1 - confidence) / 2
+    null_means = get_means(null_histograms)
+    null_lower, null_upper = get_percentiles(null_histograms, tail), get_percentiles(null_histograms, 1 - tail)
+    observed_lower = get_percentiles(bootstrap_histograms, tail)
+    observed_upper = get_percentiles(bootstrap_histograms, 1 - tail)
+
+    statistics = {}
+
+    for u, group in enumerate(groups):
+        statistics[group] = {
+            'observed': int(group_counts[u]),
+            'expected': float(num_bridges * probabilities[u]),
+            'null_mean': float(null_means[u]),
+            'null_lower': int(null_lower[u]),
+            'null_upper': int(null_upper[u]),
+            'observed_lower': int(observed_lower[u]),
+            'observed_upper': int(observed_upper[u])
+        }
+
+    if filepath is not None:
+        with open(filepath + '.tmp', 'w') as f:
+            f.write(dumps(statistics, indent=4))
+
+        replace(filepath + '.tmp', filepath)
+
+    return statistics
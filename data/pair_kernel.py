@@ -0,0 +1,178 @@
+"""
+Met-aromatic pair search over the atoms parsed from a local structure file.
+Replaces the per pair logic of MetAromatic with array operations:
+
+    $ python3 pair_kernel.py /mirror/mmCIF/mf/1mfb.cif.gz --chain A --cutoff-distance 4.9 --cutoff-angle 109.5
+
+The lone pairs of every methionine SD are approximated at once using the
+cross product model, where both lone pairs lie in the plane normal to CG-SD-CE
+through the bisector and are 109.5 degrees apart. The midpoints of the six
+ring bonds of every aromatic are likewise computed at once. Candidate SD -
+midpoint pairs within the cutoff distance come from a KD-tree, then the angles
+between each SD - midpoint vector and both lone pairs are evaluated as arrays.
+A pair is kept if either angle is within the cutoff angle. As for MetAromatic,
+one result is returned per ring bond midpoint, tagged with the chain of the pair:
+
+    {'aromatic_residue': 'TYR', 'aromatic_position': '68', 'methionine_position': '40',
+     'norm': 4.12, 'met_theta_angle': 62.4, 'met_phi_angle': 101.7, 'chain': 'A'}
+"""
+
+import sys
+from argparse import ArgumentParser
+from typing import List, Sequence, Tuple
+from numpy import (
+    arccos, argsort, array, char, clip, concatenate, cross, degrees, einsum, flatnonzero, full, isnan,
+    lexsort, nan, newaxis, repeat, roll, sqrt, unique
+)
+from numpy.linalg import norm
+from scipy.spatial import cKDTree
+from pdb_parser import parse_structure
+
+CUTOFF_DISTANCE = 6.0
+CUTOFF_ANGLE = 109.5
+MET_ATOMS = (b'CG', b'SD', b'CE')
+
+# Six membered rings in bonded order. Only the benzene ring of TRP is used
+RING_ATOMS = {
+    b'PHE': (b'CG', b'CD1', b'CE1', b'CZ', b'CE2', b'CD2'),
+    b'TYR': (b'CG', b'CD1', b'CE1', b'CZ', b'CE2', b'CD2'),
+    b'TRP': (b'CD2', b'CE3', b'CZ3', b'CH2', b'CZ2', b'CE2')
+}
+
+
+def get_residue_atoms(atoms: array, residue: bytes, names: Sequence[bytes]) -> Tuple[array, array]:
+    """
+    Gather the coordinates of the named atoms of every residue of a type into an
+    array of shape (residues, atoms, 3). Residues missing any of the atoms are
+    dropped. Returns the first record of each residue alongside, in file order
+    """
+
+    selected = atoms[atoms['residue'] == residue]
+    keys = char.add(char.add(selected['chain'], b'|'), char.add(selected['position'].astype('S11'), selected['insertion']))
+    _, first, inverse = unique(keys, return_index=True, return_inverse=True)
+
+    coordinates = full((len(first), len(names), 3), nan)
+
+    for column, name in enumerate(names):
+        rows = flatnonzero(selected['name'] == name)[::-1]  # Reversed so that the first record of an atom is assigned last
+        coordinates[inverse[rows], column] = selected['xyz'][rows]
+
+    complete = ~isnan(coordinates).any(axis=(1, 2))
+    order = argsort(first[complete])
+
+    return selected[first[complete][order]], coordinates[complete][order]
+
+
+def get_lone_pairs(cg: array, sd: array, ce: array) -> Tuple[array, array]:
+    """ Approximate both lone pairs of each SD, given (n, 3) arrays of CG, SD and CE coordinates """
+
+    u = cg - sd
+    v = ce - sd
+    u /= norm(u, axis=1)[:, newaxis]
+    v /= norm(v, axis=1)[:, newaxis]
+
+    bisector = -(u + v)
+    bisector /= norm(bisector, axis=1)[:, newaxis]
+
+    normal = cross(u, v)
+    normal /= norm(normal, axis=1)[:, newaxis]
+
+    # tan(109.5 / 2) ~ sqrt(2) so these lie 54.75 degrees either side of the bisector
+    return bisector + sqrt(2) * normal, bisector - sqrt(2) * normal
+
+
+def get_angles(vectors: array, others: array) -> array:
+    """ Angles in degrees between corresponding rows of two (n, 3) arrays """
+
+    cosines = einsum('ij,ij->i', vectors, others) / (norm(vectors, axis=1) * norm(others, axis=1))
+    return degrees(arccos(clip(cosines, -1.0, 1.0)))
+
+
+def get_midpoints(atoms: array) -> Tuple[array, array]:
+    """ Midpoints of the ring bonds of every aromatic. Returns the residue record of each midpoint and the midpoints """
+
+    records, midpoints = [], []
+
+    for residue, names in RING_ATOMS.items():
+        residues, rings = get_residue_atoms(atoms, residue, names)
+        records.append(repeat(residues, len(names)))
+        midpoints.append((0.5 * (rings + roll(rings, -1, axis=1))).reshape(-1, 3))
+
+    return concatenate(records), concatenate(midpoints)
+
+
+def get_position(records: array) -> List[str]:
+    """ Positions as they appear in the coordinate rows, i.e. 68 or 68A with an insertion code """
+    return char.add(records['position'].astype('U11'), char.decode(records['insertion'])).tolist()
+
+
+def get_pairs(atoms: array, cutoff_distance: float = CUTOFF_DISTANCE, cutoff_angle: float = CUTOFF_ANGLE) -> List[dict]:
+    """ Find every methionine - aromatic ring bond midpoint pair satisfying both cutoffs """
+
+    methionines, frames = get_residue_atoms(atoms, b'MET', MET_ATOMS)
+    aromatics, midpoints = get_midpoints(atoms)
+
+    if len(methionines) == 0 or len(aromatics) == 0:
+        return []
+
+    sd = frames[:, 1]
+    lone_pair_a, lone_pair_g = get_lone_pairs(frames[:, 0], sd, frames[:, 2])
+
+    candidates = cKDTree(sd).sparse_distance_matrix(cKDTree(midpoints), cutoff_distance, output_type='ndarray')
+    i, j = candidates['i'], candidates['j']
+
+    # Interactions are only considered within a chain
+    same_chain = methionines['chain'][i] == aromatics['chain'][j]
+    i, j = i[same_chain], j[same_chain]
+
+    vectors = midpoints[j] - sd[i]
+    theta = get_angles(vectors, lone_pair_a[i])
+    phi = get_angles(vectors, lone_pair_g[i])
+
+    selected = (theta <= cutoff_angle) | (phi <= cutoff_angle)
+    i, j, vectors, theta, phi = i[selected], j[selected], vectors[selected], theta[selected], phi[selected]
+
+    order = lexsort((j, i))  # The KD-tree returns pairs in no particular order
+    i, j, vectors, theta, phi = i[order], j[order], vectors[order], theta[order], phi[order]
+
+    columns = zip(
+        char.decode(aromatics['residue'][j]).tolist(),
+        get_position(aromatics[j]),
+        get_position(methionines[i]),
+        norm(vectors, axis=1).tolist(),
+        theta.tolist(),
+        phi.tolist(),
+        char.decode(methionines['chain'][i]).tolist()
+    )
+
+    return [
+        {
+            'aromatic_residue': residue,
+            'aromatic_position': aromatic_position,
+            'methionine_position': methionine_position,
+            'norm': distance,
+            'met_theta_angle': met_theta_angle,
+            'met_phi_angle': met_phi_angle,
+            'chain': chain
+        }
+        for residue, aromatic_position, methionine_position, distance, met_theta_angle, met_phi_angle, chain in columns
+    ]
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Find Met-aromatic pairs in local PDB or mmCIF files')
+    parser.add_argument('filepaths', nargs='+', help='PDB or mmCIF files, optionally gzipped')
+    parser.add_argument('--chain', help='Only consider this chain')
+    parser.add_argument('--cutoff-distance', type=float, default=CUTOFF_DISTANCE, help='Maximum SD - midpoint distance')
+    parser.add_argument('--cutoff-angle', type=float, default=CUTOFF_ANGLE, help='Maximum angle between SD - midpoint vector and a lone pair')
+    cli_args = parser.parse_args()
+
+    for filepath in cli_args.filepaths:
+        pairs = get_pairs(parse_structure(filepath, cli_args.chain), cli_args.cutoff_distance, cli_args.cutoff_angle)
+        sys.stdout.write('{}: {} pairs\n'.format(filepath, len(pairs)))
+
+        for pair in pairs:
+            sys.stdout.write('{aromatic_residue:>4}{aromatic_position:<6} MET{methionine_position:<6} {norm:7.3f} {met_theta_angle:8.3f} {met_phi_angle:8.3f}\n'.format(**pair))
+
+if __name__ == '__main__':
+    main()
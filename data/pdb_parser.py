@@ -0,0 +1,344 @@
+"""
+Parser for structures held in a local PDB mirror. Reads PDB or mmCIF files,
+optionally gzipped, through a memory map and extracts the MET, PHE, TYR and
+TRP ATOM records of the first model into a structured array:
+
+    $ python3 pdb_parser.py /mirror/pdb/mf/pdb1mfa.ent.gz --chain A
+
+Records are located and sliced into fields with array operations over the
+raw bytes of the file, so no Python object is created per line. Only the few
+hundred rows that are kept are converted into the rows MetAromatic exposes
+via its transport attribute, i.e. the whitespace separated fields of a PDB
+ATOM record:
+
+    ['ATOM', '1234', 'CG', 'MET', 'A', '95', '12.345', '-3.210', '7.654', '1.00', '20.00', 'C']
+
+Where an atom has alternate locations, only the first location (blank or A)
+is kept. Only the first model is read, so bridges are never mined from the
+other models of an NMR ensemble.
+"""
+
+import sys
+import gzip
+import mmap
+from argparse import ArgumentParser
+from os import path
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from numpy import arange, array, bincount, char, concatenate, diff, dtype, flatnonzero, frombuffer, full, isin, minimum, uint8, where, zeros
+from numpy.lib.stride_tricks import sliding_window_view
+from structure_cache import TRANSPORT_KEYS
+
+RESIDUES = (b'MET', b'PHE', b'TYR', b'TRP')
+FIRST_ALT_LOCS = (b'', b' ', b'A')
+PDB_LINE_WIDTH = 80
+GZIP_MAGIC = b'\x1f\x8b'
+NEWLINE, SPACE, CARRIAGE_RETURN = ord('\n'), ord(' '), ord('\r')
+WHITESPACE = (SPACE, ord('\t'), NEWLINE, CARRIAGE_RETURN)
+MIRROR_LAYOUTS = (
+    '{code}.pdb', '{code}.pdb.gz', '{code}.cif', '{code}.cif.gz', 'pdb{code}.ent', 'pdb{code}.ent.gz',
+    path.join('{middle}', 'pdb{code}.ent.gz'), path.join('{middle}', '{code}.cif.gz'),
+    path.join('pdb', '{middle}', 'pdb{code}.ent.gz'), path.join('mmCIF', '{middle}', '{code}.cif.gz')
+)
+
+ATOM_DTYPE = dtype([
+    ('serial', 'S11'),
+    ('name', 'S4'),
+    ('alt_loc', 'S1'),
+    ('residue', 'S3'),
+    ('chain', 'S4'),
+    ('position', '<i4'),
+    ('insertion', 'S1'),
+    ('xyz', '<f8', (3,)),
+    ('occupancy', '<f4'),
+    ('b_factor', '<f4'),
+    ('element', 'S2')
+])
+
+# (start, end) columns of the fixed width PDB ATOM record fields
+PDB_COLUMNS = {
+    'serial': (6, 11),
+    'name': (12, 16),
+    'alt_loc': (16, 17),
+    'residue': (17, 20),
+    'chain': (21, 22),
+    'position': (22, 26),
+    'insertion': (26, 27),
+    'x': (30, 38),
+    'y': (38, 46),
+    'z': (46, 54),
+    'occupancy': (54, 60),
+    'b_factor': (60, 66),
+    'element': (76, 78)
+}
+
+# mmCIF atom_site items of each field, in order of preference
+CIF_COLUMNS = {
+    'group': ('group_PDB',),
+    'serial': ('id',),
+    'name': ('auth_atom_id', 'label_atom_id'),
+    'alt_loc': ('label_alt_id',),
+    'residue': ('auth_comp_id', 'label_comp_id'),
+    'chain': ('auth_asym_id', 'label_asym_id'),
+    'position': ('auth_seq_id', 'label_seq_id'),
+    'insertion': ('pdbx_PDB_ins_code',),
+    'x': ('Cartn_x',),
+    'y': ('Cartn_y',),
+    'z': ('Cartn_z',),
+    'occupancy': ('occupancy',),
+    'b_factor': ('B_iso_or_equiv',),
+    'element': ('type_symbol',),
+    'model': ('pdbx_PDB_model_num',)
+}
+
+
+def read_buffer(filepath: str):
+    """ Memory map a file, decompressing it into memory if gzipped """
+
+    with open(filepath, 'rb') as f:
+        if path.getsize(filepath) == 0:
+            return b''
+
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:2] == GZIP_MAGIC:
+        return gzip.decompress(buffer)
+
+    return buffer
+
+
+def get_lines(data: array) -> Tuple[array, array]:
+    """ Return the start and end offsets of every line """
+
+    newlines = flatnonzero(data == NEWLINE)
+    starts = concatenate([[0], newlines + 1])
+    ends = concatenate([newlines, [len(data)]])
+    return starts, ends
+
+
+def starts_with(data: array, starts: array, prefix: bytes) -> array:
+    chunk = gather(data, starts, full(len(starts), len(prefix)), len(prefix))
+    return (chunk == frombuffer(prefix, dtype=uint8)).all(axis=1)
+
+
+def gather(data: array, starts: array, lengths: array, width: int) -> array:
+    """ Copy variable length slices of data into an (n, width) array padded with spaces """
+
+    if len(starts) == 0 or len(data) == 0:
+        return full((len(starts), width), SPACE, dtype=uint8)
+
+    if len(data) < width:
+        data = concatenate([data, full(width - len(data), SPACE, dtype=uint8)])
+
+    # Copying whole rows out of a window view is much faster than indexing every byte
+    chunk = sliding_window_view(data, width)[minimum(starts, len(data) - width)]
+
+    # Slices running past the end of data were shifted back to fit into the view
+    shifted = flatnonzero(starts > len(data) - width)
+    for row in shifted.tolist():
+        tail = data[starts[row]:]
+        chunk[row, :len(tail)] = tail
+
+    lengths = minimum(lengths, len(data) - starts)
+    if (lengths < width).any():
+        chunk[arange(width) >= lengths[:, None]] = SPACE
+
+    chunk[chunk == CARRIAGE_RETURN] = SPACE
+    return chunk
+
+
+def get_field(chunk: array, start: int, end: int) -> array:
+    """ View a column range of an (n, width) byte array as n fixed width strings """
+
+    return chunk[:, start:end].copy().view('S{}'.format(end - start)).ravel()
+
+
+def to_floats(values: array) -> array:
+    """ Convert strings to floats, reading blank or unknown values (?, .) as 0 """
+
+    values = char.strip(values)
+    return where(isin(values, (b'', b'?', b'.')), b'0', values).astype('<f8')
+
+
+def build_atoms(fields: Dict[str, array]) -> array:
+    atoms = zeros(len(fields['residue']), dtype=ATOM_DTYPE)
+
+    for name in ('serial', 'name', 'alt_loc', 'residue', 'chain', 'insertion', 'element'):
+        atoms[name] = char.strip(fields[name])
+
+    atoms['position'] = char.strip(fields['position']).astype('<i4')
+    atoms['xyz'] = array([to_floats(fields[axis]) for axis in ('x', 'y', 'z')]).T
+    atoms['occupancy'] = to_floats(fields['occupancy'])
+    atoms['b_factor'] = to_floats(fields['b_factor'])
+
+    return atoms
+
+
+def parse_pdb(buffer, chain: Optional[str] = None) -> array:
+    """ Extract the MET, PHE, TYR and TRP ATOM records of the first model of a PDB file """
+
+    end_model = buffer.find(b'\nENDMDL')
+    data = frombuffer(buffer, dtype=uint8, count=end_model if end_model >= 0 else -1)
+
+    starts, ends = get_lines(data)
+    selected = starts_with(data, starts, b'ATOM  ')
+    starts, ends = starts[selected], ends[selected]
+
+    # Select residues from the residue name columns alone, before copying out whole records
+    residue_start = PDB_COLUMNS['residue'][0]
+    residues = gather(data, starts + residue_start, ends - starts - residue_start, 3).view('S3').ravel()
+    selected = isin(residues, RESIDUES)
+
+    chunk = gather(data, starts[selected], (ends - starts)[selected], PDB_LINE_WIDTH)
+    fields = {name: get_field(chunk, start, end) for name, (start, end) in PDB_COLUMNS.items()}
+
+    selected = isin(fields['alt_loc'], FIRST_ALT_LOCS)
+    if chain is not None:
+        selected &= fields['chain'] == chain.encode()
+
+    return build_atoms({name: values[selected] for name, values in fields.items()})
+
+
+def get_tokens(data: array) -> Tuple[array, array]:
+    """ Return the start offsets and lengths of whitespace separated tokens """
+
+    is_token = ~isin(data, WHITESPACE)
+    edges = diff(concatenate([[False], is_token, [False]]).astype('<i1'))
+    starts, ends = flatnonzero(edges == 1), flatnonzero(edges == -1)
+    return starts, ends - starts
+
+
+def parse_cif(buffer, chain: Optional[str] = None) -> array:
+    """ Extract the MET, PHE, TYR and TRP ATOM records of the first model of an mmCIF file """
+
+    header_start = buffer.find(b'_atom_site.')
+    if header_start < 0:
+        return zeros(0, dtype=ATOM_DTYPE)
+
+    # The loop header lists one item per line, then rows follow until the next category or loop
+    items, position = [], header_start
+    while buffer[position:position + 11] == b'_atom_site.':
+        line_end = buffer.find(b'\n', position)
+        items.append(bytes(buffer[position + 11:line_end]).strip().decode())
+        position = line_end + 1
+
+    block_end = min([end for end in (buffer.find(marker, position) for marker in (b'\n#', b'\nloop_', b'\n_')) if end >= 0] or [len(buffer)])
+    data = frombuffer(buffer, dtype=uint8, count=block_end - position, offset=position)
+
+    # Rows with values quoted around whitespace split into more tokens than there are items. None of the kept records have such values
+    token_starts, token_lengths = get_tokens(data)
+    line_starts, _ = get_lines(data)
+    token_lines = line_starts.searchsorted(token_starts, side='right') - 1
+    tokens_per_line = bincount(token_lines, minlength=len(line_starts))
+
+    selected = (tokens_per_line == len(items))[token_lines]
+    token_starts = token_starts[selected].reshape(-1, len(items))
+    token_lengths = token_lengths[selected].reshape(-1, len(items))
+
+    def get_column(field: str) -> Optional[array]:
+        for item in CIF_COLUMNS[field]:
+            if item in items:
+                column = items.index(item)
+                width = max(int(token_lengths[:, column].max(initial=1)), 1)
+                return gather(data, token_starts[:, column], token_lengths[:, column], width).view('S{}'.format(width)).ravel()
+
+        return None
+
+    residues = get_column('residue')
+    selected = isin(residues, RESIDUES) & (get_column('group') == b'ATOM')
+
+    models = get_column('model')
+    if models is not None and len(models):
+        selected &= models == models[0]
+
+    token_starts, token_lengths = token_starts[selected], token_lengths[selected]
+    fields = {field: get_column(field) for field in CIF_COLUMNS}
+
+    for field in ('insertion', 'alt_loc'):
+        if fields[field] is None:
+            fields[field] = zeros(len(token_starts), dtype='S1')
+
+    for field in ('insertion', 'alt_loc'):
+        fields[field] = where(isin(fields[field], (b'?', b'.')), b'', fields[field])
+
+    selected = isin(fields['alt_loc'], FIRST_ALT_LOCS)
+    if chain is not None:
+        selected &= fields['chain'] == chain.encode()
+
+    return build_atoms({field: values[selected] for field, values in fields.items() if values is not None})
+
+
+def is_cif(filepath: str, buffer) -> bool:
+    filename = path.basename(filepath).lower()
+
+    if '.cif' in filename or '.mmcif' in filename:
+        return True
+
+    if '.pdb' in filename or '.ent' in filename:
+        return False
+
+    return buffer[:5] == b'data_'
+
+
+def parse_structure(filepath: str, chain: Optional[str] = None) -> array:
+    """ Parse a PDB or mmCIF file, optionally gzipped, into an array of ATOM_DTYPE records """
+
+    buffer = read_buffer(filepath)
+
+    if is_cif(filepath, buffer):
+        return parse_cif(buffer, chain)
+
+    return parse_pdb(buffer, chain)
+
+
+def find_structure(mirror_dir: str, code: str) -> Optional[str]:
+    """ Look up a code in a local mirror, either flat or divided by the middle two characters of the code """
+
+    code = code.lower()
+
+    for layout in MIRROR_LAYOUTS:
+        filepath = path.join(mirror_dir, layout.format(code=code, middle=code[1:3]))
+
+        if path.exists(filepath):
+            return filepath
+
+    return None
+
+
+def get_transport(atoms: array) -> Dict[str, List[list]]:
+    """ Convert parsed records into the coordinate rows of each residue that MetAromatic exposes """
+
+    transport = {key: [] for key in TRANSPORT_KEYS}
+
+    for atom in atoms.tolist():
+        serial, name, _, residue, chain, position, insertion, xyz, occupancy, b_factor, element = atom
+        residue = residue.decode()
+
+        transport['{}_coordinates'.format(residue.lower())].append([
+            'ATOM', serial.decode(), name.decode(), residue, chain.decode(), '{}{}'.format(position, insertion.decode()),
+            '{:.3f}'.format(xyz[0]), '{:.3f}'.format(xyz[1]), '{:.3f}'.format(xyz[2]),
+            '{:.2f}'.format(occupancy), '{:.2f}'.format(b_factor), element.decode()
+        ])
+
+    return transport
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Extract MET, PHE, TYR and TRP atoms from local PDB or mmCIF files')
+    parser.add_argument('filepaths', nargs='+', help='PDB or mmCIF files, optionally gzipped')
+    parser.add_argument('--chain', help='Only keep atoms of this chain')
+    cli_args = parser.parse_args()
+
+    start, num_bytes = perf_counter(), 0
+
+    for filepath in cli_args.filepaths:
+        atoms = parse_structure(filepath, cli_args.chain)
+        num_bytes += path.getsize(filepath)
+        counts = {residue.decode(): int((atoms['residue'] == residue).sum()) for residue in RESIDUES}
+        sys.stdout.write('{} {}\n'.format(filepath, ' '.join('{}={}'.format(*count) for count in counts.items())))
+
+    elapsed = perf_counter() - start
+    sys.stdout.write('Parsed {} files ({:.1f} MB) in {:.3f} s\n'.format(len(cli_args.filepaths), num_bytes / 1e6, elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""
+Prefetch structure files into a local mirror ahead of mining. Downloads run
+on an asyncio event loop in a background thread, each of N workers reusing
+one persistent HTTP/1.1 connection, so N downloads stay in flight:
+
+    $ python3 prefetch.py low_redundancy_delimiter_list.csv --mirror pdb_mirror --concurrency 16
+
+Codes are yielded in input order as soon as their file is in the mirror. At
+most max_ahead codes are downloaded or downloading beyond the code last
+released, which bounds the disk and memory used ahead of the consumer. Codes
+are released as they are yielded by default. A consumer that hands codes to
+something which reads ahead of it, i.e. Pool.imap, should instead pass
+manual_release and call release() once it is done with each code. Bodies
+are streamed to disk in chunks and renamed into place once complete, so the
+mirror never holds partial files. Codes already in the mirror are not
+fetched again.
+"""
+
+import ssl
+import asyncio
+import logging
+import threading
+from argparse import ArgumentParser
+from os import path, makedirs, remove, replace
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+from pdb_parser import find_structure
+
+DEFAULT_URL = 'https://files.rcsb.org/download/{code}.cif.gz'
+DEFAULT_MIRROR_DIR = 'pdb_mirror'
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_AHEAD = 64
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_RETRIES = 2
+READ_SIZE = 64 * 1024
+HTTP_OK = 200
+HTTP_NOT_FOUND = 404
+
+
+class Connection:
+    """ A persistent HTTP/1.1 connection which is reopened whenever the server closes it """
+
+    def __init__(self, scheme: str, host: str, port: int, timeout: float) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def open(self) -> None:
+        context = ssl.create_default_context() if self.scheme == 'https' else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context), self.timeout
+        )
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+        self.reader, self.writer = None, None
+
+    async def read_line(self) -> bytes:
+        return await asyncio.wait_for(self.reader.readline(), self.timeout)
+
+    async def read_exactly(self, size: int) -> bytes:
+        return await asyncio.wait_for(self.reader.readexactly(size), self.timeout)
+
+    async def read_body(self, headers: dict, handle) -> None:
+        """ Stream a Content-Length, chunked or read until close body into handle """
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.read_line()).split(b';')[0], 16)
+
+                if size == 0:
+                    while (await self.read_line()) not in (b'\r\n', b'\n', b''):  # Trailers
+                        pass
+                    return
+
+                while size > 0:
+                    chunk = await self.read_exactly(min(size, READ_SIZE))
+                    handle.write(chunk)
+                    size -= len(chunk)
+
+                await self.read_line()
+
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+
+            while remaining > 0:
+                chunk = await self.read_exactly(min(remaining, READ_SIZE))
+                handle.write(chunk)
+                remaining -= len(chunk)
+
+        else:
+            while True:
+                chunk = await asyncio.wait_for(self.reader.read(READ_SIZE), self.timeout)
+
+                if not chunk:
+                    break
+
+                handle.write(chunk)
+
+            await self.close()
+
+    async def get(self, target: str, handle) -> int:
+        """ Send a GET request and stream the body into handle if the response is 200. Returns the status """
+
+        if self.writer is None:
+            await self.open()
+
+        self.writer.write('GET {} HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\nAccept: */*\r\n\r\n'.format(
+            target, self.host
+        ).encode())
+        await self.writer.drain()
+
+        status_line = await self.read_line()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by server')
+
+        status = int(status_line.split()[1])
+        headers = {}
+
+        while True:
+            line = await self.read_line()
+
+            if line in (b'\r\n', b'\n', b''):
+                break
+
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if status == HTTP_OK:
+            await self.read_body(headers, handle)
+        else:
+            await self.read_body(headers, DiscardedBody())
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+
+        return status
+
+
+class DiscardedBody:
+
+    @staticmethod
+    def write(_) -> None:
+        pass
+
+
+def get_filepath(mirror_dir: str, url_template: str, code: str) -> str:
+    """ Files are stored flat in the mirror under the file name of their URL, i.e. 1abc.cif.gz """
+    return path.join(mirror_dir, path.basename(urlsplit(url_template.format(code=code.strip().lower())).path))
+
+
+class Prefetcher:
+
+    def __init__(self, codes: List[str], mirror_dir: str = DEFAULT_MIRROR_DIR, url_template: str = DEFAULT_URL,
+                 concurrency: int = DEFAULT_CONCURRENCY, max_ahead: int = DEFAULT_MAX_AHEAD,
+                 timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES, manual_release: bool = False) -> None:
+
+        if concurrency < 1 or max_ahead < 1:
+            raise ValueError('Concurrency and max_ahead must be at least 1')
+
+        self.codes = codes
+        self.mirror_dir = mirror_dir
+        self.url_template = url_template
+        self.concurrency = concurrency
+        self.max_ahead = max(max_ahead, concurrency)
+        self.timeout = timeout
+        self.retries = retries
+        self.manual_release = manual_release
+
+        # Results by index, handed from the event loop thread to the consuming thread
+        self.results = {}
+        self.condition = threading.Condition()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.window: Optional[asyncio.Semaphore] = None
+        self.thread: Optional[threading.Thread] = None
+        self.num_downloads = 0
+        self.num_connections = 0
+        self.num_released = 0
+
+        makedirs(self.mirror_dir, exist_ok=True)
+
+    def release(self) -> None:
+        """ Let one more code into the window of downloads ahead of the consumer """
+
+        # Once every code is let into the window the event loop may have stopped already
+        if self.num_released + self.max_ahead < len(self.codes):
+            self.loop.call_soon_threadsafe(self.window.release)
+
+        self.num_released += 1
+
+    def set_result(self, index: int, result: Tuple[str, Optional[str], Optional[str]]) -> None:
+        with self.condition:
+            self.results[index] = result
+            self.condition.notify_all()
+
+    async def download(self, connection: Connection, code: str) -> Tuple[Optional[str], Optional[str]]:
+        """ Download a code into the mirror. Returns the file path or an error """
+
+        url = urlsplit(self.url_template.format(code=code.strip().lower()))
+        target = url.path + ('?' + url.query if url.query else '')
+        filepath = get_filepath(self.mirror_dir, self.url_template, code)
+        error = None
+
+        for _ in range(self.retries + 1):
+            try:
+                with open(filepath + '.part', 'wb') as f:
+                    status = await connection.get(target, f)
+
+                if status == HTTP_OK:
+                    replace(filepath + '.part', filepath)
+                    self.num_downloads += 1
+                    return filepath, None
+
+                error = 'HTTP {}'.format(status)
+
+                if status == HTTP_NOT_FOUND:
+                    break
+
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError, ssl.SSLError) as exception:
+                error = '{}: {}'.format(type(exception).__name__, exception)
+                await connection.close()  # Reconnect on the next attempt
+
+        if path.exists(filepath + '.part'):
+            remove(filepath + '.part')
+
+        return None, error
+
+    async def worker(self, queue: asyncio.Queue) -> None:
+        url = urlsplit(self.url_template.format(code=''))
+        connection = Connection(url.scheme, url.hostname, url.port or (443 if url.scheme == 'https' else 80), self.timeout)
+        self.num_connections += 1
+
+        try:
+            while True:
+                item = await queue.get()
+
+                if item is None:
+                    return
+
+                index, code = item
+                filepath, error = await self.download(connection, code)
+                self.set_result(index, (code, filepath, error))
+        finally:
+            await connection.close()
+
+    async def run(self) -> None:
+        self.window = asyncio.Semaphore(self.max_ahead)
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.ensure_future(self.worker(queue)) for _ in range(self.concurrency)]
+
+        for index, code in enumerate(self.codes):
+            await self.window.acquire()  # Released once the consumer is done with a result
+
+            filepath = find_structure(self.mirror_dir, code)
+            if filepath is not None:
+                self.set_result(index, (code, filepath, None))
+                continue
+
+            await queue.put((index, code))
+
+        for _ in workers:
+            await queue.put(None)
+
+        await asyncio.gather(*workers)
+
+    def start(self) -> None:
+        self.loop = asyncio.new_event_loop()
+
+        def run_loop() -> None:
+            try:
+                self.loop.run_until_complete(self.run())
+            except Exception as exception:  # Surface failures of the loop itself to the consumer
+                with self.condition:
+                    self.results['error'] = exception
+                    self.condition.notify_all()
+            finally:
+                self.loop.close()
+
+        self.thread = threading.Thread(target=run_loop, name='prefetch', daemon=True)
+        self.thread.start()
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+        """ Yield (code, file path, error) in input order. The file path is None if the download failed """
+
+        if self.thread is None:
+            self.start()
+
+        for index in range(len(self.codes)):
+            with self.condition:
+                while index not in self.results and 'error' not in self.results:
+                    self.condition.wait()
+
+                if index not in self.results:
+                    raise self.results['error']
+
+                result = self.results.pop(index)
+
+            if not self.manual_release:
+                self.release()
+
+            yield result
+
+        self.thread.join()
+
+
+def iter_prefetched_codes(prefetcher: Prefetcher) -> Iterator[str]:
+    """ Yield codes once their files are in the mirror, logging failed downloads """
+
+    for code, _, error in prefetcher:
+        if error is not None:
+            logging.warning('%s - Could not prefetch: %s', code, error)
+
+        yield code
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Download structure files into a local mirror')
+    parser.add_argument('csv', help='File listing the codes to download, one per line')
+    parser.add_argument('--mirror', default=DEFAULT_MIRROR_DIR, help='Directory to download files into')
+    parser.add_argument('--url', default=DEFAULT_URL, help='URL template of the files, formatted with the lower case {code}')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Number of downloads kept in flight')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Seconds to wait on the network before retrying')
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s %(asctime)s %(message)s')
+
+    with open(cli_args.csv) as f:
+        codes = [line.strip() for line in f if line.strip()]
+
+    prefetcher = Prefetcher(codes, cli_args.mirror, cli_args.url, cli_args.concurrency, timeout=cli_args.timeout)
+    num_failed = 0
+
+    for count, (code, filepath, error) in enumerate(prefetcher, 1):
+        if error is not None:
+            num_failed += 1
+            logging.error('%i %s - %s', count, code, error)
+        else:
+            logging.info('%i %s - %s', count, code, filepath)
+
+    logging.info('Downloaded %i files, %i failed', prefetcher.num_downloads, num_failed)
+
+if __name__ == '__main__':
+    main()
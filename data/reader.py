@@ -0,0 +1,112 @@
+"""
+Streaming reader for exported transformations. Handles both layouts written by
+mongoexport:
+    -- NDJSON:     one document per line (the mongoexport default)
+    -- JSON array: a single [...] array of documents (mongoexport --jsonArray)
+Documents are decoded one at a time from a fixed size read buffer so that
+memory use does not grow with the size of the export.
+"""
+
+from json import JSONDecoder
+from typing import Iterator, List
+from numpy import array, zeros
+
+READ_SIZE = 1024 ** 2
+DEFAULT_BATCH_SIZE = 10000
+WHITESPACE = ' \t\r\n'
+
+
+def iter_array_documents(handle, first_chunk: str, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """ Incrementally decode the elements of a top level JSON array """
+
+    decoder = JSONDecoder()
+    buffer = first_chunk.lstrip(WHITESPACE)[1:]  # Drop the opening bracket
+    position = 0
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE + ',':
+            position += 1
+
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        try:
+            document, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # Either the document straddles the end of the buffer or the file is malformed
+            if eof:
+                raise ValueError('Truncated or malformed JSON array') from None
+
+            chunk = handle.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield document
+        position = end
+
+
+def iter_documents(filepath: str, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """ Yield the documents of an NDJSON or JSON array export one by one """
+
+    decoder = JSONDecoder()
+
+    with open(filepath) as handle:
+        first_chunk = handle.read(read_size)
+
+        while first_chunk and not first_chunk.strip(WHITESPACE):
+            first_chunk = handle.read(read_size)
+
+        if first_chunk.lstrip(WHITESPACE).startswith('['):
+            yield from iter_array_documents(handle, first_chunk, read_size)
+            return
+
+        handle.seek(0)
+
+        for line in handle:
+            line = line.strip()
+
+            if line:
+                yield decoder.decode(line)
+
+
+def iter_batches(filepath: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[dict]]:
+    """ Yield lists of at most batch_size documents """
+
+    batch = []
+
+    for document in iter_documents(filepath):
+        batch.append(document)
+
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def iter_coordinate_batches(filepath: str, residue: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[array]:
+    """ Yield (n, 3) arrays of at most batch_size mapped coordinates of an aromatic type, i.e. PHE """
+
+    from columnar import split_residue, METADATA_KEYS  # The columnar store itself reads exports through this module
+
+    batch = zeros((batch_size, 3))
+    num_rows = 0
+
+    for document in iter_documents(filepath):
+        for key, coordinates in document.items():
+            if key in METADATA_KEYS or split_residue(key)[0] != residue:
+                continue
+
+            batch[num_rows] = coordinates
+            num_rows += 1
+
+            if num_rows == batch_size:
+                yield batch.copy()
+                num_rows = 0
+
+    if num_rows:
+        yield batch[:num_rows].copy()
@@ -0,0 +1,209 @@
+"""
+Output sinks for mined transformations. Each sink buffers documents and
+writes them out in batches:
+    -- MongoSink:    bulk insert_many into a MongoDB collection
+    -- NDJSONSink:   one JSON document per line, same layout as mongoexport
+    -- ColumnarSink: compact binary columns readable via columnar.load_columns
+    -- DensitySink:  partial voxel density grids which can be merged across runs
+
+A code is always flushed as a whole, and each sink commits the codes of a
+batch along with its documents. Documents of committed codes are dropped on
+write, so replaying codes after a crash between a flush and the run manifest
+cannot duplicate them. MongoSink relies on the deterministic _id instead.
+"""
+
+from abc import ABC, abstractmethod
+from json import dumps, loads
+from os import path
+from time import perf_counter
+from typing import List, Set
+from columnar import ColumnarWriter
+from density import DensityGrids
+
+DEFAULT_BATCH_SIZE = 500
+COMMIT_SUFFIX = '.commit.ndjson'
+MONGO_DUPLICATE_KEY_ERROR = 11000
+
+
+class Sink(ABC):
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self.buffer: List[dict] = []
+        self.metrics = None  # A metrics.MetricsLog which times each batch if set
+        self.committed_codes: Set[str] = set()
+
+    def __enter__(self) -> 'Sink':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, document: dict) -> None:
+        if document.get('code') in self.committed_codes:  # Replayed from a previous run
+            return
+
+        self.buffer.append(document)
+
+    def needs_flush(self) -> bool:
+        return len(self.buffer) >= self.batch_size
+
+    def flush(self) -> None:
+        """ Hand the buffered documents to write_batch, timing the batch if metrics are set """
+
+        if self.buffer and self.metrics is not None:
+            start = perf_counter()
+            self.write_batch(self.buffer)
+            self.metrics.record_sink(len(self.buffer), perf_counter() - start)
+        elif self.buffer:
+            self.write_batch(self.buffer)
+
+        self.committed_codes.update(document['code'] for document in self.buffer if 'code' in document)
+        self.buffer = []
+
+    @abstractmethod
+    def write_batch(self, documents: List[dict]) -> None:
+        """ Write out and commit a batch of documents. A crash must not leave part of a batch committed """
+
+    def close(self) -> None:
+        self.flush()
+
+
+def is_duplicate_key_error(error: Exception) -> bool:
+    """ Check whether a bulk write failed only because some _id values already exist """
+
+    details = getattr(error, 'details', None)
+
+    if not details or not details.get('writeErrors'):
+        return False
+
+    return all(e['code'] == MONGO_DUPLICATE_KEY_ERROR for e in details['writeErrors'])
+
+
+class MongoSink(Sink):
+
+    def __init__(self, collection, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__(batch_size)
+        self.collection = collection
+
+    def write_batch(self, documents: List[dict]) -> None:
+        # Documents carry a deterministic _id so a replayed batch only raises duplicate key errors
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except Exception as error:
+            if not is_duplicate_key_error(error):
+                raise
+
+
+def read_ndjson_codes(filepath: str) -> tuple:
+    """ Return the size of the complete lines of an NDJSON file and the codes they hold """
+
+    offset, codes = 0, set()
+
+    with open(filepath, 'rb') as f:
+        for line in f:
+            try:
+                document = loads(line)
+            except ValueError:  # A run killed mid-write can leave a truncated last line
+                break
+
+            codes.add(document.get('code'))
+            offset += len(line)
+
+    codes.discard(None)
+    return offset, codes
+
+
+def read_commits(filepath: str) -> tuple:
+    """ Return the size of the complete lines of a commit log, the last committed offset and every committed code """
+
+    size, offset, codes = 0, 0, set()
+
+    with open(filepath, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):  # A run killed mid-commit can leave a truncated last line
+                break
+
+            commit = loads(line)
+            offset = commit['offset']
+            codes.update(commit['codes'])
+            size += len(line)
+
+    return size, offset, codes
+
+
+class NDJSONSink(Sink):
+    """
+    Appends to an NDJSON file. After every batch the size of the file and the
+    new codes of the batch are appended to a commit log alongside it, and the
+    NDJSON file is truncated back to the last committed size when reopened
+    """
+
+    def __init__(self, filepath: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__(batch_size)
+        self.filepath = filepath
+        self.commit_filepath = filepath + COMMIT_SUFFIX
+        offset, commit_size = 0, 0
+
+        if path.exists(self.commit_filepath):
+            commit_size, offset, self.committed_codes = read_commits(self.commit_filepath)
+        elif path.exists(self.filepath):  # Written before commits were recorded
+            offset, self.committed_codes = read_ndjson_codes(self.filepath)
+
+        self.handle = open(self.filepath, 'a')
+        self.handle.truncate(offset)
+        self.commit_handle = open(self.commit_filepath, 'a')
+        self.commit_handle.truncate(commit_size)
+
+        if commit_size == 0 and offset > 0:
+            self.write_commit(offset, self.committed_codes)
+
+    def write_commit(self, offset: int, codes: Set[str]) -> None:
+        self.commit_handle.write(dumps({'offset': offset, 'codes': sorted(codes)}) + '\n')
+        self.commit_handle.flush()
+
+    def write_batch(self, documents: List[dict]) -> None:
+        self.handle.write(''.join(dumps(document) + '\n' for document in documents))
+        self.handle.flush()
+
+        codes = {document['code'] for document in documents if 'code' in document}
+        self.write_commit(self.handle.tell(), codes - self.committed_codes)
+
+    def close(self) -> None:
+        super().close()
+        self.handle.close()
+        self.commit_handle.close()
+
+
+class ColumnarSink(Sink):
+
+    def __init__(self, dirpath: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__(batch_size)
+        self.writer = ColumnarWriter(dirpath)
+        self.committed_codes = self.writer.get_codes()  # Row counts are only committed once a batch is fully written
+
+    def write_batch(self, documents: List[dict]) -> None:
+        for document in documents:
+            self.writer.write(document)
+
+        self.writer.flush()
+
+
+class DensitySink(Sink):
+
+    def __init__(self, filepath: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__(batch_size)
+        self.filepath = filepath
+
+        # Resume accumulating into the grids of a previous run
+        if path.exists(self.filepath):
+            self.grids = DensityGrids.load(self.filepath)
+        else:
+            self.grids = DensityGrids()
+
+        # Grids are saved atomically along with the codes they hold
+        self.committed_codes = set(self.grids.codes)
+
+    def write_batch(self, documents: List[dict]) -> None:
+        self.grids.add_documents(documents)
+        self.grids.save(self.filepath)
@@ -0,0 +1,217 @@
+"""
+Spatial index over the mapped aromatic centroids of a sorted columnar store.
+One KD-tree is built per aromatic type plus one over every satellite. Each
+tree keeps the satellite rows of its points so hits can be traced back to the
+PDB code, methionine and aromatic residue of the bridge. Queries are made in
+the methionine frame, where SD is the origin, CE lies along x and CG lies in
+the xy plane. For example, all TRP centroids within 2 angstroms of (4, 3, 0):
+
+    $ python3 spatial.py --residue TRP radius 4 3 0 2
+
+Or every PHE centroid above the CG-SD-CE plane. Note the -- which stops
+-inf from being read as an option:
+
+    $ python3 spatial.py --residue PHE box -- -inf -inf 0 inf inf inf
+
+Trees are pickled alongside the store and rebuilt whenever the store or the
+selected --sweep threshold changes.
+"""
+
+import sys
+import pickle
+from argparse import ArgumentParser
+from os import path, replace
+from typing import Dict, List, Optional, Tuple
+from numpy import arange, array, asarray, concatenate, inf, maximum, minimum
+from scipy.spatial import cKDTree
+from dataset import BridgeDataset, parse_threshold, DEFAULT_DIRPATH
+from columnar import INDEX_FILENAME
+
+SPATIAL_INDEX_FILENAME = 'spatial_index.pkl'
+SPATIAL_INDEX_VERSION = 1
+ALL_RESIDUES = 'ALL'
+
+
+class SpatialIndex:
+
+    def __init__(self, dataset: BridgeDataset, rebuild: bool = False) -> None:
+        self.dataset = dataset
+        self.filepath = path.join(dataset.dirpath, SPATIAL_INDEX_FILENAME)
+        self.trees: Dict[str, Tuple[cKDTree, array]] = {}
+
+        if rebuild or not self.load():
+            self.build()
+            self.save()
+
+    def get_fingerprint(self) -> tuple:
+        """ Sorting a store rewrites its index file so its mtime identifies the current row order """
+
+        mtime = path.getmtime(path.join(self.dataset.dirpath, INDEX_FILENAME))
+        return SPATIAL_INDEX_VERSION, len(self.dataset.columns['satellite_xyz']), mtime, self.dataset.threshold
+
+    def build(self) -> None:
+        xyz = self.dataset.columns['satellite_xyz']
+        all_rows = []
+
+        for residue, slices in self.dataset.residue_slices.items():
+            if not slices:
+                continue
+
+            rows = concatenate([arange(start, end) for start, end in slices])
+            self.trees[residue] = (cKDTree(xyz[rows]), rows)
+            all_rows.append(rows)
+
+        if all_rows:
+            rows = concatenate(all_rows)
+            self.trees[ALL_RESIDUES] = (cKDTree(xyz[rows]), rows)
+
+    def load(self) -> bool:
+        if not path.exists(self.filepath):
+            return False
+
+        try:
+            with open(self.filepath, 'rb') as f:
+                fingerprint, trees = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+
+        if fingerprint != self.get_fingerprint():
+            return False
+
+        self.trees = trees
+        return True
+
+    def save(self) -> None:
+        with open(self.filepath + '.tmp', 'wb') as f:
+            pickle.dump((self.get_fingerprint(), self.trees), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        replace(self.filepath + '.tmp', self.filepath)
+
+    def get_tree(self, residue: Optional[str]) -> Optional[Tuple[cKDTree, array]]:
+        return self.trees.get(residue or ALL_RESIDUES)
+
+    def get_hits(self, rows: array, distances: Optional[array] = None) -> List[dict]:
+        """ Resolve satellite rows into the bridges they belong to """
+
+        columns = self.dataset.columns
+        bridges = columns['satellite_bridge'][rows]
+        hits = []
+
+        for u, (row, bridge) in enumerate(zip(rows.tolist(), bridges.tolist())):
+            hit = {
+                'code': columns['bridge_code'][bridge].decode(),
+                'chain': columns['bridge_chain'][bridge].decode(),
+                'met_position': int(columns['bridge_met_position'][bridge]),
+                'met_insertion': columns['bridge_met_insertion'][bridge].decode(),
+                'residue': columns['satellite_residue'][row].decode(),
+                'position': int(columns['satellite_position'][row]),
+                'insertion': columns['satellite_insertion'][row].decode(),
+                'xyz': columns['satellite_xyz'][row].tolist(),
+                'bridge': bridge,
+                'satellite': row
+            }
+
+            if distances is not None:
+                hit['distance'] = float(distances[u])
+
+            hits.append(hit)
+
+        return hits
+
+    def query_radius(self, center: List[float], radius: float, residue: Optional[str] = None) -> List[dict]:
+        """ Return every centroid within radius of center, nearest first """
+
+        entry = self.get_tree(residue)
+
+        if entry is None:
+            return []
+
+        tree, rows = entry
+        indices = array(tree.query_ball_point(center, radius), dtype='<i8')
+        distances = ((tree.data[indices] - asarray(center)) ** 2).sum(axis=1) ** 0.5
+        order = distances.argsort(kind='stable')
+
+        return self.get_hits(rows[indices[order]], distances[order])
+
+    def query_nearest(self, point: List[float], k: int, residue: Optional[str] = None) -> List[dict]:
+        entry = self.get_tree(residue)
+
+        if entry is None or k < 1:
+            return []
+
+        tree, rows = entry
+        k = min(k, tree.n)
+        distances, indices = tree.query(point, k=[u + 1 for u in range(k)])
+
+        return self.get_hits(rows[indices], distances)
+
+    def query_box(self, lower: List[float], upper: List[float], residue: Optional[str] = None) -> List[dict]:
+        """ Return every centroid within the axis aligned box [lower, upper]. Bounds may be infinite """
+
+        entry = self.get_tree(residue)
+
+        if entry is None:
+            return []
+
+        tree, rows = entry
+
+        # Clip infinite bounds to the data then query the enclosing cube under the Chebyshev norm
+        lower = maximum(asarray(lower, dtype='<f8'), tree.mins)
+        upper = minimum(asarray(upper, dtype='<f8'), tree.maxes)
+
+        if (lower > upper).any():
+            return []
+
+        candidates = array(tree.query_ball_point((lower + upper) / 2, (upper - lower).max() / 2, p=inf), dtype='<i8')
+        points = tree.data[candidates]
+        indices = candidates[((points >= lower) & (points <= upper)).all(axis=1)]
+        indices.sort()
+
+        return self.get_hits(rows[indices])
+
+
+def get_command_line_arguments():
+    parser = ArgumentParser(description='Query mapped aromatic centroids in the methionine frame')
+    parser.add_argument('--store', default=DEFAULT_DIRPATH, help='Path to a sorted columnar store')
+    parser.add_argument('--residue', choices=['PHE', 'TYR', 'TRP'], help='Only query centroids of this aromatic type')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index even if it is up to date')
+    parser.add_argument('--threshold', type=parse_threshold, metavar='DISTANCE[:ANGLE]', help='Select the bridges mined at this threshold of a --sweep store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_radius = subparsers.add_parser('radius', help='Centroids within a radius of a point')
+    parser_radius.add_argument('point', type=float, nargs=3, metavar='XYZ')
+    parser_radius.add_argument('radius', type=float)
+
+    parser_nearest = subparsers.add_parser('nearest', help='The k centroids nearest to a point')
+    parser_nearest.add_argument('point', type=float, nargs=3, metavar='XYZ')
+    parser_nearest.add_argument('k', type=int)
+
+    parser_box = subparsers.add_parser('box', help='Centroids within an axis aligned box, i.e. -- -inf -inf 0 inf inf inf')
+    parser_box.add_argument('lower', type=float, nargs=3, metavar='MIN')
+    parser_box.add_argument('upper', type=float, nargs=3, metavar='MAX')
+
+    return parser.parse_args()
+
+
+def main() -> None:
+    cli_args = get_command_line_arguments()
+    index = SpatialIndex(BridgeDataset.open(cli_args.store, cli_args.threshold), rebuild=cli_args.rebuild)
+
+    if cli_args.command == 'radius':
+        hits = index.query_radius(cli_args.point, cli_args.radius, cli_args.residue)
+    elif cli_args.command == 'nearest':
+        hits = index.query_nearest(cli_args.point, cli_args.k, cli_args.residue)
+    else:
+        hits = index.query_box(cli_args.lower, cli_args.upper, cli_args.residue)
+
+    for hit in hits:
+        sys.stdout.write('{:>6} MET{:<6} {}{:<6} {:>8.3f} {:>8.3f} {:>8.3f} {:>8}\n'.format(
+            hit['code'], '{}{}'.format(hit['met_position'], hit['met_insertion']), hit['residue'],
+            '{}{}'.format(hit['position'], hit['insertion']), *hit['xyz'],
+            '{:.3f}'.format(hit['distance']) if 'distance' in hit else ''
+        ))
+
+    sys.stdout.write('{} hits\n'.format(len(hits)))
+
+if __name__ == '__main__':
+    main()
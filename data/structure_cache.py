@@ -0,0 +1,191 @@
+"""
+On-disk cache of parsed structures. For every code the cache stores the
+MET/PHE/TYR/TRP coordinate rows that MetAromatic exposes via its transport
+attribute alongside the pair results, so that a rerun over the same codes
+does not need to fetch or parse anything. Entries are compressed .npz files:
+
+    <cache_dir>/<code>.v<parser version>.<chain>.<model>.npz
+
+Pair results are stored alongside the cutoffs they were computed with and
+the backend that computed them, either the local pair kernel or MetAromatic.
+An entry also serves any tighter cutoffs, in which case its pairs are filtered
+on read, so that pairs are best cached at the loosest cutoffs. Least recently
+used entries are evicted once the cache grows past its size bound.
+"""
+
+from glob import glob
+from os import path, makedirs, remove, replace, utime
+from typing import Dict, List, Optional
+from numpy import array, load, savez_compressed, zeros
+
+DEFAULT_CACHE_DIR = 'structure_cache'
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+PARSER_VERSION = 2
+TRANSPORT_KEYS = ('met_coordinates', 'phe_coordinates', 'tyr_coordinates', 'trp_coordinates')
+BACKEND_MET_AROMATIC = 'met_aromatic'
+BACKEND_PAIR_KERNEL = 'pair_kernel'
+
+
+def pack_rows(rows: List[list]) -> Dict[str, array]:
+    """ Pack possibly ragged rows of string tokens into a padded 2D array """
+
+    if not rows:
+        return {'table': zeros((0, 0), dtype='U1'), 'lengths': zeros(0, dtype='<i4')}
+
+    width = max(len(row) for row in rows)
+    table = array([[str(token) for token in row] + [''] * (width - len(row)) for row in rows])
+    lengths = array([len(row) for row in rows], dtype='<i4')
+
+    return {'table': table, 'lengths': lengths}
+
+
+def unpack_rows(table: array, lengths: array) -> List[list]:
+    return [row[:length] for row, length in zip(table.tolist(), lengths.tolist())]
+
+
+def pack_results(results: List[dict]) -> Dict[str, array]:
+    """ Store a list of pair result dicts column by column """
+
+    keys = sorted(results[0]) if results else []
+    packed = {'pair_keys': array(keys, dtype=str)}
+
+    for key in keys:
+        packed['pair__' + key] = array([result[key] for result in results])
+
+    return packed
+
+
+def unpack_results(archive) -> List[dict]:
+    keys = archive['pair_keys'].tolist()
+
+    if not keys:
+        return []
+
+    columns = [archive['pair__' + key].tolist() for key in keys]
+    return [dict(zip(keys, values)) for values in zip(*columns)]
+
+
+def filter_results(results: List[dict], cutoff_distance: float, cutoff_angle: float) -> List[dict]:
+    """ Keep the pairs within the distance cutoff and with either angle within the angle cutoff """
+
+    return [
+        result for result in results
+        if result['norm'] <= cutoff_distance and min(result['met_theta_angle'], result['met_phi_angle']) <= cutoff_angle
+    ]
+
+
+class StructureCache:
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        makedirs(self.cache_dir, exist_ok=True)
+
+        # Approximate since other workers may write to the same cache. Rescanned on eviction
+        self.size = self.get_size()
+
+    def get_filepath(self, code: str, chain: str, model: str) -> str:
+        filename = '{}.v{}.{}.{}.npz'.format(code.lower(), PARSER_VERSION, chain, model)
+        return path.join(self.cache_dir, filename)
+
+    def get(self, code: str, chain: str, model: str, cutoff_distance: float, cutoff_angle: float,
+            backend: Optional[str] = None) -> Optional[dict]:
+        """
+        Return a dict with the exit code, transport rows and pair results or None
+        on a miss. A hit requires the pair results to have been computed using the
+        same or looser cutoffs and, if passed, by the same backend.
+        """
+
+        filepath = self.get_filepath(code, chain, model)
+
+        if not path.exists(filepath):
+            return None
+
+        try:
+            with load(filepath) as archive:
+                if float(archive['cutoff_distance']) < cutoff_distance or float(archive['cutoff_angle']) < cutoff_angle:
+                    return None
+
+                if backend is not None and str(archive['backend']) != backend:
+                    return None
+
+                entry = {
+                    'exit_code': int(archive['exit_code']),
+                    'results': unpack_results(archive),
+                    'transport': {},
+                    'backend': str(archive['backend'])
+                }
+
+                if float(archive['cutoff_distance']) != cutoff_distance or float(archive['cutoff_angle']) != cutoff_angle:
+                    entry['results'] = filter_results(entry['results'], cutoff_distance, cutoff_angle)
+
+                for key in TRANSPORT_KEYS:
+                    entry['transport'][key] = unpack_rows(archive[key + '__table'], archive[key + '__lengths'])
+
+        except (OSError, ValueError, KeyError):  # Treat a corrupt or partial entry as a miss
+            return None
+
+        try:
+            utime(filepath)  # Mark as recently used for eviction purposes
+        except OSError:
+            pass
+
+        return entry
+
+    def put(self, code: str, chain: str, model: str, cutoff_distance: float, cutoff_angle: float,
+            exit_code: int, results: List[dict], transport: dict, backend: str = BACKEND_MET_AROMATIC) -> None:
+
+        arrays = {
+            'exit_code': array(exit_code),
+            'cutoff_distance': array(cutoff_distance),
+            'cutoff_angle': array(cutoff_angle),
+            'backend': array(backend)
+        }
+        arrays.update(pack_results(results))
+
+        for key in TRANSPORT_KEYS:
+            packed = pack_rows(transport.get(key, []))
+            arrays[key + '__table'] = packed['table']
+            arrays[key + '__lengths'] = packed['lengths']
+
+        # Write to a temporary file first so that concurrent workers never read a partial entry
+        filepath = self.get_filepath(code, chain, model)
+        tmp_filepath = filepath + '.tmp'
+
+        with open(tmp_filepath, 'wb') as f:
+            savez_compressed(f, **arrays)
+
+        replace(tmp_filepath, filepath)
+
+        self.size += path.getsize(filepath)
+
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def get_size(self) -> int:
+        return sum(path.getsize(filepath) for filepath in glob(path.join(self.cache_dir, '*.npz')))
+
+    def evict(self) -> None:
+        """ Remove least recently used entries until the cache fits within max_bytes """
+
+        entries = []
+        for filepath in glob(path.join(self.cache_dir, '*.npz')):
+            try:
+                entries.append((path.getmtime(filepath), path.getsize(filepath), filepath))
+            except OSError:  # Another worker evicted this entry already
+                continue
+
+        total_size = sum(entry[1] for entry in entries)
+
+        for _, size, filepath in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+
+            try:
+                remove(filepath)
+            except OSError:
+                pass
+
+            total_size -= size
+
+        self.size = total_size
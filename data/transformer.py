@@ -10,14 +10,27 @@ from pyquaternion import Quaternion
 from numpy import (
     linalg,
     arccos,
+    arctan2,
+    cos,
+    sin,
     dot,
     degrees,
     cross,
     array,
-    array_equal
+    array_equal,
+    einsum,
+    where,
+    zeros,
+    eye,
+    newaxis,
+    all as np_all
 )
 
 PRECISION_COMP = 5
+CHECK_STRICT = 'strict'
+CHECK_SAMPLED = 'sampled'
+CHECK_OFF = 'off'
+CHECK_SAMPLE_INTERVAL = 100
 
 def vector_angle(u: array, v: array) -> float:
     numerator = dot(u, v)
@@ -35,9 +48,20 @@ class Transformer:
 
     This class returns a set of quaternion attributes that can be used to
     transform a set of satellite points alongside ABC.
+
+    The check argument controls the determinant invariant that is verified
+    when rotating satellites: CHECK_STRICT verifies every satellite,
+    CHECK_SAMPLED verifies every CHECK_SAMPLE_INTERVAL-th satellite and
+    CHECK_OFF skips the verification entirely.
     """
 
-    def __init__(self, A: array, B: array, C: array) -> None:
+    def __init__(self, A: array, B: array, C: array, check: str = CHECK_STRICT) -> None:
+
+        if check not in (CHECK_STRICT, CHECK_SAMPLED, CHECK_OFF):
+            raise ValueError('Invalid check mode: {}'.format(check))
+
+        self.check = check
+        self.num_rotated = 0
 
         self.D = A - A
         self.E = B - A
@@ -69,6 +93,8 @@ class Transformer:
 
         # Need for dealing with satellites
         self.A = A
+        self.composition = self.second_quaternion * self.first_quaternion
+        self.rotation_matrix = self.composition.rotation_matrix
 
     def get_base(self) -> Tuple[array, array, array]:
         """ Return the base which is mapped to xy plane """
@@ -79,12 +105,116 @@ class Transformer:
         """ Confirm that volume of the transformee is identical post transformation """
         assert linalg.det(triangle).round(PRECISION_COMP) == linalg.det(triangle_transformed).round(PRECISION_COMP)
 
+    def _is_check_due(self) -> bool:
+        """ Decide whether the determinant invariant is verified for the next satellite """
+
+        self.num_rotated += 1
+
+        if self.check == CHECK_STRICT:
+            return True
+
+        if self.check == CHECK_SAMPLED:
+            return self.num_rotated % CHECK_SAMPLE_INTERVAL == 1
+
+        return False
+
     def rotate_satellite(self, satellite_point: array) -> array:
         """ Rotate out any satellite points using the existing quaternions """
 
-        composition = self.second_quaternion * self.first_quaternion
         satellite_point = satellite_point - self.A
-        satellite_rotated = composition.rotate(satellite_point)
+        satellite_rotated = dot(self.rotation_matrix, satellite_point)
+
+        if self._is_check_due():
+            self.check_pre_post_transform_dets([self.E, self.F, satellite_point], [self.K, self.L, satellite_rotated])
 
-        self.check_pre_post_transform_dets([self.E, self.F, satellite_point], [self.K, self.L, satellite_rotated])
         return satellite_rotated
+
+    def rotate_satellites(self, satellite_points: array) -> array:
+        """ Rotate a (k, 3) array of satellite points in a single matrix multiply """
+
+        satellite_points = array(satellite_points, dtype=float) - self.A
+        satellites_rotated = dot(satellite_points, self.rotation_matrix.T)
+
+        for satellite_point, satellite_rotated in zip(satellite_points, satellites_rotated):
+            if self._is_check_due():
+                self.check_pre_post_transform_dets([self.E, self.F, satellite_point], [self.K, self.L, satellite_rotated])
+
+        return satellites_rotated
+
+class BatchTransformer:
+
+    """
+    Vectorized version of Transformer for mapping N triangles at once:
+    [1] We make A -> (0, 0, 0) for every triangle
+    [2] We make AB colinear with x-axis for every triangle
+    [3] We make ABC coplanar with xy for every triangle
+
+    The frames argument is an (N, 3, 3) array where each frame stacks the
+    (A, B, C) points in the same order as the Transformer arguments. Each
+    quaternion pair is replaced by a single (3, 3) rotation matrix so that
+    both the base and the satellites are mapped using array math only.
+    """
+
+    def __init__(self, frames: array) -> None:
+
+        frames = array(frames, dtype=float)
+        self.A = frames[:, 0]
+        self.E = frames[:, 1] - self.A
+        self.F = frames[:, 2] - self.A
+
+        # Snap to x-axis
+        # -----------------
+        # Rodrigues rotation about E x (1, 0, 0) where |E x (1, 0, 0)| = |E| sin(alpha)
+        axis_first_rotation = cross(self.E, (1, 0, 0))
+        axis_norm = linalg.norm(axis_first_rotation, axis=1)
+        norm_E = linalg.norm(self.E, axis=1)
+
+        # Transformer skips the first rotation if the axis is the zero vector
+        degenerate = np_all(axis_first_rotation == 0, axis=1)
+        safe_axis_norm = where(degenerate, 1.0, axis_norm)
+        safe_norm_E = where(degenerate, 1.0, norm_E)
+
+        cos_alpha = where(degenerate, 1.0, self.E[:, 0] / safe_norm_E)
+        sin_alpha = where(degenerate, 0.0, axis_norm / safe_norm_E)
+        u = axis_first_rotation / safe_axis_norm[:, newaxis]
+
+        K = zeros((len(frames), 3, 3))
+        K[:, 0, 1], K[:, 0, 2] = -u[:, 2], u[:, 1]
+        K[:, 1, 0], K[:, 1, 2] = u[:, 2], -u[:, 0]
+        K[:, 2, 0], K[:, 2, 1] = -u[:, 1], u[:, 0]
+
+        first_rotation = (
+            eye(3) +
+            sin_alpha[:, newaxis, newaxis] * K +
+            (1 - cos_alpha)[:, newaxis, newaxis] * (K @ K)
+        )
+        I = einsum('nij,nj->ni', first_rotation, self.F)
+
+        # Rotate triangle into xy plane
+        # -----------------
+        theta = arctan2(I[:, 2], I[:, 1])  # Treat yz as if it is xy and apply into atan2
+        cos_theta, sin_theta = cos(theta), sin(theta)
+
+        second_rotation = zeros((len(frames), 3, 3))
+        second_rotation[:, 0, 0] = 1.0
+        second_rotation[:, 1, 1], second_rotation[:, 1, 2] = cos_theta, sin_theta
+        second_rotation[:, 2, 1], second_rotation[:, 2, 2] = -sin_theta, cos_theta
+
+        self.rotations = second_rotation @ first_rotation
+        self.K = einsum('nij,nj->ni', self.rotations, self.E)
+        self.L = einsum('nij,nj->ni', self.rotations, self.F)
+
+    def get_bases(self) -> array:
+        """ Return an (N, 3, 3) array of the bases which are mapped to xy plane """
+
+        bases = zeros((len(self.A), 3, 3))
+        bases[:, 1] = self.K
+        bases[:, 2] = self.L
+        return bases
+
+    def rotate_satellites(self, satellite_points: array) -> array:
+        """ Rotate an (N, k, 3) array of satellite points using the existing rotations """
+
+        satellite_points = array(satellite_points, dtype=float) - self.A[:, newaxis, :]
+        return einsum('nij,nkj->nki', self.rotations, satellite_points)
+
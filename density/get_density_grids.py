@@ -0,0 +1,150 @@
+"""
+Voxel density plots for mapped bridges. Bins the mapped centroids of each
+aromatic type and each permutation group into a 3D grid, then renders:
+    -- slice heatmaps through SD along the xy, xz and yz planes
+    -- a voxel isosurface enclosing the densest fraction of the centroids
+"""
+
+import sys
+import logging
+from argparse import ArgumentParser
+from os import path, makedirs
+from typing import List, Optional
+from numpy import array, linspace, meshgrid, pad
+import matplotlib
+matplotlib.use('Agg')  # Render off screen
+from matplotlib import pyplot  # pylint: disable=C0413
+
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data'))
+from dataset import BridgeDataset, parse_threshold  # pylint: disable=C0413
+from density import (  # pylint: disable=C0413
+    DensityGrid, DensityGrids, build_grids, get_enclosing_level, DEFAULT_LIMIT, DEFAULT_VOXEL_SIZE, KIND_GROUPS
+)
+
+ROOT = path.dirname(path.abspath(__file__))
+DEFAULT_SIGMA = 0.5
+DEFAULT_ENCLOSED_FRACTION = 0.5
+PLOT_DOTS_PER_INCH = 100
+FIGSIZE_SLICES_INCHES = (15, 5)
+FIGSIZE_WIDTH_HEIGHT_INCHES = (5, 5)
+ISOSURFACE_MAX_BINS = 28  # Drawing voxels is slow so isosurfaces are drawn from a coarsened grid
+SLICE_PLANES = (('xy', 2, 'x', 'y'), ('xz', 1, 'x', 'z'), ('yz', 0, 'y', 'z'))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s:%(name)s %(message)s'
+)
+
+
+def load_grids(cli_args, dataset: Optional[BridgeDataset] = None) -> DensityGrids:
+    if cli_args.grids:
+        logging.info('Reading density grids from %s', cli_args.grids)
+        return DensityGrids.load(cli_args.grids)
+
+    if dataset is None:
+        dataset = BridgeDataset.open(threshold=cli_args.threshold)
+
+    logging.info('Binning data from store %s', dataset.dirpath)
+    return build_grids(dataset, cli_args.limit, cli_args.voxel_size)
+
+
+def coarsen(density: array, factor: int) -> array:
+    """ Sum blocks of factor ** 3 voxels, padding the grid with empty voxels if needed """
+
+    num_bins = -(-density.shape[0] // factor) * factor
+    density = pad(density, (0, num_bins - density.shape[0]))
+    shape = (num_bins // factor, factor) * 3
+
+    return density.reshape(shape).sum(axis=(1, 3, 5))
+
+
+class RenderDensity:
+
+    def __init__(self, key: str, grid: DensityGrid, sigma: Optional[float], fraction: float) -> None:
+        logging.info('Processing %s with %i points', key, grid.num_points)
+
+        self.key = key
+        self.grid = grid
+        self.density = grid.get_density(sigma)
+        self.fraction = fraction
+
+        self.path_to_plots = path.join(ROOT, 'plots')
+        makedirs(self.path_to_plots, exist_ok=True)
+
+    def render_slices(self) -> None:
+        figure, axes = pyplot.subplots(1, 3, figsize=FIGSIZE_SLICES_INCHES, constrained_layout=True)
+        center = self.grid.num_bins // 2  # The voxel whose lower corner is SD
+        extent = (-self.grid.limit, self.grid.limit, -self.grid.limit, self.grid.limit)
+
+        for ax, (plane, axis, xlabel, ylabel) in zip(axes, SLICE_PLANES):
+            heatmap = self.density.take(center, axis=axis)
+            image = ax.imshow(heatmap.T, origin='lower', extent=extent, cmap='viridis')
+            ax.set_title('{} bridges - {} slice'.format(self.key, plane))
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            figure.colorbar(image, ax=ax, shrink=0.8)
+
+        filepath = path.join(self.path_to_plots, '{}_density_slices.png'.format(self.key.lower()))
+        logging.info('Exporting %s', filepath)
+        figure.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        pyplot.close(figure)
+
+    def render_isosurface(self) -> None:
+        figure = pyplot.figure(figsize=FIGSIZE_WIDTH_HEIGHT_INCHES)
+        ax = figure.add_subplot(111, projection='3d')
+
+        factor = -(-self.grid.num_bins // ISOSURFACE_MAX_BINS)
+        density = coarsen(self.density, factor)
+        level = get_enclosing_level(density, self.fraction)
+
+        size = factor * self.grid.voxel_size
+        edges = linspace(-self.grid.limit, -self.grid.limit + density.shape[0] * size, density.shape[0] + 1)
+        filled = (density >= level) & (density > 0)
+        ax.voxels(*meshgrid(edges, edges, edges, indexing='ij'), filled, facecolors='r', edgecolor='k', linewidth=0.1, alpha=0.3)
+
+        limits = (-self.grid.limit, self.grid.limit)
+        pyplot.setp(ax, xlim=limits, ylim=limits, zlim=limits, xlabel='x', ylabel='y', zlabel='z')
+        ax.set_title('{} bridges - densest {:.0%}'.format(self.key, self.fraction))
+
+        filepath = path.join(self.path_to_plots, '{}_density_3d.png'.format(self.key.lower()))
+        logging.info('Exporting %s', filepath)
+        figure.savefig(filepath, dpi=PLOT_DOTS_PER_INCH)
+        pyplot.close(figure)
+
+    def executor_main(self) -> None:
+        self.render_slices()
+        self.render_isosurface()
+
+
+def get_command_line_arguments(argv: Optional[List[str]] = None):
+    parser = ArgumentParser(description='Render voxel density plots of mapped bridges')
+    parser.add_argument('--grids', help='Render grids saved by the density sink or density.py merge instead of the store')
+    parser.add_argument('--limit', type=float, default=DEFAULT_LIMIT, help='Half width of the grid in angstroms')
+    parser.add_argument('--voxel-size', type=float, default=DEFAULT_VOXEL_SIZE, help='Voxel edge length in angstroms')
+    parser.add_argument('--sigma', type=float, default=DEFAULT_SIGMA, help='Gaussian smoothing in angstroms, 0 to disable')
+    parser.add_argument(
+        '--fraction', type=float, default=DEFAULT_ENCLOSED_FRACTION,
+        help='Draw the isosurface enclosing this fraction of the centroids'
+    )
+    parser.add_argument('--threshold', type=parse_threshold, metavar='DISTANCE[:ANGLE]', help='Select the bridges mined at this threshold of a --sweep store')
+    return parser.parse_args(argv)
+
+
+def run(cli_args, dataset: Optional[BridgeDataset] = None) -> None:
+    grids = load_grids(cli_args, dataset)
+
+    for kind, kind_grids in grids.grids.items():
+        for key, grid in kind_grids.items():
+            if kind == KIND_GROUPS and len(key) != 9:  # Same outliers as the groupby convex hulls
+                continue
+
+            RenderDensity(key, grid, cli_args.sigma, cli_args.fraction).executor_main()
+
+    logging.info('Done!')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    run(get_command_line_arguments(argv))
+
+if __name__ == '__main__':
+    main()
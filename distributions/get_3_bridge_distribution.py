@@ -1,118 +1,150 @@
-"""
-* David Weber *
-
-Plot a hbar chart depicting distribution of all 10 possible 3-bridge
-aromatic permutations
-"""
-
-import sys
-import logging
-from os import path, makedirs
-from re import match
-from collections import Counter
-from json import load
-from matplotlib import pyplot
-
-INPUT_FILENAME = 'n_3_bridge_transformations.json'
-OUTPUT_FILENAME = 'distribution.png'
-VERTICAL_IMAGE_SIZE_INCHES = 3
-HORIZONTAL_IMAGE_SIZE_INCHES = 3
-IMAGE_DPI = 250
-EXIT_FAILURE = 1
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(levelname)s:%(name)s %(message)s'
-)
-
-
-class ComputeDistribution:
-
-    def __init__(self):
-        path_to_json = path.join(path.dirname(path.dirname(__file__)), 'data', INPUT_FILENAME)
-        logging.info('Reading data from file %s', path_to_json)
-
-        try:
-            with open(path_to_json) as f:
-                self.raw_data = load(f)
-        except FileNotFoundError:
-            logging.exception('Could not open file!')
-            sys.exit(EXIT_FAILURE)
-
-        self.all_residues = []
-        self.bridges = []
-        self.bridges_without_numerics = []
-        self.counts = None
-
-    def filter_in_all_residues(self):
-        for entry in self.raw_data:
-            row = list(entry.keys())
-            row.remove('code')
-            self.all_residues.append(row)
-
-    def remove_methionines_from_cluster(self):
-        for entry in self.all_residues:
-            self.bridges.append(
-                [residue for residue in entry if 'MET' not in residue]
-            )
-
-    def strip_out_residue_position_number(self):
-        for raw_bridge in self.bridges:
-
-            bridge = []
-            for aromatic in raw_bridge:
-                retstr = match('[A-Z]+', aromatic)
-
-                if retstr:  # 5JNQ and 3GLJ are buggy and retstr will be NoneType
-                    bridge.append(retstr.group(0))
-
-            if len(bridge) == 3:  # 5JNQ and 3GLJ are buggy
-                self.bridges_without_numerics.append(bridge)
-
-    def get_bridge_counts(self):
-        bridges_sorted = [
-            tuple(sorted(i)) for i in self.bridges_without_numerics
-        ]
-        self.counts = Counter(bridges_sorted).most_common()
-
-    def execute_pipeline(self):
-        self.filter_in_all_residues()
-        self.remove_methionines_from_cluster()
-        self.strip_out_residue_position_number()
-        self.get_bridge_counts()
-        return self.counts
-
-
-def main():
-    distributions = ComputeDistribution().execute_pipeline()
-
-    pyplot.rcdefaults()
-    _, ax = pyplot.subplots(
-        figsize=(HORIZONTAL_IMAGE_SIZE_INCHES, VERTICAL_IMAGE_SIZE_INCHES)
-    )
-
-    categories, counts = [], []
-    for count in distributions:
-        categories.append(r'{' + ', '.join(count[0]) + r'}')
-        counts.append(count[1])
-
-    vertical_positions = range(len(categories))
-    ax.barh(vertical_positions, counts, align='center', edgecolor='k', lw=0.5, color='r')
-    ax.set_yticks(vertical_positions)
-    ax.set_yticklabels(categories, size=10)
-    ax.set_xlabel('Counts', size=10)
-    ax.spines['right'].set_visible(False)
-    ax.spines['top'].set_visible(False)
-    ax.invert_yaxis()
-
-    rootdir = path.join(path.dirname(__file__), 'plots')
-    makedirs(rootdir, exist_ok=True)
-
-    export_file = path.join(rootdir, OUTPUT_FILENAME)
-    logging.info('Exporting file to %s', export_file)
-    pyplot.savefig(export_file, dpi=IMAGE_DPI, bbox_inches='tight')
-
-    logging.info('Done!')
-
-if __name__ == '__main__':
-    main()
+"""
+* David Weber *
+
+Plot a hbar chart depicting distribution of all 10 possible 3-bridge
+aromatic permutations, annotated with the counts expected if aromatics were
+drawn independently and with bootstrap confidence intervals over PDB codes
+"""
+
+import sys
+import logging
+from argparse import ArgumentParser
+from os import path, makedirs
+from typing import List, Optional
+from matplotlib import pyplot
+
+ROOT = path.dirname(path.abspath(__file__))
+sys.path.append(path.join(path.dirname(ROOT), 'data'))
+from dataset import BridgeDataset, parse_threshold  # pylint: disable=C0413
+from null_model import (  # pylint: disable=C0413
+    compute_statistics, get_code_group_counts,
+    DEFAULT_NULL_REPLICATES, DEFAULT_BOOTSTRAP_REPLICATES, DEFAULT_CONFIDENCE, DEFAULT_SEED
+)
+
+OUTPUT_FILENAME = 'distribution.png'
+VERTICAL_IMAGE_SIZE_INCHES = 3
+HORIZONTAL_IMAGE_SIZE_INCHES = 3
+IMAGE_DPI = 250
+EXPECTED_OFFSET = 0.25
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s:%(name)s %(message)s'
+)
+
+
+class ComputeDistribution:
+
+    def __init__(self, cli_args, dataset: Optional[BridgeDataset] = None):
+        self.cli_args = cli_args
+
+        self.dataset = dataset if dataset is not None else BridgeDataset.open(threshold=cli_args.threshold)
+
+        logging.info('Reading data from store %s', self.dataset.dirpath)
+        self.counts = None
+        self.statistics = None
+
+    def get_bridge_counts(self):
+        counts = []
+
+        for group in self.dataset.get_groups(num_aromatics=3):  # 5JNQ and 3GLJ are buggy
+            bridge = (group[0:3], group[3:6], group[6:9])
+            counts.append((bridge, self.dataset.get_group_size(group)))
+
+        self.counts = sorted(counts, key=lambda count: count[1], reverse=True)
+
+    def get_statistics(self):
+        groups = [''.join(count[0]) for count in self.counts]
+        _, code_counts = get_code_group_counts(self.dataset, groups)
+
+        logging.info(
+            'Running %i null model and %i bootstrap replicates over %i codes',
+            self.cli_args.null_replicates, self.cli_args.bootstrap_replicates, len(code_counts)
+        )
+
+        self.statistics = compute_statistics(
+            code_counts, groups,
+            null_replicates=self.cli_args.null_replicates,
+            bootstrap_replicates=self.cli_args.bootstrap_replicates,
+            confidence=self.cli_args.confidence,
+            seed=self.cli_args.seed
+        )
+
+        logging.info('{:>12} {:>10} {:>18} {:>10} {:>18}'.format('Group', 'Observed', 'CI', 'Expected', 'Null interval'))
+
+        for group in groups:
+            stats = self.statistics[group]
+            logging.info('{:>12} {:>10} {:>18} {:>10.1f} {:>18}'.format(
+                group, stats['observed'], '[{}, {}]'.format(stats['observed_lower'], stats['observed_upper']),
+                stats['expected'], '[{}, {}]'.format(stats['null_lower'], stats['null_upper'])
+            ))
+
+    def execute_pipeline(self):
+        self.get_bridge_counts()
+        self.get_statistics()
+        return self.counts, self.statistics
+
+
+def get_command_line_arguments(argv: Optional[List[str]] = None):
+    parser = ArgumentParser(description='Plot the distribution of 3-bridge aromatic permutations')
+    parser.add_argument('--null-replicates', type=int, default=DEFAULT_NULL_REPLICATES, help='Number of null model replicates')
+    parser.add_argument('--bootstrap-replicates', type=int, default=DEFAULT_BOOTSTRAP_REPLICATES, help='Number of bootstrap replicates')
+    parser.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE, help='Confidence level of the intervals')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Seed for the random number generator')
+    parser.add_argument('--threshold', type=parse_threshold, metavar='DISTANCE[:ANGLE]', help='Select the bridges mined at this threshold of a --sweep store')
+    return parser.parse_args(argv)
+
+
+def run(cli_args, dataset: Optional[BridgeDataset] = None):
+    distributions, statistics = ComputeDistribution(cli_args, dataset).execute_pipeline()
+
+    pyplot.rcdefaults()
+    figure, ax = pyplot.subplots(
+        figsize=(HORIZONTAL_IMAGE_SIZE_INCHES, VERTICAL_IMAGE_SIZE_INCHES)
+    )
+
+    categories, counts, observed_errors, expected, expected_errors = [], [], [[], []], [], [[], []]
+    for count in distributions:
+        categories.append(r'{' + ', '.join(count[0]) + r'}')
+        counts.append(count[1])
+
+        stats = statistics[''.join(count[0])]
+        observed_errors[0].append(count[1] - stats['observed_lower'])
+        observed_errors[1].append(stats['observed_upper'] - count[1])
+        expected.append(stats['expected'])
+        expected_errors[0].append(stats['expected'] - stats['null_lower'])
+        expected_errors[1].append(stats['null_upper'] - stats['expected'])
+
+    vertical_positions = range(len(categories))
+    ax.barh(
+        vertical_positions, counts, xerr=observed_errors, align='center', edgecolor='k', lw=0.5, color='r',
+        error_kw={'lw': 0.5, 'capsize': 1.5}, label='Observed'
+    )
+    ax.errorbar(  # Offset from the bar centers so the two sets of intervals do not overlap
+        expected, [position + EXPECTED_OFFSET for position in vertical_positions], xerr=expected_errors, fmt='D', ms=2, color='k', lw=0.5, capsize=1.5,
+        label='Expected'
+    )
+    ax.legend(fontsize=6, frameon=False)
+    ax.set_yticks(vertical_positions)
+    ax.set_yticklabels(categories, size=10)
+    ax.set_xlabel('Counts', size=10)
+    ax.spines['right'].set_visible(False)
+    ax.spines['top'].set_visible(False)
+    ax.invert_yaxis()
+
+    rootdir = path.join(ROOT, 'plots')
+    makedirs(rootdir, exist_ok=True)
+
+    export_file = path.join(rootdir, OUTPUT_FILENAME)
+    logging.info('Exporting file to %s', export_file)
+    figure.savefig(export_file, dpi=IMAGE_DPI, bbox_inches='tight')
+    pyplot.close(figure)  # Stages can share a process, see nbridges.py
+
+    logging.info('Done!')
+
+
+def main(argv: Optional[List[str]] = None):
+    run(get_command_line_arguments(argv))
+
+if __name__ == '__main__':
+    main()
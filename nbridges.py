@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+Single entry point for mining bridges and every analysis stage:
+
+    $ python3 nbridges.py mine --workers 32 --sink columnar
+    $ python3 nbridges.py dist --null-replicates 1000
+    $ python3 nbridges.py convex
+    $ python3 nbridges.py convex-groupby --workers 8
+    $ python3 nbridges.py density --sigma 0
+    $ python3 nbridges.py all
+    $ python3 nbridges.py all --threshold 5.0:109.5
+
+Arguments following a stage are passed to the script of that stage. Each
+stage script is only imported when the stage runs, so matplotlib, networkx,
+pymongo and MetAromatic are not loaded by stages that do not need them. The
+all subcommand opens the columnar store once, then runs every analysis stage
+over the same dataset in one process using the default arguments of each. A
+store mined with --sweep needs the threshold of the bridges to analyse.
+"""
+
+import sys
+import logging
+from argparse import ArgumentParser, Namespace
+from importlib import util
+from os import path
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+ROOT = path.dirname(path.abspath(__file__))
+EXIT_FAILURE = 1
+STAGE_MINE = 'mine'
+STAGE_DIST = 'dist'
+STAGE_CONVEX = 'convex'
+STAGE_CONVEX_GROUPBY = 'convex-groupby'
+STAGE_DENSITY = 'density'
+STAGE_ALL = 'all'
+STAGE_SCRIPTS = {
+    STAGE_MINE: path.join(ROOT, 'data', 'get_n_3_bridge_transformations_json.py'),
+    STAGE_DIST: path.join(ROOT, 'distributions', 'get_3_bridge_distribution.py'),
+    STAGE_CONVEX: path.join(ROOT, 'convex_hulls', 'get_convex_hulls.py'),
+    STAGE_CONVEX_GROUPBY: path.join(ROOT, 'convex_hulls_groupby', 'get_convex_hulls_groupby.py'),
+    STAGE_DENSITY: path.join(ROOT, 'density', 'get_density_grids.py')
+}
+ANALYSIS_STAGES = (STAGE_DIST, STAGE_CONVEX, STAGE_CONVEX_GROUPBY, STAGE_DENSITY)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s:%(name)s %(message)s'
+)
+
+
+def import_stage(stage: str):
+    """ Import the script of a stage by path since the script directories are not packages """
+
+    spec = util.spec_from_file_location(stage.replace('-', '_'), STAGE_SCRIPTS[stage])
+    module = util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_stage(stage: str, argv: List[str]) -> None:
+    import_stage(stage).main(argv)
+
+
+def run_all(threshold: Optional[str] = None) -> None:
+    """ Run every analysis stage over a single open store, optionally at one threshold of a sweep """
+
+    sys.path.append(path.join(ROOT, 'data'))
+    from dataset import BridgeDataset, parse_threshold  # pylint: disable=C0415
+
+    dataset = BridgeDataset.open(threshold=None if threshold is None else parse_threshold(threshold))
+    logging.info('Running %s over store %s', ', '.join(ANALYSIS_STAGES), dataset.dirpath)
+    timings = {}
+
+    for stage in ANALYSIS_STAGES:
+        start = perf_counter()
+        script = import_stage(stage)
+
+        if stage == STAGE_CONVEX:
+            script.run(dataset)
+        else:
+            script.run(script.get_command_line_arguments([]), dataset)
+
+        timings[stage] = perf_counter() - start
+
+    for stage, seconds in timings.items():
+        logging.info('{:>16} {:>10.2f} s'.format(stage, seconds))
+
+
+def get_command_line_arguments(argv: Optional[List[str]] = None) -> Tuple[Namespace, List[str]]:
+    """ Returns the stage, alongside the threshold for all, and the arguments left for its script, including --help """
+
+    parser = ArgumentParser(description='Mine n-bridges and run the analysis stages')
+    subparsers = parser.add_subparsers(dest='stage', required=True)
+
+    for stage in STAGE_SCRIPTS:
+        subparsers.add_parser(stage, add_help=False, help='Run {}'.format(path.relpath(STAGE_SCRIPTS[stage], ROOT)))
+
+    parser_all = subparsers.add_parser(STAGE_ALL, help='Run every analysis stage over the columnar store, opened once')
+    parser_all.add_argument('--threshold', metavar='DISTANCE[:ANGLE]', help='Select the bridges mined at this threshold of a --sweep store')
+
+    cli_args, stage_argv = parser.parse_known_args(argv)
+    if cli_args.stage == STAGE_ALL and stage_argv:
+        parser.error('unrecognized arguments: {}'.format(' '.join(stage_argv)))
+
+    return cli_args, stage_argv
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    cli_args, stage_argv = get_command_line_arguments(argv)
+
+    if cli_args.stage == STAGE_ALL:
+        run_all(cli_args.threshold)
+    else:
+        run_stage(cli_args.stage, stage_argv)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""
+Modules under data/ import one another by name (i.e. from transformer import
+Transformer) since they are run as scripts from within that directory. Put
+data/ on the path so that these modules also import under pytest.
+"""
+
+import sys
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'data'))
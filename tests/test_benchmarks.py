@@ -0,0 +1,39 @@
+"""
+Unit testing the benchmark fixtures and the regression check
+"""
+
+from numpy import array, linalg
+from pytest import approx
+from benchmarks.run_benchmarks import compare_results, get_summary, synthesize_fixtures
+from data.structure_cache import StructureCache
+
+
+def test_synthesized_fixtures(tmp_path) -> None:
+    cache = StructureCache(str(tmp_path))
+    codes = synthesize_fixtures(cache, 3, 'A', 'cp', 6.0, 360.0)
+    assert codes == sorted(codes) and len(codes) == 3
+
+    entry = cache.get(codes[0], 'A', 'cp', 6.0, 360.0)
+    assert entry['exit_code'] == 0
+    assert len(entry['results']) > 0
+
+    rows = [row for rows in entry['transport'].values() for row in rows]
+    atoms = {(row[3] + row[5], row[2]): array(row[6:9]).astype(float) for row in rows}
+
+    # Rigid motions preserve the distance of each aromatic centroid to the origin of the methionine frame
+    for result in entry['results']:
+        aromatic = '{}{}'.format(result['aromatic_residue'], result['aromatic_position'])
+        ring = ('CD2', 'CH2') if result['aromatic_residue'] == 'TRP' else ('CG', 'CZ')
+        centroid = 0.5 * (atoms[(aromatic, ring[0])] + atoms[(aromatic, ring[1])])
+        origin = atoms[('MET{}'.format(result['methionine_position']), 'CG')]
+        assert linalg.norm(centroid - origin) == approx(result['norm'], abs=1e-2)
+
+def test_compare_results() -> None:
+    baseline = {'benchmarks': {'a': get_summary([1.0, 1.2], 10), 'b': get_summary([1.0], 10), 'c': get_summary([1.0], 1)}}
+    current = {'benchmarks': {'a': get_summary([1.1, 2.0], 10), 'b': get_summary([1.5], 10), 'd': get_summary([1.0], 1)}}
+
+    rows = {row['name']: row for row in compare_results(baseline, current, threshold=0.25)}
+    assert sorted(rows) == ['a', 'b']
+    assert rows['a']['ratio'] == approx(1.1)
+    assert not rows['a']['regression']
+    assert rows['b']['regression']
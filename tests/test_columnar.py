@@ -0,0 +1,148 @@
+"""
+Unit testing the columnar store of mapped bridges
+"""
+
+from json import dump
+from pytest import approx, raises
+from numpy import array
+from data.columnar import convert_json, load_columns, read_index, get_documents, split_residue, ColumnarWriter
+
+DOCUMENTS = [
+    {
+        'MET95': [[0.0, 0.0, 0.0], [1.79, 0.0, 0.0], [2.05, 1.83, 0.0]],
+        'TYR68': [4.32, 4.58, -1.75],
+        'PHE99': [1.35, 4.29, 3.49],
+        'TYR90': [5.78, 0.66, 2.59],
+        'code': '8I1B'
+    },
+    {
+        'MET326': [[0.0, 0.0, 0.0], [1.80, 0.0, 0.0], [2.16, 1.80, 0.0]],
+        'TRP226': [-2.49, -4.23, 1.11],
+        'PHE12': [3.01, 2.02, -0.5],
+        'PHE13': [1.01, 1.02, -1.5],
+        'code': '7MDH'
+    },
+    {
+        'MET5': [[0.0, 0.0, 0.0], [1.81, 0.0, 0.0], [2.10, 1.79, 0.0]],
+        'TYR7': [2.49, 4.23, 1.11],
+        'PHE8': [-3.01, 2.02, 0.5],
+        'TYR9': [0.01, -1.02, 1.5],
+        'code': '7AHL'
+    }
+]
+
+INSERTION_DOCUMENT = {  # Residues with insertion codes, i.e. antibody numbering
+    'MET100A': [[0.0, 0.0, 0.0], [1.80, 0.0, 0.0], [2.10, 1.80, 0.0]],
+    'TYR27': [2.0, 4.0, 1.0],
+    'TYR27A': [-3.0, 2.0, 0.5],
+    'PHE-1B': [0.5, -1.0, 1.5],
+    'code': '1IGT'
+}
+
+
+def test_split_residue() -> None:
+    assert split_residue('TYR68') == ('TYR', 68, '')
+    assert split_residue('MET100A') == ('MET', 100, 'A')
+    assert split_residue('PHE-1B') == ('PHE', -1, 'B')
+
+    with raises(ValueError):
+        split_residue('TYR68AB')
+
+def test_convert_sorts_into_groups(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump(DOCUMENTS, f)
+
+    index = convert_json(json_filepath, dirpath)
+    assert index == read_index(dirpath)
+    assert list(index['groups']) == ['PHEPHETRP', 'PHETYRTYR']
+    assert index['groups']['PHETYRTYR']['bridges'] == [1, 3]
+
+    columns = load_columns(dirpath)
+    start, end = index['groups']['PHETYRTYR']['residues']['TYR']
+    assert columns['satellite_residue'][start:end].tolist() == [b'TYR'] * 4
+
+    start, end = index['groups']['PHEPHETRP']['residues']['TRP']
+    assert columns['satellite_xyz'][start:end] == approx(array([DOCUMENTS[1]['TRP226']]))
+
+def test_get_documents_roundtrip(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump(DOCUMENTS, f)
+
+    index = convert_json(json_filepath, dirpath)
+    columns = load_columns(dirpath)
+
+    documents = []
+    for ranges in index['groups'].values():
+        documents.extend(get_documents(columns, ranges))
+
+    expected = [dict(document, _id='{}_{}'.format(document['code'], residue)) for document, residue in zip(DOCUMENTS, ('MET95', 'MET326', 'MET5'))]
+    assert sorted(documents, key=lambda d: d['code']) == sorted(expected, key=lambda d: d['code'])
+
+def test_append_invalidates_index(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump(DOCUMENTS[:2], f)
+
+    convert_json(json_filepath, dirpath)
+
+    writer = ColumnarWriter(dirpath)
+    writer.write(DOCUMENTS[2])
+    writer.close()
+
+    assert read_index(dirpath) is None
+
+def test_insertion_codes_roundtrip(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump(DOCUMENTS + [INSERTION_DOCUMENT], f)
+
+    index = convert_json(json_filepath, dirpath)
+    columns = load_columns(dirpath)
+
+    assert sorted(columns['bridge_met_insertion'].tolist()) == [b'', b'', b'', b'A']
+    assert get_documents(columns, index['groups']['PHETYRTYR'])[-1] == dict(INSERTION_DOCUMENT, _id='1IGT_MET100A')
+
+def test_chains(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+    documents = [dict(DOCUMENTS[0], chain='B'), dict(DOCUMENTS[2], chain='A'), dict(DOCUMENTS[0], chain='A')]
+
+    with open(json_filepath, 'w') as f:
+        dump(documents, f)
+
+    index = convert_json(json_filepath, dirpath)
+    columns = load_columns(dirpath)
+    group = index['groups']['PHETYRTYR']
+
+    # Bridges are ordered by chain within a group, keeping their order within a chain
+    assert group['chains'] == {'A': [0, 2], 'B': [2, 3]}
+    assert columns['bridge_code'].tolist() == [b'7AHL', b'8I1B', b'8I1B']
+
+    chain_a = get_documents(columns, dict(group, bridges=group['chains']['A']))
+    chain_b = get_documents(columns, dict(group, bridges=group['chains']['B']))
+    assert [document['_id'] for document in chain_a] == ['7AHL_A_MET5', '8I1B_A_MET95']
+    assert chain_b == [dict(documents[0], _id='8I1B_B_MET95')]
+
+def test_write_requires_one_methionine(tmp_path) -> None:
+    writer = ColumnarWriter(str(tmp_path / 'transformations.columns'))
+    two_methionines = dict(DOCUMENTS[0], MET96=DOCUMENTS[0]['MET95'])
+    no_methionine = {key: value for key, value in DOCUMENTS[0].items() if key != 'MET95'}
+
+    # Either would shift the bridge rows of every later bridge
+    for document in (two_methionines, no_methionine):
+        with raises(ValueError):
+            writer.write(document)
+
+    writer.write(DOCUMENTS[0])
+    writer.close()
+    assert load_columns(str(tmp_path / 'transformations.columns'))['bridge_code'].tolist() == [b'8I1B']
@@ -0,0 +1,97 @@
+"""
+Unit testing the shared dataset loader used by the analysis scripts
+"""
+
+from json import dump
+from pytest import approx, fixture, raises
+from numpy import array
+from data.columnar import convert_json
+from data.dataset import BridgeDataset, parse_threshold
+from tests.test_columnar import DOCUMENTS
+
+
+@fixture
+def dataset(tmp_path) -> BridgeDataset:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump(DOCUMENTS, f)
+
+    convert_json(json_filepath, dirpath)
+    return BridgeDataset(dirpath)
+
+
+def test_missing_store(tmp_path) -> None:
+    with raises(FileNotFoundError):
+        BridgeDataset(str(tmp_path / 'missing.columns'))
+
+    with raises(SystemExit):
+        BridgeDataset.open(str(tmp_path / 'missing.columns'))
+
+def test_groups(dataset) -> None:
+    assert len(dataset) == 3
+    assert dataset.get_groups(num_aromatics=3) == ['PHEPHETRP', 'PHETYRTYR']
+    assert dataset.get_groups(num_aromatics=2) == []
+    assert dataset.get_group_size('PHETYRTYR') == 2
+    assert len(dataset.get_group_coordinates('PHETYRTYR')) == 6
+    assert [d['code'] for d in dataset.get_group_documents('PHEPHETRP')] == ['7MDH']
+
+def test_residue_coordinates(dataset) -> None:
+    expected = array([DOCUMENTS[1]['TRP226']])
+    assert dataset.get_residue_coordinates('TRP') == approx(expected)
+    assert len(dataset.get_residue_coordinates('PHE')) == 4
+    assert dataset.get_residue_coordinates('HIS').shape == (0, 3)
+
+def test_code_bridges(dataset) -> None:
+    rows = dataset.get_code_bridges('7AHL')
+    assert len(rows) == 1
+    assert dataset.columns['bridge_code'][rows[0]] == b'7AHL'
+    assert len(dataset.get_code_bridges('1ABC')) == 0
+
+def test_sweep_thresholds(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+    documents = [dict(document, cutoff_distance=6.0, cutoff_angle=360.0) for document in DOCUMENTS]
+    documents.append(dict(DOCUMENTS[0], cutoff_distance=4.9, cutoff_angle=109.5))
+
+    with open(json_filepath, 'w') as f:
+        dump(documents, f)
+
+    convert_json(json_filepath, dirpath)
+
+    # Pooling the bridges of every threshold would count 8I1B twice
+    with raises(ValueError):
+        BridgeDataset(dirpath)
+
+    with raises(SystemExit):
+        BridgeDataset.open(dirpath)
+
+    with raises(ValueError):
+        BridgeDataset(dirpath, threshold=(5.5, 360.0))
+
+    assert BridgeDataset(dirpath, threshold=(6.0, 360.0)).thresholds == [(4.9, 109.5), (6.0, 360.0)]
+    assert len(BridgeDataset(dirpath, threshold=(6.0, 360.0))) == 3
+
+    tight = BridgeDataset(dirpath, threshold=parse_threshold('4.9:109.5'))
+    assert tight.get_groups() == ['PHETYRTYR']
+    assert tight.get_group_size('PHETYRTYR') == 1
+    assert len(tight.get_residue_coordinates('TYR')) == 2
+    assert [d['code'] for d in tight.get_group_documents('PHETYRTYR')] == ['8I1B']
+
+def test_chains(tmp_path) -> None:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump([dict(DOCUMENTS[0], chain='A'), dict(DOCUMENTS[2], chain='A'), dict(DOCUMENTS[0], chain='B')], f)
+
+    convert_json(json_filepath, dirpath)
+    chains = BridgeDataset(dirpath)
+
+    assert chains.get_group_chains('PHETYRTYR') == ['A', 'B']
+    assert [d['_id'] for d in chains.get_group_documents('PHETYRTYR', 'B')] == ['8I1B_B_MET95']
+    assert len(chains.get_group_documents('PHETYRTYR', 'C')) == 0
+    assert len(chains.get_group_documents('PHETYRTYR')) == 3
+    assert len(chains.get_code_bridges('8I1B')) == 2
+    assert chains.columns['bridge_chain'][chains.get_code_bridges('8I1B', 'B')].tolist() == [b'B']
@@ -0,0 +1,117 @@
+"""
+Unit testing merging newly mined codes into an existing store and its artifacts
+"""
+
+from json import dump
+from pytest import approx, raises
+from data.columnar import convert_json, read_index, read_meta
+from data.dataset import BridgeDataset
+from data.delta import get_new_codes, merge_delta
+from data.density import DensityGrids, KIND_RESIDUES, KIND_GROUPS
+from data.hulls import HullCache, get_hull, get_data_hash
+from data.manifest import RunManifest, STATUS_NO_BRIDGES
+from tests.test_columnar import DOCUMENTS
+
+NEW_DOCUMENT = {
+    'MET40': [[0.0, 0.0, 0.0], [1.80, 0.0, 0.0], [2.12, 1.81, 0.0]],
+    'TYR41': [-4.0, -3.0, -2.0],
+    'PHE42': [4.5, -3.5, 3.0],
+    'TYR43': [0.5, 5.0, -4.0],
+    'code': '1ABC'
+}
+
+
+def make_store(tmp_path, name: str, documents: list) -> str:
+    json_filepath = str(tmp_path / '{}.json'.format(name))
+    dirpath = str(tmp_path / '{}.columns'.format(name))
+
+    with open(json_filepath, 'w') as f:
+        dump(documents, f)
+
+    convert_json(json_filepath, dirpath)
+    return dirpath
+
+
+def test_get_new_codes(tmp_path) -> None:
+    dirpath = make_store(tmp_path, 'base', DOCUMENTS[:2])
+    manifest_filepath = str(tmp_path / 'manifest.jsonl')
+
+    with RunManifest(manifest_filepath) as manifest:
+        manifest.record('2XYZ', STATUS_NO_BRIDGES)
+
+    codes = ['8I1B', '7MDH', '2XYZ', '7AHL', '1ABC']
+    assert get_new_codes(codes, store_dirpath=dirpath) == ['2XYZ', '7AHL', '1ABC']
+    assert get_new_codes(codes, manifest_filepath, dirpath) == ['7AHL', '1ABC']
+
+def test_merge_delta(tmp_path) -> None:
+    dirpath = make_store(tmp_path, 'base', DOCUMENTS[:2])
+    delta_dirpath = make_store(tmp_path, 'delta', DOCUMENTS[2:] + [NEW_DOCUMENT])
+    grids_filepath = str(tmp_path / 'density.npz')
+    cache = HullCache(str(tmp_path / 'cache'))
+
+    before = BridgeDataset(dirpath)
+    get_hull([before.get_group_coordinates('PHETYRTYR')], cache)
+    get_hull(before.get_residue_coordinate_slices('TYR'), cache)
+
+    grids = DensityGrids()
+    grids.add_documents(DOCUMENTS[:2])
+    grids.save(grids_filepath)
+    del before
+
+    touched = merge_delta(dirpath, delta_dirpath, grids_filepath, cache)
+    assert touched == {KIND_RESIDUES: ['PHE', 'TYR'], KIND_GROUPS: ['PHETYRTYR']}
+
+    index = read_index(dirpath)
+    assert index['groups']['PHETYRTYR']['bridges'] == [1, 4]
+    assert read_meta(dirpath)['num_bridges'] == 4
+
+    # Cached hulls were extended with the new points rather than recomputed
+    after = BridgeDataset(dirpath)
+    for batches in ([after.get_group_coordinates('PHETYRTYR')], after.get_residue_coordinate_slices('TYR')):
+        cached = cache.get(get_data_hash(batches))
+        expected = get_hull(batches)
+        assert cached['num_points'] == expected['num_points']
+        assert cached['volume'] == approx(expected['volume'])
+        assert len(cached['vertices']) == len(expected['vertices'])
+
+    # Only hulls computed before the merge are carried over
+    assert cache.get(get_data_hash(after.get_residue_coordinate_slices('PHE'))) is None
+
+    expected_grids = DensityGrids()
+    expected_grids.add_documents(DOCUMENTS + [NEW_DOCUMENT])
+    merged_grids = DensityGrids.load(grids_filepath)
+    for kind, kind_grids in expected_grids.grids.items():
+        for key, grid in kind_grids.items():
+            assert (merged_grids.grids[kind][key].counts == grid.counts).all()
+
+def test_merge_delta_twice(tmp_path) -> None:
+    dirpath = make_store(tmp_path, 'base', DOCUMENTS[:2])
+    delta_dirpath = make_store(tmp_path, 'delta', DOCUMENTS[1:] + [NEW_DOCUMENT])  # 7MDH is already in the store
+    grids_filepath = str(tmp_path / 'density.npz')
+
+    grids = DensityGrids()
+    grids.add_documents(DOCUMENTS[:2])
+    grids.save(grids_filepath)
+
+    assert merge_delta(dirpath, delta_dirpath, grids_filepath) == {KIND_RESIDUES: ['PHE', 'TYR'], KIND_GROUPS: ['PHETYRTYR']}
+    index = read_index(dirpath)
+
+    assert merge_delta(dirpath, delta_dirpath, grids_filepath) == {KIND_RESIDUES: [], KIND_GROUPS: []}
+    assert read_index(dirpath) == index
+    assert read_meta(dirpath)['num_bridges'] == 4
+
+    merged_grids = DensityGrids.load(grids_filepath)
+    assert merged_grids.codes == {'8I1B', '7MDH', '7AHL', '1ABC'}
+    assert merged_grids.grids[KIND_RESIDUES]['TYR'].num_points == 6
+
+def test_merge_sweep_thresholds(tmp_path) -> None:
+    dirpath = make_store(tmp_path, 'base', [dict(document, cutoff_distance=6.0, cutoff_angle=360.0) for document in DOCUMENTS])
+    delta_dirpath = make_store(tmp_path, 'delta', [dict(NEW_DOCUMENT, cutoff_distance=4.9, cutoff_angle=109.5)])
+
+    with raises(ValueError):
+        merge_delta(dirpath, delta_dirpath, cache=HullCache(str(tmp_path / 'cache')))
+
+    assert read_meta(dirpath)['num_bridges'] == 3
+
+    merge_delta(dirpath, delta_dirpath)
+    assert read_index(dirpath)['thresholds'] == [[4.9, 109.5], [6.0, 360.0]]
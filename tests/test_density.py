@@ -0,0 +1,73 @@
+"""
+Unit testing voxel density grids
+"""
+
+from pytest import approx, raises
+from numpy import array
+from data.density import DensityGrid, DensityGrids, get_enclosing_level, merge_grid_files, KIND_RESIDUES, KIND_GROUPS
+from tests.test_sinks import DOCUMENTS
+
+
+def test_add_points() -> None:
+    grid = DensityGrid(limit=2.0, voxel_size=1.0)
+    grid.add_points(array([[0.5, 0.5, 0.5], [0.1, 0.9, 0.2], [-1.5, 1.5, -0.5], [2.5, 0.0, 0.0]]))
+
+    assert grid.counts.shape == (4, 4, 4)
+    assert grid.counts[2, 2, 2] == 2
+    assert grid.counts[0, 3, 1] == 1
+    assert grid.num_outside == 1
+    assert grid.num_points == 4
+    assert grid.get_density().sum() == approx(0.75)
+
+    grid = DensityGrid(limit=4.0, voxel_size=1.0)
+    grid.add_points(array([[0.5, 0.5, 0.5]]))
+    assert grid.get_density(sigma=0.5).sum() == approx(1.0)  # Smoothing away from the edges conserves mass
+    assert grid.get_density(sigma=0.5).max() < 1.0
+
+def test_merge_grids() -> None:
+    points = array([[0.5, 0.5, 0.5], [-1.5, 1.5, -0.5]])
+
+    grid, other = DensityGrid(2.0, 1.0), DensityGrid(2.0, 1.0)
+    grid.add_points(points[:1])
+    other.add_points(points[1:])
+    grid.merge(other)
+
+    expected = DensityGrid(2.0, 1.0)
+    expected.add_points(points)
+    assert grid.counts.tolist() == expected.counts.tolist()
+
+    with raises(ValueError):
+        grid.merge(DensityGrid(2.0, 0.5))
+
+def test_enclosing_level() -> None:
+    density = array([0.0, 5.0, 3.0, 1.0, 1.0])
+    assert get_enclosing_level(density, 0.5) == 5.0
+    assert get_enclosing_level(density, 0.7) == 3.0
+    assert get_enclosing_level(density, 1.0) == 1.0
+
+def test_documents_and_shards(tmp_path) -> None:
+    shard_1, shard_2 = DensityGrids(), DensityGrids()
+    shard_1.add_documents(DOCUMENTS[:1])
+    shard_2.add_documents(DOCUMENTS[1:] + [dict(DOCUMENTS[1], topology='inverse')])
+
+    shard_1.save(str(tmp_path / 'shard_1.npz'))
+    shard_2.save(str(tmp_path / 'shard_2.npz'))
+    merged = merge_grid_files([str(tmp_path / 'shard_1.npz'), str(tmp_path / 'shard_2.npz')])
+
+    assert merged.grids[KIND_RESIDUES]['TYR'].num_points == 2
+    assert merged.grids[KIND_RESIDUES]['PHE'].num_points == 2
+    assert merged.grids[KIND_RESIDUES]['TRP'].num_points == 1
+    assert sorted(merged.grids[KIND_GROUPS]) == ['PHETRP', 'PHETYRTYR']
+    assert merged.grids[KIND_GROUPS]['PHETYRTYR'].num_points == 3
+
+def test_merge_overlapping_shards() -> None:
+    shard_1, shard_2 = DensityGrids(), DensityGrids()
+    shard_1.add_documents(DOCUMENTS[:2])
+    shard_2.add_documents(DOCUMENTS[1:])
+    num_points = shard_1.grids[KIND_RESIDUES]['TYR'].num_points
+
+    # A code mined by both shards would be counted twice
+    with raises(ValueError):
+        shard_1.merge(shard_2)
+
+    assert shard_1.grids[KIND_RESIDUES]['TYR'].num_points == num_points
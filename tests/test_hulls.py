@@ -0,0 +1,58 @@
+"""
+Unit testing convex hull summaries and their cache
+"""
+
+from itertools import product
+from pytest import approx
+from numpy import array, array_split
+from numpy.random import default_rng
+from scipy.spatial import ConvexHull
+from data.hulls import IncrementalHull, HullCache, get_hull, get_data_hash
+
+CUBE = array(list(product([0.0, 2.0], repeat=3)))
+
+
+def test_cube_hull() -> None:
+    hull = get_hull([CUBE, array([[1.0, 1.0, 1.0]])])
+    assert hull['volume'] == approx(8.0)
+    assert hull['area'] == approx(24.0)
+    assert len(hull['vertices']) == 8
+    assert len(hull['facets']) == 12
+    assert hull['num_points'] == 9
+
+def test_incremental_hull_matches_single_pass() -> None:
+    points = default_rng(0).normal(size=(2000, 3))
+    expected = ConvexHull(points)
+
+    hull = IncrementalHull()
+    for batch in array_split(points, 7):
+        hull.add_points(batch)
+
+    summary = hull.get_summary()
+    assert summary['volume'] == approx(expected.volume)
+    assert summary['area'] == approx(expected.area)
+    assert len(summary['vertices']) == len(expected.vertices)
+    assert summary['facets'].max() < len(summary['vertices'])
+
+    resumed = IncrementalHull.from_summary(summary)
+    resumed.add_points(CUBE * 10 - 10)  # Encloses every previous point
+    assert resumed.get_summary()['num_points'] == 2008
+    assert resumed.get_summary()['volume'] == approx(8000.0)
+
+def test_degenerate_hull() -> None:
+    hull = get_hull([CUBE[:4]])  # Square in the x = 0 plane
+    assert hull['volume'] == 0.0
+    assert len(hull['facets']) == 0
+    assert len(hull['vertices']) == 4
+
+def test_hull_cache(tmp_path) -> None:
+    cache = HullCache(str(tmp_path))
+    hull = get_hull([CUBE], cache)
+
+    key = get_data_hash([CUBE])
+    cached = cache.get(key)
+    assert cached['volume'] == approx(hull['volume'])
+    assert cached['facets'].tolist() == hull['facets'].tolist()
+
+    assert get_data_hash([CUBE[:4], CUBE[4:]]) != key
+    assert cache.get(get_data_hash([CUBE * 2])) is None
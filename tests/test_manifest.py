@@ -0,0 +1,38 @@
+"""
+Unit testing the mining run manifest
+"""
+
+from data.manifest import RunManifest, STATUS_DONE, STATUS_NO_BRIDGES, STATUS_FAILED
+
+
+def test_resume_skips_finished_codes(tmp_path) -> None:
+    filepath = str(tmp_path / 'manifest.jsonl')
+    codes = ['8I1B', '7MDH', '7AHL', '1ABC']
+
+    with RunManifest(filepath) as manifest:
+        manifest.record('8I1B', STATUS_DONE)
+        manifest.record('7MDH', STATUS_NO_BRIDGES)
+        manifest.record('7AHL', STATUS_FAILED, 'Traceback')
+
+    with RunManifest(filepath) as manifest:
+        assert manifest.get_pending_codes(codes) == ['1ABC']
+        assert manifest.get_failed_codes(codes) == ['7AHL']
+        assert manifest.statuses['7AHL']['error'] == 'Traceback'
+
+def test_last_record_wins(tmp_path) -> None:
+    filepath = str(tmp_path / 'manifest.jsonl')
+
+    with RunManifest(filepath) as manifest:
+        manifest.record('7AHL', STATUS_FAILED, 'Traceback')
+        manifest.record('7AHL', STATUS_DONE)
+
+    with RunManifest(filepath) as manifest:
+        assert manifest.get_status('7AHL') == STATUS_DONE
+        assert not manifest.get_failed_codes(['7AHL'])
+
+def test_truncated_line_is_ignored(tmp_path) -> None:
+    filepath = tmp_path / 'manifest.jsonl'
+    filepath.write_text('{"code": "8I1B", "status": "done", "error": null}\n{"code": "7MD')
+
+    with RunManifest(str(filepath)) as manifest:
+        assert manifest.get_pending_codes(['8I1B', '7MDH']) == ['7MDH']
@@ -0,0 +1,58 @@
+"""
+Unit testing the mining run metrics
+"""
+
+from json import loads
+from pytest import approx, raises
+from data.metrics import MetricsLog, run_stage, get_percentiles
+from data.sinks import NDJSONSink
+from tests.test_sinks import DOCUMENTS
+
+
+def test_run_stage() -> None:
+    assert run_stage(None, 'stage', max, 1, 2) == 2
+
+    timings = {}
+    run_stage(timings, 'stage', max, 1, 2)
+    run_stage(timings, 'stage', min, 1, 2)
+    assert list(timings) == ['stage']
+    assert timings['stage'] >= 0.0
+
+    with raises(ZeroDivisionError):  # Stages which raise are still timed
+        run_stage(timings, 'failed', lambda: 1 / 0)
+
+    assert 'failed' in timings
+
+def test_percentiles() -> None:
+    summary = get_percentiles([float(u) for u in range(1, 101)])
+    assert summary['count'] == 100
+    assert summary['p50'] == approx(50.5)
+    assert summary['p99'] == approx(99.01)
+    assert get_percentiles([])['p95'] == 0.0
+
+def test_metrics_log(tmp_path) -> None:
+    filepath = str(tmp_path / 'metrics.jsonl')
+
+    with MetricsLog(filepath, num_codes=3) as metrics, NDJSONSink(str(tmp_path / 'out.ndjson')) as sink:
+        sink.metrics = metrics
+        metrics.record_code('8I1B', 'done', {'graph': 0.5, 'total': 1.0})
+        metrics.record_code('7MDH', 'no_bridges', None)
+
+        for document in DOCUMENTS:
+            sink.write(document)
+
+        sink.flush()
+
+    with open(filepath) as f:
+        events = [loads(line) for line in f]
+
+    assert [event['event'] for event in events] == ['code', 'code', 'sink', 'summary']
+    assert events[0]['stages'] == {'graph': 0.5, 'total': 1.0}
+    assert events[1]['done'] == 2 and events[1]['eta'] >= 0.0
+    assert events[2]['documents'] == 2
+
+    summary = events[-1]
+    assert summary['codes'] == 2
+    assert summary['documents'] == 2
+    assert summary['stages']['total']['p50'] == approx(1.0)
+    assert summary['stages']['sink']['count'] == 1
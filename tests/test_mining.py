@@ -0,0 +1,249 @@
+"""
+Unit testing the mining script end to end over a small local mirror, with
+MetAromatic stubbed by the local parser and pair kernel
+"""
+
+import sys
+from json import loads
+from math import cos, sin, pi
+from types import ModuleType
+from pytest import approx, fixture
+from data import get_n_3_bridge_transformations_json as mining
+from data.columnar import load_columns
+from data.manifest import RunManifest, STATUS_DONE, STATUS_NO_BRIDGES, STATUS_FAILED
+from data.pair_kernel import RING_ATOMS, get_pairs
+from data.pdb_parser import get_transport, parse_structure
+
+RING_RADIUS = 1.39
+
+# Chain, residue, position and either the SD position of a methionine or the ring center of an aromatic
+RESIDUES = [
+    # A 3-bridge
+    ('A', 'MET', 10, (0.0, 0.0, 0.0)),
+    ('A', 'PHE', 11, (0.0, 0.0, 4.5)),
+    ('A', 'TYR', 12, (0.0, 4.5, 0.0)),
+    ('A', 'TRP', 13, (0.0, -4.5, 0.0)),
+    # A 2-bridge
+    ('A', 'MET', 30, (30.0, 0.0, 0.0)),
+    ('A', 'PHE', 31, (30.0, 0.0, 4.5)),
+    ('A', 'TYR', 32, (30.0, 4.5, 0.0)),
+    # An inverse 3-bridge, MET - PHE - MET - TYR
+    ('A', 'MET', 50, (60.0, 0.0, 0.0)),
+    ('A', 'MET', 51, (67.0, 0.0, 0.0)),
+    ('A', 'PHE', 52, (63.5, 0.0, 3.0)),
+    ('A', 'TYR', 53, (67.0, 0.0, -4.5)),
+    # The same 3-bridge on another chain
+    ('B', 'MET', 10, (0.0, 100.0, 0.0)),
+    ('B', 'PHE', 11, (0.0, 100.0, 4.5)),
+    ('B', 'TYR', 12, (0.0, 104.5, 0.0)),
+    ('B', 'TRP', 13, (0.0, 95.5, 0.0))
+]
+CODE = '1ABC'
+CODE_NO_BRIDGES = '2DEF'
+CODE_MISSING = '3GHI'
+
+
+def get_atoms(residue: str, center: tuple) -> list:
+    x, y, z = center
+
+    if residue == 'MET':  # The CG - SD - CE frame the transformations map to
+        return [('CG', (x - 0.25, y + 1.80, z)), ('SD', (x, y, z)), ('CE', (x + 1.75, y, z))]
+
+    return [
+        (name.decode(), (x + RING_RADIUS * cos(u * pi / 3), y + RING_RADIUS * sin(u * pi / 3), z))
+        for u, name in enumerate(RING_ATOMS[residue.encode()])
+    ]
+
+
+def get_pdb(residues: list) -> str:
+    lines = []
+
+    for chain, residue, position, center in residues:
+        for name, (x, y, z) in get_atoms(residue, center):
+            lines.append('ATOM  {:>5} {:<4} {:>3} {:1}{:>4}    {:>8.3f}{:>8.3f}{:>8.3f}{:>6.2f}{:>6.2f}          {:>2}'.format(
+                len(lines) + 1, name if len(name) == 4 else ' ' + name, residue, chain, position, x, y, z, 1.0, 20.0, name[0]
+            ))
+
+    return '\n'.join(lines + ['END']) + '\n'
+
+
+@fixture
+def mirror(tmp_path) -> str:
+    mirror_dir = tmp_path / 'mirror'
+    mirror_dir.mkdir()
+
+    (mirror_dir / '{}.pdb'.format(CODE.lower())).write_text(get_pdb(RESIDUES))
+    (mirror_dir / '{}.pdb'.format(CODE_NO_BRIDGES.lower())).write_text(get_pdb([RESIDUES[0], ('A', 'PHE', 11, (20.0, 20.0, 20.0))]))
+
+    return str(mirror_dir)
+
+
+@fixture
+def metaromatic(monkeypatch, mirror) -> list:
+    """ Stand-in for MetAromatic which serves structures of the mirror. Returns the codes it was called with """
+
+    calls = []
+
+    class MetAromatic:
+
+        def __init__(self, cutoff_distance: float, cutoff_angle: float, chain: str, model: str) -> None:
+            self.cutoff_distance = cutoff_distance
+            self.cutoff_angle = cutoff_angle
+            self.chain = chain
+            self.transport = {}
+
+        def get_met_aromatic_interactions(self, code: str) -> dict:
+            calls.append(code)
+            filepath = mining.find_structure(mirror, code)
+
+            if filepath is None:
+                return {'exit_code': mining.EXIT_FAILURE}
+
+            atoms = parse_structure(filepath, self.chain)
+            self.transport = get_transport(atoms)
+
+            # MetAromatic does not tag its results with a chain
+            results = get_pairs(atoms, self.cutoff_distance, self.cutoff_angle)
+            return {'exit_code': 0, 'results': [{k: v for k, v in result.items() if k != 'chain'} for result in results]}
+
+    pair = ModuleType('MetAromatic.core.pair')
+    pair.MetAromatic = MetAromatic
+
+    for name, module in (('MetAromatic', ModuleType('MetAromatic')), ('MetAromatic.core', ModuleType('MetAromatic.core'))):
+        monkeypatch.setitem(sys.modules, name, module)
+
+    monkeypatch.setitem(sys.modules, 'MetAromatic.core.pair', pair)
+    return calls
+
+
+def get_residues(transformations: list) -> list:
+    """ The residue keys of each transformation, i.e. ['MET10', 'PHE11', 'TRP13', 'TYR12'] """
+    return sorted(sorted(key for key in transformation if key[:3] in ('MET', 'PHE', 'TYR', 'TRP')) for transformation in transformations)
+
+
+def read_ndjson(filepath: str) -> dict:
+    with open(filepath) as f:
+        return {document['_id']: document for document in map(loads, f)}
+
+
+def run_main(tmp_path, codes: list, *argv: str) -> None:
+    codes_filepath = tmp_path / 'codes.csv'
+    codes_filepath.write_text(''.join(code + '\n' for code in codes))
+
+    mining.main([
+        '--codes', str(codes_filepath), '--manifest', str(tmp_path / 'manifest.jsonl'), '--no-cache', *argv
+    ])
+
+
+def test_import_does_not_load_metaromatic() -> None:
+    assert mining.CHAIN == 'A'
+    assert 'MetAromatic' not in sys.modules
+
+def test_three_bridges_mirror(mirror) -> None:
+    _, transformations, error, timings = mining.mine_code(CODE, mirror_dir=mirror, collect_timings=True)
+
+    assert error is None
+    assert get_residues(transformations) == [['MET10', 'PHE11', 'TRP13', 'TYR12']]
+    assert transformations[0]['order'] == 3
+    assert transformations[0]['topology'] == mining.TOPOLOGY_NORMAL
+    assert 'chain' not in transformations[0]
+    assert 'local_pairs' in timings and 'met_aromatic' not in timings
+
+    # Mapped into the methionine frame, where CG is the origin and SD lies along x
+    assert transformations[0]['MET10'][0] == approx([0.0, 0.0, 0.0])
+    assert transformations[0]['MET10'][1][1:] == approx([0.0, 0.0])
+    assert 'MetAromatic' not in sys.modules
+
+def test_three_bridges_metaromatic(mirror, metaromatic) -> None:
+    # Inverse bridges are only told apart once the bridges are transformed
+    getter = mining.CustomThreeBridgeGetter(CODE)
+    assert sorted(map(sorted, getter.get_bridging_interactions()['A'])) == [
+        ['MET10', 'PHE11', 'TRP13', 'TYR12'], ['MET50', 'MET51', 'PHE52', 'TYR53']
+    ]
+
+    _, transformations, error, _ = mining.mine_code(CODE)
+    _, local_transformations, _, _ = mining.mine_code(CODE, mirror_dir=mirror)
+
+    assert error is None
+    assert metaromatic == [CODE, CODE]
+    assert transformations == local_transformations
+
+    assert mining.mine_code(CODE_MISSING)[1:3] == (False, None)
+
+def test_orders_and_inverse_bridges(mirror) -> None:
+    _, transformations, _, _ = mining.mine_code(CODE, orders=None, include_inverse=True, mirror_dir=mirror)
+
+    # The inverse bridge is mapped once into the frame of each of its methionines
+    assert get_residues(transformations) == [
+        ['MET10', 'PHE11', 'TRP13', 'TYR12'], ['MET30', 'PHE31', 'TYR32'], ['MET50', 'PHE52', 'TYR53'], ['MET51', 'PHE52', 'TYR53']
+    ]
+    assert sorted((t['order'], t['topology']) for t in transformations) == [
+        (2, mining.TOPOLOGY_NORMAL), (3, mining.TOPOLOGY_INVERSE), (3, mining.TOPOLOGY_INVERSE), (3, mining.TOPOLOGY_NORMAL)
+    ]
+
+    _, transformations, _, _ = mining.mine_code(CODE, orders=[2], mirror_dir=mirror)
+    assert get_residues(transformations) == [['MET30', 'PHE31', 'TYR32']]
+
+def test_all_chains(mirror) -> None:
+    _, transformations, _, _ = mining.mine_code(CODE, mirror_dir=mirror, chain=None)
+
+    assert sorted(transformation['chain'] for transformation in transformations) == ['A', 'B']
+    assert get_residues(transformations) == [['MET10', 'PHE11', 'TRP13', 'TYR12']] * 2
+
+    # Both chains are mapped into the same frame
+    chain_a, chain_b = sorted(transformations, key=lambda transformation: transformation['chain'])
+    assert chain_a['PHE11'] == approx(chain_b['PHE11'])
+
+def test_main_pool(tmp_path, mirror, metaromatic) -> None:
+    output = str(tmp_path / 'transformations.columns')
+    run_main(
+        tmp_path, [CODE, CODE_NO_BRIDGES, CODE_MISSING],
+        '--mirror', mirror, '--sink', 'columnar', '--output', output, '--workers', '2', '--chunksize', '1',
+        '--all-orders', '--inverse', '--all-chains'
+    )
+
+    columns = load_columns(output)
+    assert sorted(zip(columns['bridge_chain'].tolist(), columns['bridge_met_position'].tolist())) == [
+        (b'A', 10), (b'A', 30), (b'A', 50), (b'A', 51), (b'B', 10)
+    ]
+    assert columns['bridge_inverse'].sum() == 2
+
+    # MetAromatic is never asked for chains it cannot map, so the code missing from the mirror fails
+    assert metaromatic == []
+
+    with RunManifest(str(tmp_path / 'manifest.jsonl')) as manifest:
+        assert manifest.get_status(CODE) == STATUS_DONE
+        assert manifest.get_status(CODE_NO_BRIDGES) == STATUS_NO_BRIDGES
+        assert manifest.get_status(CODE_MISSING) == STATUS_FAILED
+
+def test_main_documents_and_resume(tmp_path, mirror, monkeypatch) -> None:
+    output = str(tmp_path / 'transformations.ndjson')
+    argv = ('--mirror', mirror, '--sink', 'ndjson', '--output', output, '--all-chains')
+
+    run_main(tmp_path, [CODE, CODE_NO_BRIDGES], *argv)
+    documents = read_ndjson(output)
+
+    assert sorted(documents) == ['1ABC_A_MET10', '1ABC_B_MET10']
+    assert all(document['code'] == CODE for document in documents.values())
+
+    mined = []
+
+    def mine_code(code: str, **kwargs) -> tuple:
+        mined.append(code)
+        return original(code, **kwargs)
+
+    original = mining.mine_code
+    monkeypatch.setattr(mining, 'mine_code', mine_code)
+
+    # Codes finished by the previous run are skipped
+    run_main(tmp_path, [CODE, CODE_NO_BRIDGES], *argv)
+    assert mined == []
+
+    # A run killed after its sink flushed but before the manifest caught up does not mine the code again
+    (tmp_path / 'manifest.jsonl').unlink()
+    run_main(tmp_path, [CODE, CODE_NO_BRIDGES], *argv)
+
+    assert mined == [CODE_NO_BRIDGES]
+    assert read_ndjson(output) == documents
+    with open(output) as f:
+        assert len(f.readlines()) == 2
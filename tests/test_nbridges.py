@@ -0,0 +1,55 @@
+"""
+Unit testing the single entry point over the mining and analysis stages
+"""
+
+from types import SimpleNamespace
+from pytest import raises
+import nbridges
+
+
+def get_stage(argv: list) -> tuple:
+    cli_args, stage_argv = nbridges.get_command_line_arguments(argv)
+    return cli_args.stage, stage_argv
+
+def test_get_command_line_arguments() -> None:
+    assert get_stage(['dist', '--seed', '3']) == ('dist', ['--seed', '3'])
+    assert get_stage(['convex-groupby', '--help']) == ('convex-groupby', ['--help'])
+    assert get_stage(['convex', '--threshold', '5.0']) == ('convex', ['--threshold', '5.0'])
+    assert get_stage(['all']) == ('all', [])
+    assert nbridges.get_command_line_arguments(['all', '--threshold', '5.0:109.5'])[0].threshold == '5.0:109.5'
+
+    with raises(SystemExit):
+        nbridges.get_command_line_arguments(['all', '--seed', '3'])
+
+    with raises(SystemExit):
+        nbridges.get_command_line_arguments(['plot'])
+
+
+def test_run_all(monkeypatch) -> None:
+    import dataset  # pylint: disable=import-outside-toplevel
+
+    opened, runs = [], []
+
+    def open_store(threshold=None):
+        opened.append(SimpleNamespace(dirpath='store', threshold=threshold))
+        return opened[-1]
+
+    def import_stage(stage):
+        if stage == nbridges.STAGE_CONVEX:
+            return SimpleNamespace(run=lambda store: runs.append((stage, None, store)))
+
+        return SimpleNamespace(
+            get_command_line_arguments=lambda argv: argv,
+            run=lambda cli_args, store: runs.append((stage, cli_args, store))
+        )
+
+    monkeypatch.setattr(dataset.BridgeDataset, 'open', open_store)
+    monkeypatch.setattr(nbridges, 'import_stage', import_stage)
+    nbridges.run_all('5.0:109.5')
+
+    # The store is opened once and shared by every stage, each run with its default arguments
+    assert len(opened) == 1
+    assert opened[0].threshold == (5.0, 109.5)
+    assert [stage for stage, _, _ in runs] == list(nbridges.ANALYSIS_STAGES)
+    assert all(store is opened[0] for _, _, store in runs)
+    assert [cli_args for _, cli_args, _ in runs] == [[], None, [], []]
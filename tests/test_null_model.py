@@ -0,0 +1,69 @@
+"""
+Unit testing the null model of 3-bridge permutation counts
+"""
+
+from os import listdir
+from pytest import approx, raises
+from numpy import array
+from numpy.random import default_rng
+from data.null_model import (
+    get_aromatic_frequencies, get_group_probabilities, simulate_null, bootstrap_counts, get_percentiles, get_means,
+    compute_statistics
+)
+
+GROUPS = ['PHEPHEPHE', 'PHEPHETYR', 'PHETYRTYR', 'TYRTYRTYR']
+CODE_COUNTS = array([
+    [2, 1, 0, 0],
+    [0, 1, 1, 0],
+    [1, 0, 0, 1],
+    [0, 3, 0, 0]
+])
+
+
+def test_group_probabilities() -> None:
+    frequencies = get_aromatic_frequencies(CODE_COUNTS.sum(axis=0), GROUPS)
+    assert frequencies == approx(array([20, 10, 0]) / 30)
+
+    probabilities = get_group_probabilities(array([0.5, 0.5, 0.0]), GROUPS)
+    assert probabilities == approx(array([1, 3, 3, 1]) / 8)
+
+def test_simulate_null() -> None:
+    probabilities = array([1, 3, 3, 1]) / 8
+    histograms = simulate_null(100, probabilities, 20000, default_rng(0))
+
+    assert histograms.sum(axis=1).tolist() == [20000] * 4
+    assert get_means(histograms) == approx(100 * probabilities, rel=0.01)
+    assert (get_percentiles(histograms, 0.025) < 100 * probabilities).all()
+    assert (get_percentiles(histograms, 0.975) > 100 * probabilities).all()
+
+def test_bootstrap_counts() -> None:
+    histograms = bootstrap_counts(CODE_COUNTS, 5000, default_rng(0))
+
+    assert histograms.sum(axis=1).tolist() == [5000] * 4
+    assert get_means(histograms) == approx(CODE_COUNTS.sum(axis=0), rel=0.05)
+    assert histograms.shape[1] <= CODE_COUNTS.max() * len(CODE_COUNTS) + 1
+
+def test_compute_statistics_cached(tmp_path) -> None:
+    statistics = compute_statistics(CODE_COUNTS, GROUPS, 1000, 1000, cache_dir=str(tmp_path))
+    assert statistics['PHEPHETYR']['observed'] == 5
+    assert statistics['PHEPHETYR']['observed_lower'] <= 5 <= statistics['PHEPHETYR']['observed_upper']
+    assert len(listdir(str(tmp_path))) == 1
+
+    assert compute_statistics(CODE_COUNTS, GROUPS, 1000, 1000, cache_dir=str(tmp_path)) == statistics
+    compute_statistics(CODE_COUNTS, GROUPS, 1000, 1000, seed=1, cache_dir=str(tmp_path))
+    assert len(listdir(str(tmp_path))) == 2
+
+    with raises(ValueError):
+        compute_statistics(CODE_COUNTS, GROUPS, 0, 1000, cache_dir=None)
+
+def test_expected_matches_simulated_mean() -> None:
+    # Only some permutations are counted, so the multinomial probabilities do not sum to 1
+    groups = ['PHEPHETRP', 'PHETYRTYR', 'TRPTRPTYR']
+    code_counts = array([[3, 1, 0], [0, 2, 1], [1, 0, 4]])
+
+    statistics = compute_statistics(code_counts, groups, 200000, 10, cache_dir=None)
+
+    assert sum(stats['expected'] for stats in statistics.values()) == approx(code_counts.sum())
+    for stats in statistics.values():
+        assert stats['expected'] == approx(stats['null_mean'], rel=0.01)
+        assert stats['null_lower'] <= stats['expected'] <= stats['null_upper']
@@ -0,0 +1,113 @@
+"""
+Unit testing the vectorized Met-aromatic pair search
+"""
+
+from math import cos, pi, sin
+from numpy import arccos, array, degrees, dot, zeros
+from numpy.linalg import norm
+from numpy.random import default_rng
+from pytest import approx
+from data.pair_kernel import get_pairs, get_lone_pairs, MET_ATOMS, RING_ATOMS
+from data.pdb_parser import ATOM_DTYPE
+
+
+def get_atoms(residues: list) -> array:
+    """ Build parsed records from (residue, position, insertion, chain, {atom name: xyz}) tuples """
+
+    rows = []
+    for residue, position, insertion, chain, coordinates in residues:
+        for name, xyz in coordinates.items():
+            rows.append((b'1', name, b'', residue, chain, position, insertion, xyz, 1.0, 20.0, b'C'))
+
+    return array(rows, dtype=ATOM_DTYPE)
+
+
+def get_ring(residue: bytes, center: array) -> dict:
+    return {
+        name: center + 1.4 * array([cos(pi * i / 3), sin(pi * i / 3), 0.0])
+        for i, name in enumerate(RING_ATOMS[residue])
+    }
+
+
+def get_methionine(sd: array) -> dict:
+    return dict(zip(MET_ATOMS, [sd + array([-0.6, 1.7, 0.0]), sd, sd + array([1.8, 0.0, 0.0])]))
+
+
+def test_get_lone_pairs() -> None:
+    cg, sd, ce = array([[-0.6, 1.7, 0.0]]), zeros((1, 3)), array([[1.8, 0.0, 0.0]])
+    lone_pair_a, lone_pair_g = get_lone_pairs(cg, sd, ce)
+
+    cosine = dot(lone_pair_a[0], lone_pair_g[0]) / (norm(lone_pair_a[0]) * norm(lone_pair_g[0]))
+    assert degrees(arccos(cosine)) == approx(109.47, abs=0.01)
+
+    # Both lone pairs point away from CG and CE, either side of the CG-SD-CE plane
+    assert lone_pair_a[0][2] == approx(-lone_pair_g[0][2])
+    assert dot(lone_pair_a[0], cg[0]) < 0 and dot(lone_pair_a[0], ce[0]) < 0
+
+
+def test_get_pairs() -> None:
+    atoms = get_atoms([
+        (b'MET', 40, b'', b'A', get_methionine(zeros(3))),
+        (b'TYR', 68, b'A', b'A', get_ring(b'TYR', array([0.0, -1.0, -4.5]))),
+        (b'TRP', 70, b'', b'A', get_ring(b'TRP', array([30.0, 0.0, 0.0]))),  # Too far
+        (b'PHE', 71, b'', b'B', get_ring(b'PHE', array([0.0, -1.0, 4.5])))  # Another chain
+    ])
+
+    pairs = get_pairs(atoms, 6.0, 360.0)
+    assert len(pairs) == 6
+
+    for pair in pairs:
+        assert (pair['aromatic_residue'], pair['aromatic_position'], pair['methionine_position']) == ('TYR', '68A', '40')
+        assert pair['chain'] == 'A'
+        assert 3.0 < pair['norm'] < 6.0
+
+    assert min(pair['met_theta_angle'] for pair in pairs) < min(pair['met_phi_angle'] for pair in pairs)
+    assert not get_pairs(atoms, 6.0, 10.0)
+
+
+def test_get_pairs_chains() -> None:
+    residues = []
+    for chain in (b'B', b'A'):
+        residues.append((b'MET', 40, b'', chain, get_methionine(zeros(3))))
+        residues.append((b'TYR', 68, b'', chain, get_ring(b'TYR', array([0.0, -1.0, -4.5]))))
+
+    # Each chain is searched from the same parse and its pairs are tagged with the chain
+    pairs = get_pairs(get_atoms(residues), 6.0, 360.0)
+    assert [pair['chain'] for pair in pairs] == ['B'] * 6 + ['A'] * 6
+
+def test_get_pairs_brute_force() -> None:
+    rng = default_rng(0)
+    residues = [(b'MET', position, b'', b'A', get_methionine(rng.uniform(0, 30, 3))) for position in range(20)]
+
+    for position in range(20, 80):
+        residue = (b'PHE', b'TYR', b'TRP')[position % 3]
+        residues.append((residue, position, b'', b'A', get_ring(residue, rng.uniform(0, 30, 3))))
+
+    atoms = get_atoms(residues)
+    expected = []
+
+    for _, met_position, _, _, met in residues[:20]:
+        lone_pairs = get_lone_pairs(*[met[name][None, :] for name in MET_ATOMS])
+
+        for residue, position, _, _, ring in residues[20:]:
+            ring = [ring[name] for name in RING_ATOMS[residue]]
+
+            for k in range(6):
+                vector = 0.5 * (ring[k] + ring[(k + 1) % 6]) - met[b'SD']
+                angles = [
+                    degrees(arccos(dot(vector, lone_pair[0]) / (norm(vector) * norm(lone_pair[0])))) for lone_pair in lone_pairs
+                ]
+
+                if norm(vector) <= 6.0 and min(angles) <= 60.0:
+                    expected.append((str(met_position), residue.decode(), str(position), norm(vector), *angles))
+
+    pairs = get_pairs(atoms, 6.0, 60.0)
+    pairs = sorted(
+        (pair['methionine_position'], pair['aromatic_residue'], pair['aromatic_position'], pair['norm'],
+         pair['met_theta_angle'], pair['met_phi_angle']) for pair in pairs
+    )
+    expected = sorted(expected)
+
+    assert expected
+    assert [pair[:3] for pair in pairs] == [row[:3] for row in expected]
+    assert array([pair[3:] for pair in pairs]) == approx(array([row[3:] for row in expected], dtype=float))
@@ -0,0 +1,104 @@
+"""
+Unit testing the local PDB and mmCIF parser
+"""
+
+import gzip
+from pytest import approx
+from data.pdb_parser import parse_structure, get_transport, find_structure
+
+# serial, atom, alt_loc, residue, chain, position, x, y, z, element
+ATOMS = [
+    (1, 'N', '', 'ALA', 'A', 1, 11.104, 6.134, -6.504, 'N'),
+    (2, 'CG', '', 'MET', 'A', 2, 1.5, -2.25, 3.125, 'C'),
+    (3, 'SD', '', 'MET', 'A', 2, 2.0, -3.0, 4.0, 'S'),
+    (4, 'CE', '', 'MET', 'A', 2, 3.75, -3.5, 4.5, 'C'),
+    (5, 'CG', 'A', 'PHE', 'A', 3, -10.5, 20.25, 30.125, 'C'),
+    (6, 'CG', 'B', 'PHE', 'A', 3, -10.0, 20.0, 30.0, 'C'),
+    (7, 'CZ', '', 'PHE', 'A', 3, -12.5, 22.25, 31.0, 'C'),
+    (8, 'CD2', '', 'TRP', 'B', 1004, 100.0, -100.0, 0.5, 'C'),
+    (9, 'CH2', '', 'TRP', 'B', 1004, 101.0, -99.0, 1.5, 'C')
+]
+
+# Whitespace separated fields of ATOM records, as MetAromatic exposes them, for MET, PHE, TYR and TRP only
+EXPECTED = {
+    'met_coordinates': [
+        ['ATOM', '2', 'CG', 'MET', 'A', '2', '1.500', '-2.250', '3.125', '1.00', '20.00', 'C'],
+        ['ATOM', '3', 'SD', 'MET', 'A', '2', '2.000', '-3.000', '4.000', '1.00', '20.00', 'S'],
+        ['ATOM', '4', 'CE', 'MET', 'A', '2', '3.750', '-3.500', '4.500', '1.00', '20.00', 'C']
+    ],
+    'phe_coordinates': [
+        ['ATOM', '5', 'CG', 'PHE', 'A', '3', '-10.500', '20.250', '30.125', '1.00', '20.00', 'C'],
+        ['ATOM', '7', 'CZ', 'PHE', 'A', '3', '-12.500', '22.250', '31.000', '1.00', '20.00', 'C']
+    ],
+    'tyr_coordinates': [],
+    'trp_coordinates': [
+        ['ATOM', '8', 'CD2', 'TRP', 'B', '1004', '100.000', '-100.000', '0.500', '1.00', '20.00', 'C'],
+        ['ATOM', '9', 'CH2', 'TRP', 'B', '1004', '101.000', '-99.000', '1.500', '1.00', '20.00', 'C']
+    ]
+}
+
+
+def get_pdb() -> str:
+    lines = ['HEADER    TEST', 'MODEL        1']
+
+    for serial, atom, alt_loc, residue, chain, position, x, y, z, element in ATOMS:
+        lines.append('ATOM  {:>5} {:<4}{:1}{:>3} {:1}{:>4}    {:>8.3f}{:>8.3f}{:>8.3f}{:>6.2f}{:>6.2f}          {:>2}'.format(
+            serial, atom if len(atom) == 4 else ' ' + atom, alt_loc, residue, chain, position, x, y, z, 1.0, 20.0, element
+        ))
+
+    lines.append('HETATM   10  O   HOH A 101       1.000   1.000   1.000  1.00 20.00           O')
+    lines.extend(['ENDMDL', 'MODEL        2', lines[3].replace(' 1.500', '99.000'), 'ENDMDL', 'END'])
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def get_cif() -> str:
+    items = [
+        'group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_alt_id', 'label_comp_id', 'label_asym_id',
+        'label_seq_id', 'pdbx_PDB_ins_code', 'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy', 'B_iso_or_equiv',
+        'auth_seq_id', 'auth_comp_id', 'auth_asym_id', 'auth_atom_id', 'pdbx_PDB_model_num'
+    ]
+    lines = ['data_TEST', '#', 'loop_'] + ['_atom_site.{}'.format(item) for item in items]
+
+    for model in (1, 2):
+        for serial, atom, alt_loc, residue, chain, position, x, y, z, element in ATOMS:
+            lines.append('ATOM {} {} {} {} {} {} {} ? {:.3f} {:.3f} {:.3f} 1.00 20.00 {} {} {} {} {}'.format(
+                serial, element, atom, alt_loc or '.', residue, chr(ord(chain) + 2), position, x + model - 1, y, z,
+                position, residue, chain, atom, model
+            ))
+
+        lines.append("HETATM 10 O \"O 1\" . HOH C . ? 1.000 1.000 1.000 1.00 20.00 101 HOH A O {}".format(model))
+
+    lines.extend(['#', 'loop_', '_pdbx_poly_seq_scheme.asym_id', 'A'])
+    return '\n'.join(lines) + '\n'
+
+
+def test_parse_pdb(tmp_path) -> None:
+    filepath = tmp_path / '1abc.pdb'
+    filepath.write_text(get_pdb())
+
+    atoms = parse_structure(str(filepath))
+    assert atoms['residue'].tolist() == [b'MET'] * 3 + [b'PHE'] * 2 + [b'TRP'] * 2
+    assert atoms['xyz'][0] == approx([1.5, -2.25, 3.125])
+    assert get_transport(atoms) == EXPECTED
+
+    assert len(parse_structure(str(filepath), chain='B')) == 2
+
+def test_parse_cif_matches_pdb(tmp_path) -> None:
+    filepath = tmp_path / '1abc.cif.gz'
+
+    with gzip.open(str(filepath), 'wt') as f:
+        f.write(get_cif())
+
+    assert get_transport(parse_structure(str(filepath))) == EXPECTED
+    assert parse_structure(str(filepath), chain='A')['position'].tolist() == [2, 2, 2, 3, 3]
+
+def test_find_structure(tmp_path) -> None:
+    (tmp_path / 'mf').mkdir()
+    filepath = tmp_path / 'mf' / 'pdb1mfa.ent.gz'
+
+    with gzip.open(str(filepath), 'wt') as f:
+        f.write(get_pdb())
+
+    assert find_structure(str(tmp_path), '1MFA') == str(filepath)
+    assert find_structure(str(tmp_path), '2XYZ') is None
+    assert get_transport(parse_structure(str(filepath))) == EXPECTED
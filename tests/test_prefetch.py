@@ -0,0 +1,108 @@
+"""
+Unit testing prefetching structure files against a local stand-in HTTP server
+"""
+
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+from os import listdir, path
+from time import sleep
+from pytest import fixture
+from data.prefetch import Prefetcher
+
+CODES = ['1ABC', '2DEF', '3GHI', '4JKL', '5MNO', '6PQR', '7STU', '8VWX']
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive between requests
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@fixture
+def server(tmp_path):
+    fixtures_dir = tmp_path / 'fixtures'
+    fixtures_dir.mkdir()
+
+    for code in CODES[:-1]:  # The last code is missing on the server
+        (fixtures_dir / '{}.cif'.format(code.lower())).write_bytes(code.encode() * 1000)
+
+    connections = []
+
+    class CountingServer(ThreadingHTTPServer):
+
+        def process_request(self, request, client_address):
+            connections.append(client_address)
+            super().process_request(request, client_address)
+
+    httpd = CountingServer(('127.0.0.1', 0), partial(FixtureHandler, directory=str(fixtures_dir)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    yield 'http://127.0.0.1:{}/{{code}}.cif'.format(httpd.server_address[1]), connections
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_prefetcher(tmp_path, server) -> None:
+    url, connections = server
+    mirror_dir = str(tmp_path / 'mirror')
+    prefetcher = Prefetcher(CODES, mirror_dir, url, concurrency=2, max_ahead=2, retries=0)
+
+    results = list(prefetcher)
+    assert [code for code, _, _ in results] == CODES
+
+    for code, filepath, error in results[:-1]:
+        assert error is None
+        with open(filepath, 'rb') as f:
+            assert f.read() == code.encode() * 1000
+
+    assert results[-1][1] is None
+    assert results[-1][2] == 'HTTP 404'
+
+    # Each worker reuses its connection and no partial downloads are left behind
+    assert len(connections) <= 2
+    assert sorted(listdir(mirror_dir)) == sorted('{}.cif'.format(code.lower()) for code in CODES[:-1])
+
+    # Files already in the mirror are not downloaded again
+    prefetcher = Prefetcher(CODES[:-1], mirror_dir, url, concurrency=2)
+    assert [filepath for _, filepath, _ in prefetcher] == [filepath for _, filepath, _ in results[:-1]]
+    assert prefetcher.num_downloads == 0
+
+
+def test_prefetcher_backpressure(tmp_path, server) -> None:
+    url, _ = server
+    mirror_dir = str(tmp_path / 'mirror')
+    prefetcher = Prefetcher(CODES, mirror_dir, url, concurrency=2, max_ahead=3)
+
+    iterator = iter(prefetcher)
+    assert next(iterator)[0] == CODES[0]
+
+    # Downloads stall until the consumer takes more results
+    sleep(0.5)
+    assert prefetcher.num_downloads <= 3 + 1
+    assert len(listdir(mirror_dir)) <= 3 + 1
+
+    assert [code for code, _, _ in iterator] == CODES[1:]
+    assert not any(filename.endswith('.part') for filename in listdir(mirror_dir))
+    assert path.exists(path.join(mirror_dir, '1abc.cif'))
+
+def test_prefetcher_manual_release(tmp_path, server) -> None:
+    url, _ = server
+    mirror_dir = str(tmp_path / 'mirror')
+    prefetcher = Prefetcher(CODES, mirror_dir, url, concurrency=2, max_ahead=3, manual_release=True)
+
+    # Taking codes does not move the window, as when a pool reads ahead of the results
+    iterator = iter(prefetcher)
+    assert [next(iterator)[0] for _ in range(3)] == CODES[:3]
+
+    sleep(0.5)
+    assert prefetcher.num_downloads == 3
+
+    for _ in CODES:
+        prefetcher.release()
+
+    assert [code for code, _, _ in iterator] == CODES[3:]
+    assert prefetcher.num_downloads == len(CODES) - 1
@@ -0,0 +1,63 @@
+"""
+Unit testing the streaming reader of exported transformations
+"""
+
+from json import dump, dumps
+from pytest import approx, raises
+from numpy import array
+from data.reader import iter_documents, iter_batches, iter_coordinate_batches
+from tests.test_columnar import DOCUMENTS, INSERTION_DOCUMENT
+
+
+def write_json_array(tmp_path) -> str:
+    filepath = str(tmp_path / 'transformations.json')
+
+    with open(filepath, 'w') as f:
+        dump(DOCUMENTS, f, indent=4)
+
+    return filepath
+
+def write_ndjson(tmp_path) -> str:
+    filepath = str(tmp_path / 'transformations.ndjson')
+
+    with open(filepath, 'w') as f:
+        f.write('\n'.join(dumps(document) for document in DOCUMENTS) + '\n\n')
+
+    return filepath
+
+
+def test_iter_documents_json_array(tmp_path) -> None:
+    filepath = write_json_array(tmp_path)
+    assert list(iter_documents(filepath)) == DOCUMENTS
+    assert list(iter_documents(filepath, read_size=7)) == DOCUMENTS  # Documents straddle reads
+
+def test_iter_documents_ndjson(tmp_path) -> None:
+    assert list(iter_documents(write_ndjson(tmp_path))) == DOCUMENTS
+
+def test_iter_documents_truncated(tmp_path) -> None:
+    filepath = str(tmp_path / 'truncated.json')
+
+    with open(filepath, 'w') as f:
+        f.write(dumps(DOCUMENTS)[:-20])
+
+    with raises(ValueError):
+        list(iter_documents(filepath, read_size=16))
+
+def test_iter_batches(tmp_path) -> None:
+    batches = list(iter_batches(write_ndjson(tmp_path), batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+
+def test_iter_coordinate_batches(tmp_path) -> None:
+    batches = list(iter_coordinate_batches(write_json_array(tmp_path), 'TYR', batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert batches[1] == approx(array([DOCUMENTS[2]['TYR9']]))
+
+def test_iter_coordinate_batches_insertion_codes(tmp_path) -> None:
+    filepath = str(tmp_path / 'transformations.ndjson')
+
+    with open(filepath, 'w') as f:
+        f.write(dumps(dict(INSERTION_DOCUMENT, _id='1IGT_MET100A')) + '\n')
+
+    # Residues with insertion codes or negative positions are read like any other
+    assert list(iter_coordinate_batches(filepath, 'TYR'))[0] == approx(array([INSERTION_DOCUMENT['TYR27'], INSERTION_DOCUMENT['TYR27A']]))
+    assert list(iter_coordinate_batches(filepath, 'PHE'))[0] == approx(array([INSERTION_DOCUMENT['PHE-1B']]))
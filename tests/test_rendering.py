@@ -0,0 +1,50 @@
+"""
+Unit testing that hull and distribution plots are rendered without leaking figures
+"""
+
+from os import path
+from matplotlib import pyplot
+from convex_hulls_groupby import get_convex_hulls_groupby as groupby
+from distributions import get_3_bridge_distribution as distribution
+from data.hulls import get_hull
+from tests.test_hulls import CUBE
+from tests.test_dataset import dataset  # pylint: disable=unused-import
+
+
+def test_render_releases_figures(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(groupby, 'ROOT', str(tmp_path))
+    hull = get_hull([CUBE])
+
+    filepaths = [
+        groupby.RenderConvexHulls('PHETYRTYR', hull, view).executor_main()
+        for view in (groupby.DEFAULT_VIEW, (10.0, 45.0))
+    ]
+
+    assert [path.basename(filepath) for filepath in filepaths] == [
+        'phetyrtyr_bridges_3d.png', 'phetyrtyr_bridges_3d_10_45.png'
+    ]
+    assert all(path.exists(filepath) for filepath in filepaths)
+    assert not pyplot.get_fignums()
+
+def test_parse_view() -> None:
+    assert groupby.parse_view('30:-60') == groupby.DEFAULT_VIEW
+
+def test_distribution_releases_figure(tmp_path, monkeypatch, dataset) -> None:
+    monkeypatch.setattr(distribution, 'ROOT', str(tmp_path))
+    distribution.run(distribution.get_command_line_arguments(['--null-replicates', '10', '--bootstrap-replicates', '10']), dataset)
+
+    assert path.exists(str(tmp_path / 'plots' / distribution.OUTPUT_FILENAME))
+    assert not pyplot.get_fignums()
+
+def test_workers_open_store(tmp_path, monkeypatch, dataset) -> None:
+    monkeypatch.setattr(groupby, 'ROOT', str(tmp_path))
+    monkeypatch.setattr(groupby, 'WORKER_STATE', {})
+    cache_dir = str(tmp_path / 'hull_cache')
+    tasks = [('PHETYRTYR', groupby.DEFAULT_VIEW)]
+
+    # Workers open the store they are given rather than the default one
+    filepaths = list(groupby.run_workers(groupby.render_task, tasks, 1, groupby.init_worker, (dataset.dirpath, None, cache_dir)))
+
+    assert groupby.WORKER_STATE['dataset'].dirpath == dataset.dirpath
+    assert groupby.WORKER_STATE['cache'].cache_dir == cache_dir
+    assert [path.basename(filepath) for filepath in filepaths] == ['phetyrtyr_bridges_3d.png']
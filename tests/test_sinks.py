@@ -0,0 +1,291 @@
+"""
+Unit testing the output sinks used by the mining script
+"""
+
+from json import dumps, loads
+from pytest import approx, raises
+from numpy import array
+from data.sinks import Sink, MongoSink, NDJSONSink, ColumnarSink, DensitySink, MONGO_DUPLICATE_KEY_ERROR
+from data.columnar import load_columns
+from data.density import DensityGrids, KIND_RESIDUES
+
+DOCUMENTS = [
+    {
+        'MET95': [[0.0, 0.0, 0.0], [1.79, 0.0, 0.0], [2.05, 1.83, 0.0]],
+        'TYR68': [4.32, 4.58, -1.75],
+        'PHE99': [1.35, 4.29, 3.49],
+        'TYR90': [5.78, 0.66, 2.59],
+        'code': '8I1B',
+        '_id': '8I1B_MET95'
+    },
+    {
+        'MET326': [[0.0, 0.0, 0.0], [1.80, 0.0, 0.0], [2.16, 1.80, 0.0]],
+        'TRP226': [-2.49, -4.23, 1.11],
+        'PHE12': [3.01, 2.02, -0.5],
+        'code': '7MDH',
+        '_id': '7MDH_MET326'
+    }
+]
+
+
+class BulkWriteError(Exception):
+
+    def __init__(self, details: dict) -> None:
+        super().__init__('Bulk write error')
+        self.details = details
+
+
+class LocalCollection:
+    """
+    Stand-in for a pymongo collection which enforces unique _id values
+    """
+
+    def __init__(self) -> None:
+        self.documents = {}
+        self.num_round_trips = 0
+
+    def insert_many(self, documents: list, ordered: bool = True) -> None:
+        self.num_round_trips += 1
+        write_errors = []
+
+        for index, document in enumerate(documents):
+            if document['_id'] in self.documents:
+                write_errors.append({'index': index, 'code': MONGO_DUPLICATE_KEY_ERROR})
+                continue
+
+            self.documents[document['_id']] = document
+
+        if write_errors:
+            raise BulkWriteError({'writeErrors': write_errors})
+
+
+def test_sink_is_abstract() -> None:
+
+    class PartialSink(Sink):
+        pass
+
+    class ListSink(Sink):
+        def write_batch(self, documents: list) -> None:
+            self.batches.append(list(documents))
+
+    with raises(TypeError):
+        PartialSink()  # pylint: disable=abstract-class-instantiated
+
+    # Only write_batch is left to sinks, buffering and flushing are shared
+    sink = ListSink()
+    sink.batches = []
+
+    with sink:
+        sink.write(DOCUMENTS[0])
+
+    assert sink.batches == [DOCUMENTS[:1]]
+    assert sink.committed_codes == {'8I1B'}
+
+def test_mongo_sink_batches_writes() -> None:
+    collection = LocalCollection()
+
+    with MongoSink(collection, batch_size=2) as sink:
+        for document in DOCUMENTS:
+            sink.write(document)
+
+        assert sink.needs_flush()
+
+    assert collection.num_round_trips == 1
+    assert set(collection.documents) == {'8I1B_MET95', '7MDH_MET326'}
+
+def test_mongo_sink_replay_is_idempotent() -> None:
+    collection = LocalCollection()
+
+    for _ in range(2):
+        with MongoSink(collection) as sink:
+            for document in DOCUMENTS:
+                sink.write(document)
+
+    assert len(collection.documents) == 2
+
+def test_mongo_sink_raises_other_errors() -> None:
+
+    class BrokenCollection:
+        def insert_many(self, documents: list, ordered: bool = True) -> None:
+            raise BulkWriteError({'writeErrors': [{'index': 0, 'code': 121}]})
+
+    with raises(BulkWriteError):
+        with MongoSink(BrokenCollection()) as sink:
+            sink.write(DOCUMENTS[0])
+
+def test_ndjson_sink(tmp_path) -> None:
+    filepath = tmp_path / 'transformations.ndjson'
+
+    with NDJSONSink(str(filepath)) as sink:
+        for document in DOCUMENTS:
+            sink.write(document)
+
+    assert [loads(line) for line in filepath.read_text().splitlines()] == DOCUMENTS
+
+def test_columnar_sink(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with ColumnarSink(dirpath, batch_size=1) as sink:
+        for document in DOCUMENTS:
+            sink.write(document)
+
+            if sink.needs_flush():
+                sink.flush()
+
+    columns = load_columns(dirpath)
+
+    assert columns['bridge_code'].tolist() == [b'8I1B', b'7MDH']
+    assert columns['bridge_met_position'].tolist() == [95, 326]
+    assert columns['bridge_base'][1] == approx(array(DOCUMENTS[1]['MET326']))
+    assert columns['satellite_bridge'].tolist() == [0, 0, 0, 1, 1]
+    assert columns['satellite_residue'].tolist() == [b'TYR', b'PHE', b'TYR', b'TRP', b'PHE']
+    assert columns['satellite_position'].tolist() == [68, 99, 90, 226, 12]
+    assert columns['satellite_xyz'][3] == approx(DOCUMENTS[1]['TRP226'])
+
+def test_columnar_sink_drops_uncommitted_rows(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with ColumnarSink(dirpath) as sink:
+        sink.write(DOCUMENTS[0])
+
+    with open(str(tmp_path / 'transformations.columns' / 'satellite_xyz.bin'), 'ab') as f:
+        f.write(b'partial batch from a killed run')
+
+    with ColumnarSink(dirpath) as sink:
+        sink.write(DOCUMENTS[1])
+
+    columns = load_columns(dirpath)
+    assert columns['satellite_bridge'].tolist() == [0, 0, 0, 1, 1]
+    assert columns['satellite_xyz'][4] == approx(DOCUMENTS[1]['PHE12'])
+
+def test_columnar_sink_sweep_thresholds(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with ColumnarSink(dirpath) as sink:
+        sink.write(DOCUMENTS[0])
+        sink.write(dict(DOCUMENTS[0], cutoff_distance=4.5, cutoff_angle=109.5, _id='8I1B_MET95_4.5_109.5'))
+
+    columns = load_columns(dirpath)
+    assert columns['bridge_cutoff_distance'][1] == approx(4.5)
+    assert columns['bridge_cutoff_angle'][1] == approx(109.5)
+    assert columns['satellite_bridge'].tolist() == [0, 0, 0, 1, 1, 1]
+
+def test_columnar_sink_bridge_order(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with ColumnarSink(dirpath) as sink:
+        sink.write(DOCUMENTS[0])
+        sink.write(dict(DOCUMENTS[1], order=3, topology='inverse'))
+
+    columns = load_columns(dirpath)
+    assert columns['bridge_order'].tolist() == [3, 3]
+    assert columns['bridge_inverse'].tolist() == [False, True]
+
+def test_density_sink_resumes(tmp_path) -> None:
+    filepath = str(tmp_path / 'density.npz')
+
+    with DensitySink(filepath, batch_size=1) as sink:
+        sink.write(DOCUMENTS[0])
+
+    with DensitySink(filepath, batch_size=1) as sink:
+        sink.write(DOCUMENTS[1])
+
+    grids = DensityGrids.load(filepath)
+    assert grids.grids[KIND_RESIDUES]['PHE'].num_points == 2
+    assert grids.grids[KIND_RESIDUES]['TYR'].num_points == 2
+
+def test_columnar_sink_chain(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with ColumnarSink(dirpath) as sink:
+        sink.write(DOCUMENTS[0])
+        sink.write(dict(DOCUMENTS[0], chain='B', _id='8I1B_B_MET95'))
+
+    columns = load_columns(dirpath)
+    assert columns['bridge_chain'].tolist() == [b'', b'B']
+    assert columns['satellite_bridge'].tolist() == [0, 0, 0, 1, 1, 1]
+
+def test_ndjson_sink_replay_is_idempotent(tmp_path) -> None:
+    filepath = tmp_path / 'transformations.ndjson'
+
+    with NDJSONSink(str(filepath)) as sink:
+        sink.write(DOCUMENTS[0])
+
+    # A killed run leaves an uncommitted partial batch behind
+    with open(str(filepath), 'a') as f:
+        f.write('{"MET326": [[0.0, 0.0')
+
+    for _ in range(2):
+        with NDJSONSink(str(filepath)) as sink:
+            for document in DOCUMENTS:
+                sink.write(document)
+
+    assert [loads(line) for line in filepath.read_text().splitlines()] == DOCUMENTS
+
+def test_ndjson_sink_reads_codes_without_commit(tmp_path) -> None:
+    filepath = tmp_path / 'transformations.ndjson'
+    filepath.write_text(''.join(dumps(document) + '\n' for document in DOCUMENTS) + '{"MET5"')
+
+    with NDJSONSink(str(filepath)) as sink:
+        assert sink.committed_codes == {'8I1B', '7MDH'}
+
+    assert [loads(line) for line in filepath.read_text().splitlines()] == DOCUMENTS
+
+def test_columnar_sink_replay_is_idempotent(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    for _ in range(2):
+        with ColumnarSink(dirpath) as sink:
+            for document in DOCUMENTS:
+                sink.write(document)
+
+    assert load_columns(dirpath)['bridge_code'].tolist() == [b'8I1B', b'7MDH']
+
+def test_density_sink_replay_is_idempotent(tmp_path) -> None:
+    filepath = str(tmp_path / 'density.npz')
+
+    for _ in range(2):
+        with DensitySink(filepath) as sink:
+            for document in DOCUMENTS:
+                sink.write(document)
+
+    grids = DensityGrids.load(filepath)
+    assert grids.codes == {'8I1B', '7MDH'}
+    assert grids.grids[KIND_RESIDUES]['PHE'].num_points == 2
+
+def test_columnar_sink_insertion_codes(tmp_path) -> None:
+    dirpath = str(tmp_path / 'transformations.columns')
+    document = {'MET100A': DOCUMENTS[0]['MET95'], 'TYR27A': [2.0, 4.0, 1.0], 'TYR27': [-3.0, 2.0, 0.5], 'code': '1IGT', '_id': '1IGT_MET100A'}
+
+    with ColumnarSink(dirpath) as sink:
+        sink.write(document)
+
+    columns = load_columns(dirpath)
+    assert columns['bridge_met_position'].tolist() == [100]
+    assert columns['bridge_met_insertion'].tolist() == [b'A']
+    assert columns['satellite_position'].tolist() == [27, 27]
+    assert columns['satellite_insertion'].tolist() == [b'A', b'']
+
+def test_ndjson_sink_appends_commits(tmp_path) -> None:
+    filepath = tmp_path / 'transformations.ndjson'
+    commit_filepath = tmp_path / 'transformations.ndjson.commit.ndjson'
+
+    with NDJSONSink(str(filepath), batch_size=1) as sink:
+        for document in DOCUMENTS:
+            sink.write(document)
+            sink.flush()
+
+    # Each batch only commits its own codes
+    commits = [loads(line) for line in commit_filepath.read_text().splitlines()]
+    assert [commit['codes'] for commit in commits] == [['8I1B'], ['7MDH']]
+    assert commits[-1]['offset'] == len(filepath.read_bytes())
+
+    # A run killed mid-commit leaves a truncated commit, so its batch is dropped
+    with open(str(commit_filepath), 'w') as f:
+        f.write(dumps(commits[0]) + '\n' + dumps(commits[1])[:-5])
+
+    with NDJSONSink(str(filepath)) as sink:
+        assert sink.committed_codes == {'8I1B'}
+
+    assert [loads(line) for line in filepath.read_text().splitlines()] == DOCUMENTS[:1]
+    assert [loads(line) for line in commit_filepath.read_text().splitlines()] == commits[:1]
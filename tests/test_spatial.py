@@ -0,0 +1,52 @@
+"""
+Unit testing the spatial index over mapped aromatic centroids
+"""
+
+from os import path
+from json import dump
+from pytest import approx, fixture
+from data.columnar import convert_json
+from data.dataset import BridgeDataset
+from data.spatial import SpatialIndex, SPATIAL_INDEX_FILENAME
+from tests.test_columnar import DOCUMENTS
+
+
+@fixture
+def dataset(tmp_path) -> BridgeDataset:
+    json_filepath = str(tmp_path / 'transformations.json')
+    dirpath = str(tmp_path / 'transformations.columns')
+
+    with open(json_filepath, 'w') as f:
+        dump(DOCUMENTS, f)
+
+    convert_json(json_filepath, dirpath)
+    return BridgeDataset(dirpath)
+
+
+def test_query_radius(dataset) -> None:
+    index = SpatialIndex(dataset)
+    hits = index.query_radius([2.5, 4.2, 1.0], 1.0)
+
+    assert [(hit['code'], hit['met_position'], hit['residue'], hit['position']) for hit in hits] == [('7AHL', 5, 'TYR', 7)]
+    assert hits[0]['distance'] == approx(0.1145, abs=1e-4)
+    assert index.query_radius([2.5, 4.2, 1.0], 1.0, residue='PHE') == []
+
+def test_query_nearest(dataset) -> None:
+    hits = SpatialIndex(dataset).query_nearest([0.0, 0.0, 0.0], 2, residue='PHE')
+    assert [hit['position'] for hit in hits] == [13, 12]
+    assert hits[0]['distance'] < hits[1]['distance']
+
+def test_query_box(dataset) -> None:
+    index = SpatialIndex(dataset)
+    hits = index.query_box([float('-inf'), float('-inf'), 0.0], [float('inf')] * 3, residue='PHE')  # Above the plane
+
+    assert sorted(hit['code'] for hit in hits) == ['7AHL', '8I1B']
+    assert index.query_box([10.0] * 3, [11.0] * 3) == []
+
+def test_index_persists(dataset) -> None:
+    SpatialIndex(dataset)
+    assert path.exists(path.join(dataset.dirpath, SPATIAL_INDEX_FILENAME))
+
+    index = SpatialIndex(dataset)
+    assert index.load()
+    assert sorted(index.trees) == ['ALL', 'PHE', 'TRP', 'TYR']
@@ -0,0 +1,66 @@
+"""
+Unit testing the on-disk parsed structure cache
+"""
+
+from os import path
+from data.structure_cache import StructureCache, BACKEND_MET_AROMATIC, BACKEND_PAIR_KERNEL
+
+TRANSPORT = {
+    'met_coordinates': [
+        ['ATOM', '741', 'CG', 'MET', 'A', '95', '10.881', '8.532', '20.041', '1.00', '12.53', 'C'],
+        ['ATOM', '742', 'SD', 'MET', 'A', '95', '11.622', '9.870', '19.097', '1.00', '13.21', 'S']
+    ],
+    'phe_coordinates': [
+        ['ATOM', '801', 'CG', 'PHE', 'A', '99', '14.321', '7.182', '17.710', '1.00', '11.10']
+    ],
+    'tyr_coordinates': [],
+    'trp_coordinates': []
+}
+RESULTS = [
+    {'aromatic_residue': 'PHE', 'aromatic_position': 99, 'methionine_position': 95, 'norm': 4.21,
+     'met_theta_angle': 58.3, 'met_phi_angle': 112.9},
+    {'aromatic_residue': 'PHE', 'aromatic_position': 99, 'methionine_position': 95, 'norm': 5.47,
+     'met_theta_angle': 97.6, 'met_phi_angle': 144.0}
+]
+
+
+def test_roundtrip(tmp_path) -> None:
+    cache = StructureCache(str(tmp_path))
+    cache.put('8I1B', 'A', 'cp', 6.0, 360.0, 0, RESULTS, TRANSPORT)
+
+    entry = cache.get('8I1B', 'A', 'cp', 6.0, 360.0)
+    assert entry['exit_code'] == 0
+    assert entry['results'] == RESULTS
+    assert entry['transport'] == TRANSPORT
+
+def test_tighter_cutoffs_filter_results(tmp_path) -> None:
+    cache = StructureCache(str(tmp_path))
+    cache.put('8I1B', 'A', 'cp', 6.0, 360.0, 0, RESULTS, TRANSPORT)
+
+    assert cache.get('8I1B', 'A', 'cp', 5.0, 360.0)['results'] == RESULTS[:1]
+    assert cache.get('8I1B', 'A', 'cp', 6.0, 60.0)['results'] == RESULTS[:1]
+    assert cache.get('8I1B', 'A', 'cp', 6.0, 90.0)['transport'] == TRANSPORT
+
+def test_miss_on_looser_cutoffs_backend_or_chain(tmp_path) -> None:
+    cache = StructureCache(str(tmp_path))
+    cache.put('8I1B', 'A', 'cp', 5.0, 109.5, 0, RESULTS[:1], TRANSPORT, BACKEND_PAIR_KERNEL)
+
+    assert cache.get('8I1B', 'A', 'cp', 5.0, 109.5, BACKEND_PAIR_KERNEL)['backend'] == BACKEND_PAIR_KERNEL
+    assert cache.get('8I1B', 'A', 'cp', 6.0, 109.5) is None
+    assert cache.get('8I1B', 'A', 'cp', 5.0, 360.0) is None
+    assert cache.get('8I1B', 'A', 'cp', 5.0, 109.5, BACKEND_MET_AROMATIC) is None
+    assert cache.get('8I1B', 'B', 'cp', 5.0, 109.5) is None
+    assert cache.get('7MDH', 'A', 'cp', 5.0, 109.5) is None
+
+def test_eviction_removes_least_recently_used(tmp_path) -> None:
+    cache = StructureCache(str(tmp_path))
+    cache.put('8I1B', 'A', 'cp', 6.0, 360.0, 0, RESULTS, TRANSPORT)
+    entry_size = cache.get_size()
+
+    cache = StructureCache(str(tmp_path), max_bytes=int(2.5 * entry_size))
+    cache.put('7MDH', 'A', 'cp', 6.0, 360.0, 0, RESULTS, TRANSPORT)
+    cache.put('7AHL', 'A', 'cp', 6.0, 360.0, 0, RESULTS, TRANSPORT)
+
+    assert not path.exists(cache.get_filepath('8I1B', 'A', 'cp'))
+    assert cache.get('7MDH', 'A', 'cp', 6.0, 360.0) is not None
+    assert cache.get('7AHL', 'A', 'cp', 6.0, 360.0) is not None
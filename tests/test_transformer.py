@@ -6,10 +6,10 @@ Unit testing the transformation algorithm
 
 from copy import deepcopy
 from typing import Tuple
-from pytest import approx
-from numpy import random, array
+from pytest import approx, raises
+from numpy import random, array, stack
 from pyquaternion import Quaternion
-from data.transformer import Transformer
+from data.transformer import Transformer, BatchTransformer, CHECK_OFF, CHECK_SAMPLED
 
 
 class Triangle:
@@ -114,3 +114,58 @@ def test_translate_octant_VIII() -> None:
     triangle_intermediate = triangle.get()
     triangle_end = Transformer(*triangle_intermediate).get_base()
     assert sum(sum(triangle_start)) == approx(sum(sum(triangle_end)))
+
+def test_batch_transformer_matches_transformer() -> None:
+    frames = random.uniform(low=-10, high=10, size=(50, 3, 3))
+    satellites = random.uniform(low=-10, high=10, size=(50, 3, 3))
+
+    batch = BatchTransformer(frames)
+    bases = batch.get_bases()
+    satellites_rotated = batch.rotate_satellites(satellites)
+
+    for frame, base, satellite, satellite_rotated in zip(frames, bases, satellites, satellites_rotated):
+        transform = Transformer(*frame)
+        assert stack(transform.get_base()) == approx(base)
+        assert stack([transform.rotate_satellite(s) for s in satellite]) == approx(satellite_rotated)
+
+def test_batch_transformer_degenerate_frames() -> None:
+    frames = array([
+        [[1.00, 1.00, 1.00], [2.00, 1.00, 1.00], [1.00, 3.00, 2.00]],    # AB already colinear with x-axis
+        [[1.00, 1.00, 1.00], [-2.00, 1.00, 1.00], [1.00, 3.00, 2.00]],   # AB anti-parallel to x-axis
+        [[0.00, 0.00, 0.00], [2.00, 0.00, 0.00], [4.00, 0.00, 0.00]]     # ABC colinear
+    ])
+    satellites = random.uniform(low=-10, high=10, size=(3, 2, 3))
+
+    batch = BatchTransformer(frames)
+    bases = batch.get_bases()
+    satellites_rotated = batch.rotate_satellites(satellites)
+
+    for frame, base, satellite, satellite_rotated in zip(frames, bases, satellites, satellites_rotated):
+        transform = Transformer(*frame)
+        assert stack(transform.get_base()) == approx(base)
+        assert stack([transform.rotate_satellite(s) for s in satellite]) == approx(satellite_rotated)
+
+def test_rotate_satellites_matches_rotate_satellite() -> None:
+    frame = random.uniform(low=-10, high=10, size=(3, 3))
+    satellites = random.uniform(low=-10, high=10, size=(20, 3))
+
+    transform = Transformer(*frame)
+    satellites_rotated = transform.rotate_satellites(satellites)
+
+    for satellite, satellite_rotated in zip(satellites, satellites_rotated):
+        assert transform.rotate_satellite(satellite) == approx(satellite_rotated)
+
+def test_check_modes_agree() -> None:
+    frame = random.uniform(low=-10, high=10, size=(3, 3))
+    satellites = random.uniform(low=-10, high=10, size=(20, 3))
+
+    strict = Transformer(*frame).rotate_satellites(satellites)
+    sampled = Transformer(*frame, check=CHECK_SAMPLED).rotate_satellites(satellites)
+    off = Transformer(*frame, check=CHECK_OFF).rotate_satellites(satellites)
+
+    assert strict == approx(sampled)
+    assert strict == approx(off)
+
+def test_invalid_check_mode() -> None:
+    with raises(ValueError):
+        Transformer(*random.uniform(low=-10, high=10, size=(3, 3)), check='foo')